@@ -1,5 +1,161 @@
-from django.contrib import admin
-from .models import library, Course, Enrollment, Chapter, Lesson, LessonProgress, Certificate
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import AutoField, BigAutoField, Max
+from django.utils.functional import cached_property
+
+from . import certificates, course_pages, progress, search
+from .models import library, Avatar, Category, Course, Enrollment, Chapter, Lesson, LessonProgress, CourseProgress, Certificate, MediaJob, ActivityRollup, CourseImport
+
+# Counts past this are not worth an exact COUNT(*) on a changelist
+COUNT_LIMIT = 100000
+
+def estimated_count(model, using):
+    """Approximate row count of a model's table from database statistics, or None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    statistics = {
+        'postgresql': 'SELECT reltuples FROM pg_class WHERE relname = %s',
+        'mysql': 'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+    }
+    if connection.vendor in statistics:
+        with connection.cursor() as cursor:
+            cursor.execute(statistics[connection.vendor], [table])
+            row = cursor.fetchone()
+        # reltuples is -1 until the table has been analyzed
+        return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+    if isinstance(model._meta.pk, (AutoField, BigAutoField)):
+        # SQLite keeps no statistics; the highest id is close enough
+        return model._default_manager.using(using).aggregate(highest=Max('pk'))['highest'] or 0
+    return None
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that never runs an unbounded COUNT(*).
+
+    An unfiltered changelist of a big table shows the estimated row count;
+    a filtered one counts at most COUNT_LIMIT rows.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= COUNT_LIMIT:
+                return estimate
+        return queryset.order_by()[:COUNT_LIMIT].count()
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """Sidebar filter on a foreign key that searches as you type.
+
+    Unlike RelatedFieldListFilter it never lists every related object; the
+    choices come from the related admin's autocomplete view. Subclasses
+    set ``source_model``/``source_field`` to a foreign key whose related
+    model has a registered admin with search_fields, and ``field_path``
+    to the lookup that filters the changelist.
+    """
+    template = 'admin/autocomplete_filter.html'
+    source_model = None
+    source_field = None
+    field_path = None
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        field = self.source_model._meta.get_field(self.source_field)
+        self.form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            required=False,
+            widget=AutocompleteSelect(field, model_admin.admin_site, attrs={'onchange': 'this.form.submit()'}),
+        )
+
+    @classmethod
+    def media(cls, admin_site):
+        return AutocompleteSelect(cls.source_model._meta.get_field(cls.source_field), admin_site).media
+
+    def has_output(self):
+        return True
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            return queryset.filter(**{self.field_path: self.value()})
+        except (ValueError, ValidationError) as e:
+            raise IncorrectLookupParameters(e)
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is not None,
+            'widget': self.form_field.widget.render(self.parameter_name, self.value()),
+            'hidden': [(key, value) for key, value in changelist.params.items() if key != self.parameter_name],
+            'clear_url': changelist.get_query_string(remove=[self.parameter_name]),
+        }
+
+class CourseFilter(AutocompleteFilter):
+    title = 'course'
+    parameter_name = 'course'
+    source_model = Chapter
+    source_field = 'course'
+    field_path = 'course_id'
+
+class ChapterCourseFilter(CourseFilter):
+    field_path = 'chapter__course_id'
+
+class LessonCourseFilter(CourseFilter):
+    field_path = 'lesson__chapter__course_id'
+
+class LessonFilter(AutocompleteFilter):
+    title = 'lesson'
+    parameter_name = 'lesson'
+    source_model = LessonProgress
+    source_field = 'lesson'
+    field_path = 'lesson_id'
+
+class UserFilter(AutocompleteFilter):
+    title = 'user'
+    parameter_name = 'user'
+    source_model = LessonProgress
+    source_field = 'user'
+    field_path = 'user_id'
+
+class LargeTableAdminMixin:
+    """Changelist settings for tables too big to count or to list in a filter"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, type) and issubclass(list_filter, AutocompleteFilter):
+                media += list_filter.media(self.admin_site)
+        return media
+
+class IndexedSearchMixin:
+    """Answer changelist searches from main.search instead of icontains scans.
+
+    Falls back to the regular search_fields lookup when the index has no
+    match, e.g. for searches on related usernames. ``search_lookup`` is the
+    field that holds the id of the indexed object, for admins of rows that
+    point at a course or lesson.
+    """
+    search_kind = None
+    search_lookup = 'pk'
+    search_limit = 1000
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term:
+            hits = search.search(search_term, kind=self.search_kind, limit=self.search_limit)
+            if hits:
+                return queryset.filter(**{f'{self.search_lookup}__in': [hit.object_id for hit in hits]}), False
+        return super().get_search_results(request, queryset, search_term)
 
 class ChapterInline(admin.TabularInline):
     model = Chapter
@@ -11,39 +167,134 @@ class LessonInline(admin.TabularInline):
     extra = 1
     fields = ('title', 'youtube_url', 'order', 'duration')
 
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'course_count')
+    search_fields = ('name', 'slug')
+    readonly_fields = ('course_count',)
+
 @admin.register(Course)
-class CourseAdmin(admin.ModelAdmin):
+class CourseAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    search_kind = search.COURSE
     list_display = ('title', 'instructor', 'category', 'level', 'created_at')
-    list_filter = ('category', 'level', 'created_at')
+    list_filter = ('category_slug', 'level', 'created_at')
     search_fields = ('title', 'instructor__username')
     prepopulated_fields = {'slug': ('title',)}
     inlines = [ChapterInline]
 
 @admin.register(Chapter)
-class ChapterAdmin(admin.ModelAdmin):
+class ChapterAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'course', 'order', 'created_at')
-    list_filter = ('course', 'created_at')
+    list_filter = (CourseFilter, 'created_at')
+    list_select_related = ('course',)
     search_fields = ('title', 'course__title')
+    autocomplete_fields = ('course',)
     inlines = [LessonInline]
 
+    def get_queryset(self, request):
+        # Also used by autocomplete, which labels each chapter with its course
+        return super().get_queryset(request).select_related('course')
+
 @admin.register(Lesson)
-class LessonAdmin(admin.ModelAdmin):
+class LessonAdmin(IndexedSearchMixin, LargeTableAdminMixin, admin.ModelAdmin):
+    search_kind = search.LESSON
     list_display = ('title', 'chapter', 'order', 'duration', 'created_at')
-    list_filter = ('chapter__course', 'created_at')
+    list_filter = (ChapterCourseFilter, 'created_at')
+    list_select_related = ('chapter__course',)
+    # Newest first walks the primary key instead of sorting the table by order
+    ordering = ('-pk',)
     search_fields = ('title', 'chapter__title', 'chapter__course__title')
+    autocomplete_fields = ('chapter',)
+    actions = ['renumber_lessons']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('chapter__course')
+
+    @admin.action(description='Renumber the lessons of the selected lessons\' chapters')
+    def renumber_lessons(self, request, queryset):
+        chapter_ids = set(queryset.values_list('chapter_id', flat=True))
+        course_ids = Lesson.objects.renumber(chapter_ids)
+        for course_id in course_ids:
+            course_pages.invalidate(course_id)
+        self.message_user(request, f'Renumbered lessons in {len(chapter_ids)} chapters of {len(course_ids)} changed courses.')
 
 @admin.register(LessonProgress)
-class LessonProgressAdmin(admin.ModelAdmin):
+class LessonProgressAdmin(IndexedSearchMixin, LargeTableAdminMixin, admin.ModelAdmin):
+    # Lesson titles are found through the search index, anything else is
+    # matched exactly against the indexed username and email columns
+    search_kind = search.LESSON
+    search_lookup = 'lesson_id'
     list_display = ('user', 'lesson', 'completed', 'completed_at')
-    list_filter = ('completed', 'completed_at', 'lesson__chapter__course')
-    search_fields = ('user__username', 'lesson__title')
+    list_filter = ('completed', 'completed_at', LessonCourseFilter, LessonFilter, UserFilter)
+    list_select_related = ('user', 'lesson__chapter__course')
+    search_fields = ('=user__username', '=user__email')
+    autocomplete_fields = ('user', 'lesson')
+    actions = ['mark_completed']
+
+    def delete_model(self, request, obj):
+        progress.delete(LessonProgress.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        # LessonProgress has no delete signals, see main.signals
+        progress.delete(queryset)
+
+    @admin.action(description='Mark selected lesson progress as completed')
+    def mark_completed(self, request, queryset):
+        applied, rejected = progress.mark_completed(queryset)
+        self.message_user(request, f'Completed {applied} lessons.')
+        if rejected:
+            self.message_user(request, f'Skipped {rejected} lessons of courses the learner is not enrolled in.', messages.WARNING)
+
+@admin.register(CourseProgress)
+class CourseProgressAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'course', 'completed_lessons', 'total_lessons', 'updated_at')
+    list_filter = (CourseFilter,)
+    list_select_related = ('user', 'course')
+    search_fields = ('=user__username', 'course__title')
+    autocomplete_fields = ('user', 'course')
+    readonly_fields = ('completed_lessons', 'total_lessons', 'updated_at')
 
 @admin.register(Certificate)
-class CertificateAdmin(admin.ModelAdmin):
-    list_display = ('user', 'course', 'certificate_id', 'issued_at')
-    list_filter = ('issued_at', 'course')
-    search_fields = ('user__username', 'course__title', 'certificate_id')
-    readonly_fields = ('certificate_id', 'issued_at')
+class CertificateAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('user', 'course', 'certificate_id', 'issued_at', 'rendered_at')
+    list_filter = ('issued_at', CourseFilter)
+    list_select_related = ('user', 'course')
+    search_fields = ('=user__username', 'course__title', '=certificate_id')
+    autocomplete_fields = ('user', 'course')
+    readonly_fields = ('certificate_id', 'issued_at', 'rendered_at', 'artifact_etag')
+    actions = ['reissue']
+
+    @admin.action(description='Reissue selected certificates')
+    def reissue(self, request, queryset):
+        count = certificates.reissue(queryset)
+        self.message_user(request, f'Queued {count} certificates for rendering.')
+
+@admin.register(MediaJob)
+class MediaJobAdmin(admin.ModelAdmin):
+    list_display = ('course', 'field', 'status', 'attempts', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('course__title',)
+    readonly_fields = ('result_url', 'error', 'attempts', 'created_at', 'updated_at')
+
+@admin.register(ActivityRollup)
+class ActivityRollupAdmin(admin.ModelAdmin):
+    list_display = ('course', 'granularity', 'bucket_start', 'enrollments', 'lesson_completions', 'course_completions', 'active_learners')
+    list_filter = ('granularity',)
+    list_select_related = ('course',)
+    search_fields = ('course__title',)
+    date_hierarchy = 'bucket_start'
+
+@admin.register(Avatar)
+class AvatarAdmin(admin.ModelAdmin):
+    list_display = ('user', 'url', 'mirrored_at', 'updated_at')
+    list_select_related = ('user',)
+    search_fields = ('user__username',)
+    readonly_fields = ('url', 'mirrored_at', 'updated_at')
+
+@admin.register(CourseImport)
+class CourseImportAdmin(admin.ModelAdmin):
+    list_display = ('export_id', 'source', 'lines_done', 'started_at', 'finished_at')
+    readonly_fields = ('export_id', 'source', 'lines_done', 'started_at', 'updated_at', 'finished_at')
 
 admin.site.register(library)
 admin.site.register(Enrollment)
\ No newline at end of file
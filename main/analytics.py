@@ -0,0 +1,196 @@
+"""Hourly and daily enrollment/completion rollups per course.
+
+Writes bump the ActivityRollup counters as they happen (see main.signals),
+so dashboard charts read a handful of rollup rows no matter how large the
+raw Enrollment, LessonProgress and Certificate tables grow. The
+``compact_rollups`` command rebuilds a window from the raw tables and drops
+hourly detail, and the per-learner rows behind daily active_learners, once
+they are older than their retention periods.
+"""
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import ActivityRollup, Certificate, Enrollment, LearnerActivity, LessonProgress
+
+COUNTERS = ('enrollments', 'lesson_completions', 'course_completions', 'active_learners')
+GRANULARITIES = (ActivityRollup.HOUR, ActivityRollup.DAY)
+
+
+def bucket_start(when, granularity):
+    when = when.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if granularity == ActivityRollup.DAY:
+        when = when.replace(hour=0)
+    return when
+
+
+def _bump(course_id, granularity, start, counts):
+    rollups = ActivityRollup.objects.filter(course_id=course_id, granularity=granularity, bucket_start=start)
+    updates = {name: F(name) + value for name, value in counts.items()}
+    if rollups.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            ActivityRollup.objects.create(
+                course_id=course_id, granularity=granularity, bucket_start=start, **counts
+            )
+    except IntegrityError:
+        # Another writer created the bucket first
+        rollups.update(**updates)
+
+
+def _mark_active(course_id, user_id, granularity, start):
+    """Return True the first time a learner is seen in a bucket"""
+    try:
+        with transaction.atomic():
+            LearnerActivity.objects.create(
+                course_id=course_id, user_id=user_id, granularity=granularity, bucket_start=start
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def record(course_id, user_id=None, when=None, **counts):
+    """Add ``counts`` to the hourly and daily buckets containing ``when``"""
+    when = when or timezone.now()
+    for granularity in GRANULARITIES:
+        start = bucket_start(when, granularity)
+        bucket_counts = dict(counts)
+        if user_id is not None and _mark_active(course_id, user_id, granularity, start):
+            bucket_counts['active_learners'] = 1
+        if bucket_counts:
+            _bump(course_id, granularity, start, bucket_counts)
+
+
+def record_many(course_id, user_ids, when=None, **counts):
+    """Like record, for a batch of learners written in bulk without signals"""
+    when = when or timezone.now()
+    for granularity in GRANULARITIES:
+        start = bucket_start(when, granularity)
+        LearnerActivity.objects.bulk_create(
+            [
+                LearnerActivity(course_id=course_id, user_id=user_id, granularity=granularity, bucket_start=start)
+                for user_id in user_ids
+            ],
+            ignore_conflicts=True,
+        )
+        _bump(course_id, granularity, start, counts)
+        # Recount rather than guess which learners were new to the bucket
+        active = LearnerActivity.objects.filter(course_id=course_id, granularity=granularity, bucket_start=start)
+        ActivityRollup.objects.filter(course_id=course_id, granularity=granularity, bucket_start=start).update(
+            active_learners=active.count()
+        )
+
+
+def _raw_events(since, course_ids=None):
+    """(counter, course id, user id, timestamp field, queryset) for each raw source"""
+    sources = (
+        ('enrollments', 'course_id', 'student_id', 'enrolled_at',
+         Enrollment.objects.filter(enrolled_at__gte=since)),
+        ('lesson_completions', 'lesson__chapter__course_id', 'user_id', 'completed_at',
+         LessonProgress.objects.filter(completed=True, completed_at__gte=since)),
+        ('course_completions', 'course_id', 'user_id', 'issued_at',
+         Certificate.objects.filter(issued_at__gte=since)),
+    )
+    if course_ids is None:
+        return sources
+    return tuple(
+        (counter, course_field, user_field, time_field, queryset.filter(**{f'{course_field}__in': course_ids}))
+        for counter, course_field, user_field, time_field, queryset in sources
+    )
+
+
+@transaction.atomic
+def rebuild(since, granularities=GRANULARITIES, course_ids=None, batch_size=1000):
+    """Recompute every bucket from ``since`` onwards from the raw tables.
+
+    ``course_ids`` limits the rebuild to those courses. Learners are written
+    in batches as they stream in and counted back from LearnerActivity, so
+    memory follows the number of buckets, not of learners.
+    """
+    since = bucket_start(since, ActivityRollup.DAY)
+    written = 0
+    for granularity in granularities:
+        rollups = ActivityRollup.objects.filter(granularity=granularity, bucket_start__gte=since)
+        activity = LearnerActivity.objects.filter(granularity=granularity, bucket_start__gte=since)
+        if course_ids is not None:
+            rollups = rollups.filter(course_id__in=course_ids)
+            activity = activity.filter(course_id__in=course_ids)
+        rollups.delete()
+        activity.delete()
+
+        counts = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+        for counter, course_field, user_field, time_field, queryset in _raw_events(since, course_ids):
+            bucketed = queryset.annotate(bucket=Trunc(time_field, granularity, tzinfo=dt_timezone.utc))
+            grouped = bucketed.values(course_field, 'bucket').annotate(total=Count('id')).order_by()
+            for row in grouped.iterator():
+                counts[(row[course_field], row['bucket'])][counter] += row['total']
+            # The same learner can show up in several sources; the unique
+            # constraint keeps one row per bucket
+            learners = bucketed.values_list(course_field, 'bucket', user_field).distinct().iterator(chunk_size=batch_size)
+            for chunk in iter(lambda: list(islice(learners, batch_size)), []):
+                LearnerActivity.objects.bulk_create(
+                    [
+                        LearnerActivity(course_id=course_id, user_id=user_id, granularity=granularity, bucket_start=bucket)
+                        for course_id, bucket, user_id in chunk
+                    ],
+                    ignore_conflicts=True,
+                )
+
+        active = activity.values_list('course_id', 'bucket_start').annotate(total=Count('id')).order_by()
+        for course_id, bucket, total in active.iterator():
+            counts[(course_id, bucket)]['active_learners'] = total
+        ActivityRollup.objects.bulk_create(
+            [
+                ActivityRollup(course_id=course_id, granularity=granularity, bucket_start=bucket, **values)
+                for (course_id, bucket), values in counts.items()
+            ],
+            batch_size=batch_size,
+        )
+        written += len(counts)
+    return written
+
+
+def prune(hourly_retention_days, learner_retention_days=None):
+    """Drop hourly buckets older than the retention period; daily ones stay.
+
+    Daily LearnerActivity rows only stop a learner from being counted twice
+    in a bucket, so they go after ``learner_retention_days`` (by default the
+    hourly retention) while the daily rollups keep their active_learners.
+    A completion dated further back than that may count its learner again.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(days=hourly_retention_days)
+    LearnerActivity.objects.filter(granularity=ActivityRollup.HOUR, bucket_start__lt=cutoff).delete()
+    deleted, _ = ActivityRollup.objects.filter(granularity=ActivityRollup.HOUR, bucket_start__lt=cutoff).delete()
+    if learner_retention_days is None:
+        learner_retention_days = hourly_retention_days
+    learner_cutoff = bucket_start(now - timedelta(days=learner_retention_days), ActivityRollup.DAY)
+    LearnerActivity.objects.filter(granularity=ActivityRollup.DAY, bucket_start__lt=learner_cutoff).delete()
+    return deleted
+
+
+def series(instructor, granularity=ActivityRollup.DAY, days=30, course=None):
+    """Chart data for an instructor's courses, read from rollup rows only"""
+    since = bucket_start(timezone.now() - timedelta(days=days), granularity)
+    rollups = ActivityRollup.objects.filter(
+        course__instructor=instructor, granularity=granularity, bucket_start__gte=since
+    )
+    if course is not None:
+        rollups = rollups.filter(course=course)
+    rows = (
+        rollups.values('bucket_start')
+        .annotate(**{name: Sum(name) for name in COUNTERS})
+        .order_by('bucket_start')
+    )
+    return {
+        'granularity': granularity,
+        'buckets': [row['bucket_start'].isoformat() for row in rows],
+        **{name: [row[name] for row in rows] for name in COUNTERS},
+    }
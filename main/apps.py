@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from . import signals  # noqa: F401
+        from .db import configure_sqlite
+        from .search import create_index_table
+
+        post_migrate.connect(create_index_table, sender=self)
+        connection_created.connect(configure_sqlite)
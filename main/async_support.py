@@ -0,0 +1,81 @@
+"""Helpers for the async views and the ASGI deployment.
+
+Under ASGI (``gunicorn skillmate.asgi:application -k
+uvicorn.workers.UvicornWorker``), a request only stays on the event loop
+when every middleware in front of the view is async-capable. Django's own
+middleware is. ``main.instrumentation`` and ``main.db`` support both modes,
+and ``AsyncWhiteNoiseMiddleware`` below replaces the sync-only WhiteNoise
+middleware. The hot JSON views are async and use the async ORM. Writes that
+need a transaction or model signals go through ``sync_to_async``, because
+Django 4.1 has neither async transactions nor async ``save()``.
+
+Under WSGI the same async views run through ``async_to_sync``, so both
+servers return identical responses.
+"""
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import Http404
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+def _resolve_user(request):
+    # Touching the lazy user loads the session and the user row
+    request.user.is_authenticated
+    return request.user
+
+
+async def aget_user(request):
+    """request.user, loaded without blocking the event loop"""
+    return await sync_to_async(_resolve_user)(request)
+
+
+# Only ever called for anonymous users, so it always returns the same
+# redirect that login_required gives the sync views
+_login_redirect = login_required(lambda request: None)
+
+
+def async_login_required(view_func):
+    """login_required for async views, which Django 4.1 does not support"""
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return _login_redirect(request)
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise that keeps async requests on the event loop"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            # Opens the file and stats it
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
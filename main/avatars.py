@@ -0,0 +1,190 @@
+"""User avatars, generated locally or mirrored from a social account.
+
+Templates show ``Avatar.url`` through the ``avatar_url`` tag and never call
+a third-party service while rendering:
+
+* Every user gets a deterministic SVG made from their username. It is
+  drawn by the ``generated_avatar`` view, so it needs no storage. The style
+  version is part of the URL, so the response can be cached for good.
+* A user who signs in with a social account gets that account's picture.
+  The picture is downloaded once by the ``mirror_avatars`` worker and
+  stored under AVATAR_ROOT, in a file named after a hash of its content.
+  ``Avatar.url`` then points at that file. Until the worker has run, and
+  whenever the download fails, the generated SVG is shown.
+
+Users created without signals, e.g. by ``seed_data``, have no Avatar row and
+fall back to the generated URL as well.
+"""
+import hashlib
+import logging
+import os
+import urllib.request
+from functools import lru_cache
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Avatar
+
+logger = logging.getLogger(__name__)
+
+# Bump to change the drawing; old URLs keep their cached copies
+STYLE_VERSION = 1
+SIZE = 64
+PALETTE = (
+    '#2563eb', '#7c3aed', '#db2777', '#dc2626', '#ea580c', '#ca8a04',
+    '#16a34a', '#0d9488', '#0891b2', '#4f46e5', '#9333ea', '#475569',
+)
+IMAGE_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+MIRROR_MAX_BYTES = 1024 * 1024
+MIRROR_TIMEOUT = 10
+
+
+@lru_cache(maxsize=1024)
+def generated_svg(seed):
+    """A square SVG of three shapes whose colours and placement come from the seed"""
+    digest = hashlib.sha256(f'{STYLE_VERSION}:{seed}'.encode()).digest()
+
+    def colour(index):
+        return PALETTE[digest[index] % len(PALETTE)]
+
+    def coordinate(index):
+        return 8 + digest[index] % (SIZE - 16)
+
+    background = colour(0)
+    shapes = [
+        '<circle cx="{}" cy="{}" r="{}" fill="{}" fill-opacity="0.85"/>'.format(
+            coordinate(1), coordinate(2), 10 + digest[3] % 14, colour(4),
+        ),
+        '<rect x="{}" y="{}" width="{}" height="{}" fill="{}" transform="rotate({} {} {})"/>'.format(
+            coordinate(5) - 12, coordinate(6) - 12, 24, 24, colour(7),
+            digest[8] % 90, coordinate(5), coordinate(6),
+        ),
+        '<polygon points="{},{} {},{} {},{}" fill="{}" fill-opacity="0.9"/>'.format(
+            coordinate(9), coordinate(10), coordinate(11), coordinate(12), coordinate(13), coordinate(14),
+            colour(15),
+        ),
+    ]
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {SIZE} {SIZE}" width="{SIZE}" height="{SIZE}">'
+        f'<rect width="{SIZE}" height="{SIZE}" fill="{background}"/>{"".join(shapes)}</svg>'
+    )
+
+
+def generated_url(username):
+    return reverse('generated_avatar', kwargs={'version': STYLE_VERSION, 'seed': username})
+
+
+def url_for(user):
+    """The stored avatar URL of a user, or their generated one.
+
+    Select ``avatar`` along with the user (``select_related('instructor__avatar')``)
+    so this never queries.
+    """
+    try:
+        return user.avatar.url
+    except Avatar.DoesNotExist:
+        return generated_url(user.username)
+
+
+def mirrored_path(name):
+    return os.path.join(settings.AVATAR_ROOT, name)
+
+
+def social_avatar_url(user):
+    """The picture URL of the user's first social account, or ''"""
+    account = user.socialaccount_set.order_by('id').first()
+    return (account.get_avatar_url() or '') if account else ''
+
+
+def track(user, source_url=''):
+    """Create or refresh the Avatar row of a user.
+
+    A new or changed ``source_url`` is queued for ``mirror_avatars``.
+    Returns the Avatar.
+    """
+    avatar, created = Avatar.objects.get_or_create(
+        user=user, defaults={'url': generated_url(user.username), 'source_url': source_url},
+    )
+    if not created and avatar.source_url != source_url:
+        avatar.source_url = source_url
+        avatar.mirrored_at = None
+        if not source_url:
+            avatar.url = generated_url(user.username)
+        avatar.save(update_fields=['source_url', 'mirrored_at', 'url', 'updated_at'])
+    return avatar
+
+
+def _download(url):
+    """(bytes, extension) of an image URL, or None when it is not a usable image"""
+    request = urllib.request.Request(url, headers={'User-Agent': 'skillmate-avatars'})
+    with urllib.request.urlopen(request, timeout=MIRROR_TIMEOUT) as response:
+        content_type = response.headers.get_content_type()
+        data = response.read(MIRROR_MAX_BYTES + 1)
+    if content_type not in IMAGE_TYPES or len(data) > MIRROR_MAX_BYTES:
+        return None
+    return data, IMAGE_TYPES[content_type]
+
+
+def _write(path, data):
+    # Write then rename so a reader never sees a half-written file
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as destination:
+        destination.write(data)
+    os.replace(temporary, path)
+
+
+def mirror(avatar):
+    """Copy the social picture of an avatar into AVATAR_ROOT; returns True if it did"""
+    avatar.mirrored_at = timezone.now()
+    try:
+        downloaded = _download(avatar.source_url)
+    except (OSError, ValueError) as e:
+        logger.warning('Could not mirror the avatar of user %s: %s', avatar.user_id, e)
+        downloaded = None
+    if downloaded is None:
+        # Keep showing the generated avatar rather than retrying forever
+        avatar.url = generated_url(avatar.user.username)
+        avatar.save(update_fields=['url', 'mirrored_at', 'updated_at'])
+        return False
+    data, extension = downloaded
+    name = f'{hashlib.sha256(data).hexdigest()[:32]}.{extension}'
+    path = mirrored_path(name)
+    if not os.path.exists(path):
+        os.makedirs(settings.AVATAR_ROOT, exist_ok=True)
+        _write(path, data)
+    avatar.url = reverse('mirrored_avatar', kwargs={'name': name})
+    avatar.save(update_fields=['url', 'mirrored_at', 'updated_at'])
+    return True
+
+
+def mirror_pending(limit=50):
+    """Mirror social pictures that were added or changed since the last run; returns how many"""
+    pending = (
+        Avatar.objects.filter(mirrored_at__isnull=True).exclude(source_url='')
+        .select_related('user').order_by('updated_at')[:limit]
+    )
+    count = 0
+    for avatar in pending:
+        mirror(avatar)
+        count += 1
+    return count
+
+
+def backfill():
+    """Create Avatar rows for users without one; returns how many were created"""
+    from django.contrib.auth.models import User
+
+    created = 0
+    users = User.objects.filter(avatar__isnull=True).prefetch_related('socialaccount_set').order_by('id')
+    for user in users.iterator(chunk_size=500):
+        accounts = sorted(user.socialaccount_set.all(), key=lambda account: account.id)
+        track(user, (accounts[0].get_avatar_url() or '') if accounts else '')
+        created += 1
+    return created
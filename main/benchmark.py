@@ -0,0 +1,234 @@
+"""End-to-end view benchmarks with stored query and latency budgets.
+
+``run`` requests every named URL in ``main.urls`` through the Django test
+client. It signs in as a learner who has finished the busiest seeded course,
+or as that course's instructor for dashboard URLs. Then it records the
+latency and query count of each request. Most URLs are fetched with GET. A
+few write endpoints whose repeats change nothing are POSTed instead, see
+``POSTS``.
+
+Budgets live in a JSON file (``settings.BENCHMARK_BUDGETS``)::
+
+    {"default": {"queries": 25, "p95_ms": 500},
+     "views": {"home": {"queries": 2, "p95_ms": 60}, ...}}
+
+A view fails when it answers with a server error, when its most expensive
+request ran more queries than allowed or when its p95 latency is above the
+limit. Query counts are exact
+and portable. Latency limits depend on the machine, so give them generous
+headroom.
+
+Run it against a seeded, disposable database (see ``seed_data``). Some GETs
+write too: opening a lesson creates its progress row.
+"""
+import json
+import logging
+import math
+import time
+import uuid
+from collections import namedtuple
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import URLPattern, reverse
+
+from . import avatars, urls
+from .instrumentation import RequestSample
+from .models import Avatar, Certificate, ChunkedUpload, Course, Enrollment
+
+Result = namedtuple('Result', 'name path method status p50_ms p95_ms queries')
+Case = namedtuple('Case', 'name path method data user')
+
+# Write endpoints that are safe to repeat, with the body to send
+POSTS = {
+    'complete_lesson': lambda targets: {},
+    'progress-batch': lambda targets: {'events': [{'lesson': targets['lesson_id']}]},
+    'course-bulk-enroll': lambda targets: {'users': [targets['student'].username]},
+}
+QUERY_STRINGS = {
+    'search': lambda targets: {'q': targets['query']},
+    'search-json': lambda targets: {'q': targets['query']},
+}
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def percentile(values, share):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+def find_targets():
+    """The objects that fill in URL parameters, taken from the busiest course"""
+    courses = (
+        Course.objects.filter(status=Course.STATUS_READY, lesson_count__gt=0)
+        .annotate(learners=Count('enrollment'))
+        .order_by('-learners', 'id')
+        .select_related('instructor')
+    )
+    course = courses.filter(certificates__isnull=False).distinct().first() or courses.first()
+    if course is None:
+        raise BenchmarkError('No course with lessons to benchmark; run seed_data first')
+    certificate = Certificate.objects.filter(course=course).select_related('user').order_by('id').first()
+    if certificate is not None:
+        student = certificate.user
+    else:
+        enrollment = Enrollment.objects.filter(course=course).select_related('student').order_by('id').first()
+        if enrollment is None:
+            raise BenchmarkError(f'Nobody is enrolled in "{course.slug}"; run seed_data first')
+        student = enrollment.student
+    lesson = course.chapters.order_by('order').first().lessons.order_by('order').first()
+    upload = ChunkedUpload.objects.filter(user=course.instructor).order_by('-id').first()
+    mirrored = Avatar.objects.exclude(source_url='').exclude(url__endswith='.svg').values_list('url', flat=True).first()
+    return {
+        'course': course,
+        'instructor': course.instructor,
+        'student': student,
+        'lesson_id': lesson.id,
+        'certificate_id': certificate.certificate_id if certificate else 'CERT-MISSING',
+        # An unknown id still exercises the lookup and the 404 path
+        'upload_id': upload.upload_id if upload else uuid.uuid4(),
+        'avatar_name': mirrored.rsplit('/', 1)[1] if mirrored else f'{uuid.uuid4().hex}.png',
+        'query': course.title.split()[0],
+    }
+
+
+def _kwargs(pattern, targets):
+    course = targets['course']
+    values = {
+        'slug': course.slug,
+        'course_slug': course.slug,
+        'instructor': course.instructor.username,
+        'category': course.category_slug,
+        'lesson_id': targets['lesson_id'],
+        'certificate_id': targets['certificate_id'],
+        'upload_id': targets['upload_id'],
+        'version': avatars.STYLE_VERSION,
+        'seed': course.instructor.username,
+        'name': targets['avatar_name'],
+    }
+    names = pattern.pattern.converters.keys() or pattern.pattern.regex.groupindex.keys()
+    missing = [name for name in names if name not in values]
+    if missing:
+        raise BenchmarkError(f'No benchmark value for URL parameter(s) {", ".join(missing)} of "{pattern.name}"')
+    return {name: values[name] for name in names}
+
+
+def build_cases(targets, anonymous=False, only=None):
+    cases = []
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name:
+            continue
+        if only and pattern.name not in only:
+            continue
+        path = reverse(pattern.name, kwargs=_kwargs(pattern, targets))
+        if anonymous:
+            user = None
+        elif path.startswith('/dashboard/'):
+            user = targets['instructor']
+        else:
+            user = targets['student']
+        if pattern.name in POSTS:
+            cases.append(Case(pattern.name, path, 'post', POSTS[pattern.name](targets), user))
+        else:
+            data = QUERY_STRINGS[pattern.name](targets) if pattern.name in QUERY_STRINGS else {}
+            cases.append(Case(pattern.name, path, 'get', data, user))
+    return cases
+
+
+def measure(case, client, repeat=20, warmup=2):
+    """Request one case repeat times after warming up; queries is the highest count seen"""
+    def request():
+        if case.method == 'post':
+            return client.post(case.path, json.dumps(case.data), content_type='application/json')
+        return client.get(case.path, case.data)
+
+    for _ in range(warmup):
+        request()
+    timings, counts = [], []
+    for _ in range(repeat):
+        sample = RequestSample()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sample))
+            started = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - started) * 1000)
+        counts.append(sample.queries)
+    return Result(
+        case.name, case.path, case.method.upper(), response.status_code,
+        percentile(timings, 0.5), percentile(timings, 0.95), max(counts),
+    )
+
+
+def run(anonymous=False, only=None, repeat=20, warmup=2):
+    targets = find_targets()
+    clients = {}
+    results = []
+    # Keep the sampling middleware out of the numbers being measured, and
+    # the expected 404/405 warnings out of the report
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    try:
+        with override_settings(METRICS_SAMPLE_RATE=0):
+            for case in build_cases(targets, anonymous=anonymous, only=only):
+                key = case.user.pk if case.user else None
+                if key not in clients:
+                    # Report server errors as a 500 instead of stopping the run
+                    clients[key] = Client(raise_request_exception=False)
+                    if case.user:
+                        clients[key].force_login(case.user)
+                results.append(measure(case, clients[key], repeat=repeat, warmup=warmup))
+    finally:
+        request_logger.setLevel(level)
+    return results
+
+
+def budget_key(name, anonymous=False):
+    return f'anonymous:{name}' if anonymous else name
+
+
+def load_budgets(path=None):
+    path = path or settings.BENCHMARK_BUDGETS
+    try:
+        with open(path) as source:
+            budgets = json.load(source)
+    except FileNotFoundError:
+        return {'default': {}, 'views': {}}
+    budgets.setdefault('default', {})
+    budgets.setdefault('views', {})
+    return budgets
+
+
+def over_budget(result, budgets, anonymous=False):
+    """Messages for every limit the result breaks, empty if within budget"""
+    budget = {**budgets['default'], **budgets['views'].get(budget_key(result.name, anonymous), {})}
+    problems = []
+    if result.status >= 500:
+        problems.append(f'status {result.status}')
+    if 'queries' in budget and result.queries > budget['queries']:
+        problems.append(f'{result.queries} queries > {budget["queries"]}')
+    if 'p95_ms' in budget and result.p95_ms > budget['p95_ms']:
+        problems.append(f'p95 {result.p95_ms:.1f}ms > {budget["p95_ms"]}ms')
+    return problems
+
+
+def write_budgets(results, budgets, path=None, anonymous=False, headroom=3.0, min_ms=50):
+    """Store the measured numbers as the new budgets, latency with headroom"""
+    for result in results:
+        budgets['views'][budget_key(result.name, anonymous)] = {
+            'queries': result.queries,
+            'p95_ms': max(min_ms, round(result.p95_ms * headroom)),
+        }
+    budgets['views'] = dict(sorted(budgets['views'].items()))
+    with open(path or settings.BENCHMARK_BUDGETS, 'w') as target:
+        json.dump(budgets, target, indent=2)
+        target.write('\n')
@@ -0,0 +1,226 @@
+"""Two-tier cache: an in-process LRU in front of a cache shared by every worker.
+
+``TieredCache`` is the ``default`` cache. Reads are answered from a small
+LRU in the worker's memory when possible, and from the ``shared`` cache
+otherwise. The shared cache is a file-based cache under BASE_DIR by
+default; point ``SHARED_CACHE_BACKEND``/``SHARED_CACHE_LOCATION`` at Redis
+or Memcached in production. Writes and deletes go to both tiers.
+
+A local copy lives at most ``LOCAL_TIMEOUT`` seconds. That bounds how long
+another worker may keep serving a value after this one changed or deleted
+it. Sessions therefore skip the local tier (``SESSION_CACHE_ALIAS`` is the
+shared cache), so a logout takes effect everywhere at once.
+
+Every cache keeps hit/miss counters per tier, reported by ``/metrics``.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_MISSING = object()
+
+# One LRU and one set of counters per cache alias, shared by every thread
+# of the process; Django builds a TieredCache object per thread
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class CacheStats:
+    __slots__ = ('local_hits', 'shared_hits', 'misses')
+
+    def __init__(self):
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+
+class _LocalStore:
+    """Bounded LRU of pickled values with per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.stats = CacheStats()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, data = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return _MISSING
+            self.entries.move_to_end(key)
+        return pickle.loads(data)
+
+    def set(self, key, value, timeout):
+        # Pickled, so a caller that mutates its copy never changes ours
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, data)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def count(self, result, amount=1):
+        with self.lock:
+            setattr(self.stats, result, getattr(self.stats, result) + amount)
+
+
+def _store(name, max_entries):
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = _LocalStore(max_entries)
+        return _stores[name]
+
+
+class TieredCache(BaseCache):
+    """Cache backend; OPTIONS are SHARED (alias), LOCAL_TIMEOUT and LOCAL_MAX_ENTRIES"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.local = _store(location or self.shared_alias, options.get('LOCAL_MAX_ENTRIES', 1000))
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    @property
+    def stats(self):
+        return self.local.stats
+
+    def _local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def _fetch(self, key, version):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self.local.get(local_key)
+        if value is not _MISSING:
+            self.local.count('local_hits')
+            return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self.local.count('misses')
+        else:
+            self.local.count('shared_hits')
+            self.local.set(local_key, value, self.local_timeout)
+        return value
+
+    def get(self, key, default=None, version=None):
+        value = self._fetch(key, version)
+        return default if value is _MISSING else value
+
+    def has_key(self, key, version=None):
+        return self._fetch(key, version) is not _MISSING
+
+    def get_many(self, keys, version=None):
+        found, remote = {}, []
+        for key in keys:
+            value = self.local.get(self.make_and_validate_key(key, version=version))
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                self.local.count('local_hits')
+                found[key] = value
+        if remote:
+            fetched = self.shared.get_many(remote, version=version)
+            for key, value in fetched.items():
+                self.local.set(self.make_and_validate_key(key, version=version), value, self.local_timeout)
+            self.local.count('shared_hits', len(fetched))
+            self.local.count('misses', len(remote) - len(fetched))
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._set_local(key, value, timeout, version)
+
+    def _set_local(self, key, value, timeout, version):
+        local_key = self.make_and_validate_key(key, version=version)
+        local_timeout = self._local_timeout(timeout)
+        if local_timeout > 0:
+            self.local.set(local_key, value, local_timeout)
+        else:
+            self.local.delete(local_key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._set_local(key, value, timeout, version)
+        else:
+            # Another worker got there first; read its value next time
+            self.local.delete(self.make_and_validate_key(key, version=version))
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._set_local(key, value, timeout, version)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.local.delete(self.make_and_validate_key(key, version=version))
+        self.shared.delete_many(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self.local.delete(self.make_and_validate_key(key, version=version))
+        return self.shared.decr(key, delta, version=version)
+
+    def clear(self):
+        # Only this process's LRU; other workers' copies expire on their own
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+
+def exposition():
+    """Hit/miss counters of every tiered cache in the Prometheus text format"""
+    lines = [
+        '# HELP skillmate_cache_requests_total Cache reads by the tier that answered them',
+        '# TYPE skillmate_cache_requests_total counter',
+    ]
+    with _stores_lock:
+        stores = sorted(_stores.items())
+    for name, store in stores:
+        with store.lock:
+            counts = [(result, getattr(store.stats, result)) for result in CacheStats.__slots__]
+        for result, count in counts:
+            lines.append(f'skillmate_cache_requests_total{{cache="{name}",result="{result}"}} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,138 @@
+import base64
+import binascii
+import time
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.text import slugify
+
+from .models import Course
+
+PAGE_SIZE = 12
+CATALOG_CACHE_TIMEOUT = 60 * 10
+
+# Columns rendered on a course card; everything else stays deferred
+CARD_FIELDS = (
+    'id', 'title', 'slug', 'description', 'thumbnail', 'level', 'duration',
+    'category', 'price', 'discount', 'created_at', 'lesson_count', 'total_duration_seconds',
+    'instructor__id', 'instructor__username', 'instructor__avatar__url',
+)
+
+VERSION_KEY = 'catalog:version'
+
+
+def encode_cursor(course):
+    raw = f'{course.created_at.isoformat()}|{course.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id) for a cursor, or None if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, course_id = base64.urlsafe_b64decode(padded).decode().rsplit('|', 1)
+        created_at = parse_datetime(created_at)
+        course_id = int(course_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    if created_at is None:
+        return None
+    return created_at, course_id
+
+
+def catalog_queryset(category=None):
+    """Card-only course rows, newest first, with the instructor and avatar joined in"""
+    courses = Course.objects.filter(status=Course.STATUS_READY).select_related('instructor__avatar').only(*CARD_FIELDS)
+    if category is not None:
+        courses = courses.filter(category_slug=slugify(category))
+    return courses.order_by('-created_at', '-id')
+
+
+class CatalogPage:
+    """One keyset-paginated page of the catalog.
+
+    Rows are fetched lazily so a cached template fragment never touches the
+    database. ``cursor`` is the opaque value of the ``after`` query parameter.
+    """
+
+    def __init__(self, category=None, cursor=None, page_size=PAGE_SIZE):
+        self.category = category
+        self.cursor = cursor if decode_cursor(cursor) else None
+        self.page_size = page_size
+
+    def _queryset(self):
+        courses = catalog_queryset(self.category)
+        position = decode_cursor(self.cursor)
+        if position:
+            created_at, course_id = position
+            courses = courses.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=course_id)
+            )
+        # One extra row tells us whether another page exists
+        return courses[:self.page_size + 1]
+
+    @cached_property
+    def _rows(self):
+        return list(self._queryset())
+
+    async def aload(self):
+        """Fetch the rows with the async ORM, so async views can use the page"""
+        self._rows = [course async for course in self._queryset()]
+
+    @property
+    def courses(self):
+        return self._rows[:self.page_size]
+
+    @property
+    def has_next(self):
+        return len(self._rows) > self.page_size
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.courses[-1]) if self.has_next else None
+
+    @property
+    def cache_key(self):
+        """Fragment cache vary-on values; changes whenever any course changes"""
+        return f'{version()}:{slugify(self.category or "")}:{self.cursor or ""}'
+
+    def as_json(self):
+        return {
+            'results': [
+                {
+                    'id': course.id,
+                    'title': course.title,
+                    'slug': course.slug,
+                    'description': course.description[:100],
+                    'thumbnail': course.thumbnail.url if course.thumbnail else '',
+                    'level': course.level,
+                    'duration': course.duration,
+                    'lesson_count': course.lesson_count,
+                    'total_duration_seconds': course.total_duration_seconds,
+                    'category': course.category,
+                    'price': str(course.price),
+                    'discount': str(course.discount),
+                    'instructor': course.instructor.username,
+                    'created_at': course.created_at.isoformat(),
+                }
+                for course in self.courses
+            ],
+            'next_cursor': self.next_cursor,
+        }
+
+
+def version():
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        current = time.time_ns()
+        cache.add(VERSION_KEY, current, None)
+    return current
+
+
+def invalidate():
+    """Drop every cached catalog page by moving to a new cache version"""
+    cache.set(VERSION_KEY, time.time_ns(), None)
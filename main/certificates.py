@@ -0,0 +1,213 @@
+"""Certificate artifacts and public verification.
+
+A certificate is rendered once, after issuance, to a standalone HTML page
+and a PDF under CERTIFICATE_ROOT by the ``render_certificates`` worker. The
+files only change when a certificate is reissued, so they are served as
+they are with a strong ETag that browsers revalidate. Both files are
+rendered again on request if either is missing or older than the last
+render. Verification lookups are answered from the cache and only fall
+through to the database once per certificate id.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Certificate
+
+VERIFY_CACHE_TIMEOUT = 60 * 60 * 24
+# Unknown ids are cached briefly so a certificate issued a moment later shows up
+VERIFY_MISS_TIMEOUT = 60
+MTIME_SLACK = 2
+ARTIFACT_TYPES = {
+    'html': 'text/html; charset=utf-8',
+    'pdf': 'application/pdf',
+}
+
+
+def artifact_path(certificate_id, kind):
+    return os.path.join(settings.CERTIFICATE_ROOT, f'{certificate_id}.{kind}')
+
+
+def _display_name(user):
+    return f'{user.first_name} {user.last_name}'.strip() or user.username
+
+
+def certificate_context(certificate):
+    course = certificate.course
+    return {
+        'certificate_id': certificate.certificate_id,
+        'learner_name': _display_name(certificate.user),
+        'course_title': course.title,
+        'course_level': course.level,
+        'course_category': course.category,
+        'instructor_name': _display_name(course.instructor),
+        'issued_at': certificate.issued_at,
+        'pdf_url': reverse('certificate_pdf', args=[certificate.certificate_id]),
+        'verify_url': reverse('certificate_verify', args=[certificate.certificate_id]),
+        'course_url': reverse('course_curriculum', kwargs={'instructor': course.instructor.username, 'slug': course.slug}),
+    }
+
+
+def _pdf_text(text):
+    text = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return text.encode('cp1252', 'replace')
+
+
+def render_pdf(context):
+    """A one-page landscape A4 PDF using the built-in Helvetica fonts"""
+    width, height = 842, 595
+    lines = [
+        (b'F2', 30, 470, 'CERTIFICATE OF COMPLETION'),
+        (b'F1', 16, 410, 'This is to certify that'),
+        (b'F2', 26, 365, context['learner_name']),
+        (b'F1', 16, 320, 'has successfully completed the course'),
+        (b'F2', 22, 275, context['course_title']),
+        (b'F1', 13, 235, f"Level: {context['course_level']}    Category: {context['course_category']}"),
+        (b'F1', 13, 150, f"Instructor: {context['instructor_name']}"),
+        (b'F1', 13, 125, f"Date of Completion: {context['issued_at']:%B %d, %Y}"),
+        (b'F2', 13, 100, f"Certificate ID: {context['certificate_id']}"),
+    ]
+    content = [b'0.15 0.39 0.92 RG 8 w 24 24 794 547 re S']
+    for font, size, y, text in lines:
+        # Helvetica averages a little over half an em per character
+        x = max(40, (width - len(text) * size * 0.52) / 2)
+        content.append(b'BT /%s %d Tf %.1f %d Td (%s) Tj ET' % (font, size, x, y, _pdf_text(text)))
+    stream = b'\n'.join(content)
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+        b'/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>' % (width, height),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream),
+    ]
+    pdf = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        pdf += b'%010d 00000 n \n' % offset
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+def _write(path, data):
+    # Write then rename so a reader never sees a half-written file
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as destination:
+        destination.write(data)
+    os.replace(temporary, path)
+
+
+def render(certificate):
+    """Write the HTML and PDF artifacts and mark the certificate rendered"""
+    context = certificate_context(certificate)
+    artifacts = {
+        'html': render_to_string('certificates/artifact.html', context).encode(),
+        'pdf': render_pdf(context),
+    }
+    os.makedirs(settings.CERTIFICATE_ROOT, exist_ok=True)
+    # Taken before writing, so current files are never older than rendered_at
+    rendered_at = timezone.now()
+    digest = hashlib.sha256()
+    for kind, data in artifacts.items():
+        _write(artifact_path(certificate.certificate_id, kind), data)
+        digest.update(data)
+    certificate.artifact_etag = digest.hexdigest()[:32]
+    certificate.rendered_at = rendered_at
+    certificate.save(update_fields=['artifact_etag', 'rendered_at'])
+    return certificate
+
+
+def render_pending(limit=50):
+    """Render certificates issued since the last run; returns how many"""
+    pending = (
+        Certificate.objects.filter(rendered_at__isnull=True)
+        .select_related('user', 'course__instructor')
+        .order_by('issued_at')[:limit]
+    )
+    count = 0
+    for certificate in pending:
+        render(certificate)
+        count += 1
+    return count
+
+
+def _artifacts_current(certificate):
+    """True if every artifact exists and was written by the last render"""
+    # Some filesystems store modification times in whole seconds
+    oldest = certificate.rendered_at.timestamp() - MTIME_SLACK
+    for kind in ARTIFACT_TYPES:
+        try:
+            if os.stat(artifact_path(certificate.certificate_id, kind)).st_mtime < oldest:
+                return False
+        except FileNotFoundError:
+            return False
+    return True
+
+
+def ensure_rendered(certificate):
+    """Render synchronously if the worker has not caught up yet, or an artifact is missing or stale"""
+    if certificate.rendered_at is None or not _artifacts_current(certificate):
+        render(certificate)
+    return certificate
+
+
+def reissue(queryset):
+    """Queue certificates for rendering again, e.g. after a template change; returns how many"""
+    certificate_ids = list(queryset.values_list('certificate_id', flat=True))
+    count = queryset.update(rendered_at=None)
+    cache.delete_many([verify_key(certificate_id) for certificate_id in certificate_ids])
+    return count
+
+
+def verify_key(certificate_id):
+    return f'certificate:verify:{certificate_id}'
+
+
+def verification(certificate_id):
+    """Public facts about a certificate, or None if it does not exist"""
+    key = verify_key(certificate_id)
+    result = cache.get(key)
+    if result is not None:
+        return result or None
+    certificate = (
+        Certificate.objects.filter(certificate_id=certificate_id)
+        .select_related('user', 'course')
+        .only('certificate_id', 'issued_at', 'user__username', 'user__first_name', 'user__last_name',
+              'course__title', 'course__slug')
+        .first()
+    )
+    if certificate is None:
+        # Cache the miss as an empty dict so repeated bad links stay cheap
+        cache.set(key, {}, VERIFY_MISS_TIMEOUT)
+        return None
+    result = {
+        'valid': True,
+        'certificate_id': certificate.certificate_id,
+        'learner': _display_name(certificate.user),
+        'course': certificate.course.title,
+        'course_slug': certificate.course.slug,
+        'issued_at': certificate.issued_at.isoformat(),
+    }
+    cache.set(key, result, VERIFY_CACHE_TIMEOUT)
+    return result
+
+
+def forget(certificate_id):
+    """Remove the artifacts and cached verification of a revoked certificate"""
+    for kind in ARTIFACT_TYPES:
+        path = artifact_path(certificate_id, kind)
+        if os.path.exists(path):
+            os.remove(path)
+    cache.delete(verify_key(certificate_id))
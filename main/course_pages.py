@@ -0,0 +1,90 @@
+"""Whole-page cache for anonymous visits to course landing pages.
+
+The public page is identical for every anonymous visitor, so the rendered
+HTML is cached under the instructor/slug pair of its URL and served without
+touching the database. An entry is only used while both the catalog
+version (any course changed, which may alter "Similar Courses") and the
+course's own version (its chapters or lessons changed) are unchanged.
+Signed-in visitors get the same public page plus a small JSON overlay with
+their enrollment, progress and certificate, see ``overlay``.
+"""
+import time
+
+from django.core.cache import cache
+from django.urls import reverse
+
+from . import catalog
+from .models import Certificate, Chapter, Course, CourseProgress, Enrollment
+
+COURSE_PAGE_TIMEOUT = 60 * 10
+SIMILAR_COURSES = 3
+PREVIEW_CHAPTERS = 3
+
+
+def _version_key(course_id):
+    return f'course_page:version:{course_id}'
+
+
+def _page_key(instructor, slug):
+    return f'course_page:{instructor}:{slug}'
+
+
+def invalidate(course_id):
+    cache.set(_version_key(course_id), time.time_ns(), None)
+
+
+def version(course_id):
+    key = _version_key(course_id)
+    versions = cache.get_many([catalog.VERSION_KEY, key])
+    if key not in versions:
+        versions[key] = time.time_ns()
+        cache.add(key, versions[key], None)
+    return f'{versions.get(catalog.VERSION_KEY) or catalog.version()}:{versions[key]}'
+
+
+def get_page(instructor, slug):
+    """Cached HTML for an anonymous visitor, or None"""
+    entry = cache.get(_page_key(instructor, slug))
+    if entry is None or entry['version'] != version(entry['course_id']):
+        return None
+    return entry['html']
+
+
+def store_page(instructor, slug, course_id, html):
+    entry = {'course_id': course_id, 'version': version(course_id), 'html': html}
+    cache.set(_page_key(instructor, slug), entry, COURSE_PAGE_TIMEOUT)
+
+
+def public_context(course):
+    """Everything on the landing page that is the same for every visitor"""
+    category_courses = (
+        Course.objects.filter(category_slug=course.category_slug, status=Course.STATUS_READY)
+        .exclude(id=course.id)
+        .select_related('instructor__avatar')
+        .only(*catalog.CARD_FIELDS)[:SIMILAR_COURSES]
+    )
+    chapters = Chapter.objects.filter(course=course).prefetch_related('lessons')[:PREVIEW_CHAPTERS]
+    return {
+        'course': course,
+        'category_courses': category_courses,
+        'chapters': chapters,
+        'total_lessons': course.get_total_lessons(),
+    }
+
+
+async def overlay(user, course):
+    """The per-visitor part of the landing page, for the async overlay view"""
+    if not user.is_authenticated:
+        return {'authenticated': False, 'enrolled': False}
+    if not await Enrollment.objects.ais_enrolled(course, user):
+        return {'authenticated': True, 'enrolled': False}
+    progress = await CourseProgress.objects.afor_user(user, course)
+    certificate_id = await (
+        Certificate.objects.filter(user=user, course=course).values_list('certificate_id', flat=True).afirst()
+    )
+    return {
+        'authenticated': True,
+        'enrolled': True,
+        'progress_percentage': progress.percentage,
+        'certificate_url': reverse('certificate_view', args=[certificate_id]) if certificate_id else None,
+    }
@@ -0,0 +1,83 @@
+from django.db.models import Prefetch
+
+from .models import Chapter, Lesson, LessonProgress
+
+
+class Curriculum:
+    """Chapter -> lessons -> completed flag tree for one user and course.
+
+    Built with three queries regardless of course size: chapters, lessons
+    and the user's completed lesson ids. Each chapter gets a ``lesson_list``
+    and each lesson a ``completed`` attribute for the templates.
+    """
+
+    def __init__(self, course, user=None):
+        self.course = course
+        self.chapters = list(
+            Chapter.objects.filter(course=course).prefetch_related(
+                Prefetch('lessons', queryset=Lesson.objects.order_by('position', 'order'), to_attr='lesson_list')
+            )
+        )
+
+        self.completed_ids = set()
+        if user is not None and user.is_authenticated:
+            self.completed_ids = set(
+                LessonProgress.objects.filter(
+                    user=user, lesson__chapter__course=course, completed=True
+                ).values_list('lesson_id', flat=True)
+            )
+
+        # Flattened course sequence, in Lesson.position order
+        self.lessons = []
+        for chapter in self.chapters:
+            for lesson in chapter.lesson_list:
+                lesson.completed = lesson.id in self.completed_ids
+                self.lessons.append(lesson)
+        self._positions = {lesson.id: position for position, lesson in enumerate(self.lessons, start=1)}
+
+    def __iter__(self):
+        return iter(self.chapters)
+
+    def __len__(self):
+        return len(self.chapters)
+
+    @property
+    def first_lesson(self):
+        return self.lessons[0] if self.lessons else None
+
+    @property
+    def total_lessons(self):
+        return len(self.lessons)
+
+    def lesson_at(self, position):
+        """Lesson at a 1-based position in the flattened course sequence"""
+        if 1 <= position <= len(self.lessons):
+            return self.lessons[position - 1]
+        return None
+
+    def position_of(self, lesson):
+        return self._positions.get(lesson.id)
+
+    def next_lesson(self, lesson):
+        position = self.position_of(lesson)
+        return self.lesson_at(position + 1) if position else None
+
+    def previous_lesson(self, lesson):
+        position = self.position_of(lesson)
+        return self.lesson_at(position - 1) if position else None
+
+    @property
+    def resume_lesson(self):
+        """First lesson the user has not completed yet, in course order"""
+        for lesson in self.lessons:
+            if not lesson.completed:
+                return lesson
+        return self.first_lesson
+
+    def progress_map(self):
+        """Lesson id -> completed flag, as used by the curriculum page script"""
+        return {lesson.id: lesson.completed for lesson in self.lessons}
+
+
+def load_curriculum(course, user=None):
+    return Curriculum(course, user)
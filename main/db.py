@@ -0,0 +1,178 @@
+"""Primary/replica database routing.
+
+Writes always go to ``default``. Views decorated with ``replica_reads``
+send their reads to one healthy replica from ``settings.REPLICA_DATABASES``
+for the duration of a GET/HEAD request. After a request writes anything,
+the client is pinned to the primary for REPLICA_STICKY_SECONDS with a
+cookie, so a learner never reads a replica that has not caught up with
+their own enrollment or progress. Sessions are always read from the
+primary. A replica whose query fails is taken out of rotation until its
+next health check, and the view runs again on the primary.
+
+Locally, two SQLite files can stand in for the primary and a replica: set
+DATABASE_REPLICAS to the replica path and copy the primary over with the
+``sync_sqlite_replicas`` command.
+"""
+import contextvars
+import logging
+import random
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = 'db_primary_until'
+# Apps whose reads must never lag behind a write
+PRIMARY_ONLY_APPS = {'sessions'}
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class _RequestState:
+    def __init__(self, replica=None):
+        self.replica = replica
+        self.wrote = False
+        self.view = None
+
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+_health = {}
+
+
+def replica_reads(view_func):
+    """Mark a view whose GET requests may read from a replica"""
+    view_func.replica_reads = True
+    return view_func
+
+
+def replica_is_healthy(alias):
+    """Probe a replica at most once per REPLICA_HEALTH_INTERVAL per process.
+
+    The probe reads a real table: SQLite answers SELECT 1 even for a path
+    that does not exist, creating an empty database on the way.
+    """
+    healthy, checked_at = _health.get(alias, (False, None))
+    now = time.monotonic()
+    if checked_at is not None and now - checked_at < settings.REPLICA_HEALTH_INTERVAL:
+        return healthy
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+        healthy = True
+    except DatabaseError:
+        healthy = False
+    _health[alias] = (healthy, now)
+    return healthy
+
+
+def mark_unhealthy(alias):
+    """Stop routing to a replica until its next health check"""
+    _health[alias] = (False, time.monotonic())
+
+
+def choose_replica():
+    healthy = [alias for alias in settings.REPLICA_DATABASES if replica_is_healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Later reads in this request see the write, and so do the next few requests
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _state.set(_RequestState())
+        try:
+            return self._pin_after_write(self.get_response(request))
+        finally:
+            _state.reset(token)
+
+    async def __acall__(self, request):
+        token = _state.set(_RequestState())
+        try:
+            return self._pin_after_write(await self.get_response(request))
+        finally:
+            _state.reset(token)
+
+    def _pin_after_write(self, response):
+        if _state.get().wrote:
+            response.set_cookie(
+                STICKY_COOKIE,
+                str(int(time.time()) + settings.REPLICA_STICKY_SECONDS),
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.REPLICA_DATABASES or request.method not in SAFE_METHODS:
+            return None
+        if not getattr(view_func, 'replica_reads', False) or self._pinned(request):
+            return None
+        state = _state.get()
+        state.replica = choose_replica()
+        state.view = (view_func, view_args, view_kwargs)
+        return None
+
+    def process_exception(self, request, exception):
+        """Run a read-only view again on the primary when its replica fails"""
+        state = _state.get()
+        if not isinstance(exception, OperationalError) or state is None or state.replica is None or state.wrote:
+            return None
+        logger.warning('Replica %s failed, retrying on the primary: %s', state.replica, exception)
+        mark_unhealthy(state.replica)
+        state.replica = None
+        view_func, view_args, view_kwargs = state.view
+        if iscoroutinefunction(view_func):
+            # Async handlers call process_exception from a worker thread
+            return async_to_sync(view_func)(request, *view_args, **view_kwargs)
+        return view_func(request, *view_args, **view_kwargs)
+
+    def _pinned(self, request):
+        try:
+            return int(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created hook: WAL lets readers work alongside the writer"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
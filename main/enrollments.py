@@ -0,0 +1,33 @@
+"""Bulk enrollment of a cohort given usernames or email addresses."""
+from django.contrib.auth.models import User
+
+from .models import Enrollment
+
+LOOKUP_BATCH_SIZE = 500
+
+
+def resolve_users(identifiers, batch_size=LOOKUP_BATCH_SIZE):
+    """Map usernames and emails to user ids; returns (ids, unknown identifiers)"""
+    identifiers = list(dict.fromkeys(value.strip() for value in identifiers if value and value.strip()))
+    found = {}
+    for start in range(0, len(identifiers), batch_size):
+        batch = identifiers[start:start + batch_size]
+        emails = [value for value in batch if '@' in value]
+        usernames = [value for value in batch if '@' not in value]
+        for user_id, username in User.objects.filter(username__in=usernames).values_list('id', 'username'):
+            found[username] = user_id
+        for user_id, email in User.objects.filter(email__in=emails).values_list('id', 'email'):
+            found.setdefault(email, user_id)
+    ids = list(dict.fromkeys(found[value] for value in identifiers if value in found))
+    unknown = [value for value in identifiers if value not in found]
+    return ids, unknown
+
+
+def bulk_enroll(course, identifiers, batch_size=1000):
+    user_ids, unknown = resolve_users(identifiers)
+    enrolled = Enrollment.objects.enroll_many(course, user_ids, batch_size=batch_size)
+    return {
+        'enrolled': len(enrolled),
+        'already_enrolled': len(user_ids) - len(enrolled),
+        'unknown': unknown,
+    }
@@ -2,9 +2,13 @@ from django import forms
 from .models import Course, Chapter, Lesson
 
 class CourseEditForm(forms.ModelForm):
+    # Media arrives through the chunked upload endpoints, not as raw files
+    thumbnail_upload_id = forms.UUIDField(required=False, widget=forms.HiddenInput)
+    featured_video_upload_id = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = Course
-        fields = ('title', 'description', 'thumbnail', 'featured_video', 'level', 'duration', 'category', 'requirements', 'content', 'price', 'discount')
+        fields = ('title', 'description', 'level', 'duration', 'category', 'requirements', 'content', 'price', 'discount')
 
 class ChapterForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,229 @@
+"""Responsive image derivatives for course thumbnails and static images.
+
+Every image is offered in a few widths and modern formats through
+``<picture>``/``srcset``, so a course card downloads a 480px AVIF or WebP
+instead of the full-size upload.
+
+* Course thumbnails live on Cloudinary. ``CloudinaryUploader`` asks for the
+  derivatives as eager transformations at upload time, and the delivery
+  URLs below name exactly those transformations, so the first visitor
+  never waits for a resize.
+* Large raster files under ``STATIC_DERIVATIVE_DIRS`` get resized copies
+  at ``collectstatic`` time (``StaticDerivativesStorage``, needs Pillow).
+  The widths of each file are listed in ``DERIVATIVES_MANIFEST`` in
+  STATIC_ROOT. Until that file exists, e.g. under runserver, the templates
+  fall back to the original image.
+
+Built tags are memoized per image, so a page render does no URL building.
+"""
+import io
+import json
+import os
+import re
+from functools import lru_cache
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.base import ContentFile
+from django.utils.html import format_html, format_html_join
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from . import media_backend
+
+PRESETS = {
+    # One column on phones, three across on wider screens
+    'card': {'widths': (320, 480, 640, 960), 'sizes': '(max-width: 780px) 100vw, 33vw'},
+    'half': {'widths': (480, 768, 1080, 1600), 'sizes': '(max-width: 780px) 100vw, 50vw'},
+}
+# Best first; the last format is the <img> fallback
+FORMATS = ('avif', 'webp')
+CLOUDINARY_TRANSFORMATION = {'crop': 'limit', 'quality': 'auto'}
+CLOUDINARY_URL_RE = re.compile(
+    r'^https?://res\.cloudinary\.com/[^/]+/image/upload/(?:v(?P<version>\d+)/)?(?P<public_id>.+?)(?:\.(?P<format>\w+))?$'
+)
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+STATIC_DERIVATIVE_DIRS = ('img/',)
+STATIC_SOURCE_EXTENSIONS = ('.webp', '.jpg', '.jpeg', '.png')
+STATIC_WIDTHS = (480, 768, 1080, 1600)
+STATIC_QUALITY = 80
+DERIVATIVES_MANIFEST = 'image-derivatives.json'
+
+
+def eager_transformations(preset='card'):
+    """Cloudinary ``eager`` option that pre-builds every derivative of a preset"""
+    return [
+        {'width': width, 'format': image_format, **CLOUDINARY_TRANSFORMATION}
+        for width in PRESETS[preset]['widths']
+        for image_format in FORMATS
+    ]
+
+
+def _cloudinary_source(public_id, version, image_format):
+    """(public_id, version, format) on Cloudinary of a stored CloudinaryField value.
+
+    The media worker stores full delivery URLs, older rows store public ids.
+    Returns None for files that are not on Cloudinary.
+    """
+    if public_id.startswith(('http://', 'https://')):
+        match = CLOUDINARY_URL_RE.match(f'{public_id}.{image_format}' if image_format else public_id)
+        if match is None:
+            return None
+        return match.group('public_id', 'version', 'format')
+    if public_id.startswith('/'):
+        return None
+    return public_id, version, image_format
+
+
+def _srcset(urls):
+    return ', '.join(f'{url} {width}w' for width, url in urls)
+
+
+def _picture(sources, fallback, sizes, attrs):
+    """<picture> with one <source> per extra format; sources is [(format, [(width, url)])]"""
+    *extra, (image_format, urls) = sources
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        format_html_join(
+            '', '<source type="{}" srcset="{}" sizes="{}">',
+            ((MIME_TYPES[fmt], _srcset(fmt_urls), sizes) for fmt, fmt_urls in extra),
+        ),
+        fallback, _srcset(urls), sizes, _attributes(attrs),
+    )
+
+
+def _plain(src, attrs):
+    return format_html('<img src="{}"{}>', src, _attributes(attrs))
+
+
+def _attributes(attrs):
+    return format_html_join('', ' {}="{}"', attrs)
+
+
+@lru_cache(maxsize=4096)
+def cloudinary_picture(public_id, version=None, image_format=None, preset='card', attrs=()):
+    cloudinary_url = media_backend.cloudinary().utils.cloudinary_url
+
+    source = _cloudinary_source(public_id, version, image_format)
+    if source is None:
+        # A local file, e.g. from FakeUploader
+        return _plain(f'{public_id}.{image_format}' if image_format else public_id, attrs)
+    public_id, version, image_format = source
+    widths = PRESETS[preset]['widths']
+    sources = [
+        (fmt, [
+            (width, cloudinary_url(
+                public_id, version=version, format=fmt, width=width, secure=True, **CLOUDINARY_TRANSFORMATION
+            )[0])
+            for width in widths
+        ])
+        for fmt in FORMATS
+    ]
+    fallback = sources[-1][1][len(widths) // 2][1]
+    return _picture(sources, fallback, PRESETS[preset]['sizes'], attrs)
+
+
+def thumbnail_picture(course, preset='card', **attrs):
+    """Responsive tag for a course thumbnail"""
+    resource = course.thumbnail
+    if not resource:
+        return ''
+    attrs.setdefault('alt', course.title)
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    return cloudinary_picture(
+        resource.public_id, resource.version, resource.format, preset, tuple(sorted(attrs.items()))
+    )
+
+
+@lru_cache(maxsize=1)
+def static_derivatives():
+    """{static name: {'width': ..., 'sources': {format: [[width, name], ...]}}}"""
+    try:
+        with staticfiles_storage.open(DERIVATIVES_MANIFEST) as source:
+            return json.load(source)
+    except (FileNotFoundError, ValueError, NotImplementedError):
+        return {}
+
+
+@lru_cache(maxsize=256)
+def static_picture(name, preset='half', attrs=()):
+    entry = static_derivatives().get(name)
+    if not entry or not entry['sources']:
+        return _plain(staticfiles_storage.url(name), attrs)
+    sources = [
+        (fmt, [(width, staticfiles_storage.url(derivative)) for width, derivative in derivatives])
+        for fmt, derivatives in entry['sources'].items()
+    ]
+    widths = sources[-1][1]
+    return _picture(sources, widths[len(widths) // 2][1], PRESETS[preset]['sizes'], attrs)
+
+
+def _save_formats():
+    from PIL import Image
+
+    Image.init()
+    return [fmt for fmt in FORMATS if fmt.upper() in Image.SAVE]
+
+
+def derivative_name(name, width, image_format):
+    return f'{os.path.splitext(name)[0]}.{width}w.{image_format}'
+
+
+def build_static_derivatives(storage, paths):
+    """Write resized copies of large static images into storage.
+
+    ``paths`` is the collectstatic mapping of name to (source storage,
+    path). Returns the same mapping for the new files, so they are hashed
+    and compressed along with everything else, and writes the manifest.
+    """
+    from PIL import Image
+
+    formats = _save_formats()
+    created = {}
+    manifest = {}
+    for name, (source_storage, path) in sorted(paths.items()):
+        if not name.startswith(STATIC_DERIVATIVE_DIRS) or not name.lower().endswith(STATIC_SOURCE_EXTENSIONS):
+            continue
+        with source_storage.open(path) as source:
+            image = Image.open(source)
+            image.load()
+        widths = [width for width in STATIC_WIDTHS if width < image.width]
+        if not widths:
+            continue
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        entry = {'width': image.width, 'sources': {}}
+        for width in widths:
+            resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            for image_format in formats:
+                target = derivative_name(name, width, image_format)
+                buffer = io.BytesIO()
+                resized.save(buffer, image_format.upper(), quality=STATIC_QUALITY)
+                if storage.exists(target):
+                    storage.delete(target)
+                storage._save(target, ContentFile(buffer.getvalue()))
+                created[target] = (storage, target)
+                entry['sources'].setdefault(image_format, []).append([width, target])
+        # A small original can serve the widest slot itself
+        original_format = os.path.splitext(name)[1].lower().lstrip('.')
+        if original_format in entry['sources'] and image.width <= STATIC_WIDTHS[-1]:
+            entry['sources'][original_format].append([image.width, name])
+        manifest[name] = entry
+    if storage.exists(DERIVATIVES_MANIFEST):
+        storage.delete(DERIVATIVES_MANIFEST)
+    storage._save(DERIVATIVES_MANIFEST, ContentFile(json.dumps(manifest, indent=2).encode()))
+    return created
+
+
+class StaticDerivativesStorage(CompressedManifestStaticFilesStorage):
+    """WhiteNoise's manifest storage, plus resized copies of large images"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            try:
+                import PIL  # noqa: F401
+            except ImportError:
+                pass
+            else:
+                paths = {**paths, **build_static_derivatives(self, paths)}
+        yield from super().post_process(paths, dry_run=dry_run, **options)
@@ -0,0 +1,260 @@
+"""Per-view query, template and latency metrics with an N+1 detector.
+
+``QueryMetricsMiddleware`` samples METRICS_SAMPLE_RATE of requests. For a
+sampled request it wraps every database connection to count queries and
+time them, and ``TimedDjangoTemplates`` adds up template render time. When
+the request finishes the numbers are folded into in-process aggregates per
+view and one JSON log line is written to the ``main.metrics`` logger.
+
+The same SQL shape repeated N_PLUS_ONE_THRESHOLD or more times within one
+request is flagged as an N+1 suspect. That is usually a loop that runs one
+query per row.
+
+``views.metrics`` serves the aggregates in the Prometheus text format.
+Every worker process keeps its own aggregates, so scrape each worker or
+sum them in Prometheus.
+"""
+import contextvars
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger('main.metrics')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# IN (%s, %s, ...) lists of any length share a fingerprint
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+_sample = contextvars.ContextVar('metrics_sample', default=None)
+
+
+class RequestSample:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.shapes = Counter()
+        self.exact = Counter()
+        self.examples = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+            shape = IN_LIST_RE.sub('IN (...)', sql)
+            self.shapes[shape] += 1
+            self.examples.setdefault(shape, sql)
+            if not many:
+                self.exact[(sql, repr(params))] += 1
+
+    def n_plus_one_suspects(self):
+        threshold = settings.N_PLUS_ONE_THRESHOLD
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    @property
+    def duplicate_queries(self):
+        return sum(count - 1 for count in self.exact.values() if count > 1)
+
+
+def fingerprint(sql):
+    return hashlib.sha1(sql.encode()).hexdigest()[:12]
+
+
+class _TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        sample = _sample.get()
+        if sample is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            sample.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders of sampled requests"""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
+
+
+class _ViewStats:
+    __slots__ = ('requests', 'seconds', 'buckets', 'queries', 'db_seconds', 'template_seconds',
+                 'duplicate_queries', 'n_plus_one')
+
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.duplicate_queries = 0
+        self.n_plus_one = 0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(_ViewStats)
+
+    def observe(self, view, seconds, sample):
+        with self._lock:
+            stats = self._views[view]
+            stats.requests += 1
+            stats.seconds += seconds
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[index] += 1
+            stats.queries += sample.queries
+            stats.db_seconds += sample.db_seconds
+            stats.template_seconds += sample.template_seconds
+            stats.duplicate_queries += sample.duplicate_queries
+            stats.n_plus_one += len(sample.n_plus_one_suspects())
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def exposition(self):
+        """Aggregates in the Prometheus text exposition format"""
+        with self._lock:
+            views = {view: stats for view, stats in sorted(self._views.items())}
+            lines = [
+                '# HELP skillmate_request_seconds Latency of sampled requests per view',
+                '# TYPE skillmate_request_seconds histogram',
+            ]
+            for view, stats in views.items():
+                label = _label(view)
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    lines.append(f'skillmate_request_seconds_bucket{{view="{label}",le="{bound}"}} {count}')
+                lines.append(f'skillmate_request_seconds_bucket{{view="{label}",le="+Inf"}} {stats.requests}')
+                lines.append(f'skillmate_request_seconds_sum{{view="{label}"}} {stats.seconds:.6f}')
+                lines.append(f'skillmate_request_seconds_count{{view="{label}"}} {stats.requests}')
+            counters = [
+                ('db_queries_total', 'Database queries run by sampled requests', 'queries', '{}'),
+                ('db_seconds_total', 'Time spent in the database by sampled requests', 'db_seconds', '{:.6f}'),
+                ('template_seconds_total', 'Time spent rendering templates by sampled requests', 'template_seconds', '{:.6f}'),
+                ('duplicate_queries_total', 'Queries repeated with identical SQL and parameters', 'duplicate_queries', '{}'),
+                ('n_plus_one_suspects_total', 'Query shapes repeated past N_PLUS_ONE_THRESHOLD in one request', 'n_plus_one', '{}'),
+            ]
+            for name, help_text, attribute, number in counters:
+                lines.append(f'# HELP skillmate_{name} {help_text}')
+                lines.append(f'# TYPE skillmate_{name} counter')
+                for view, stats in views.items():
+                    value = number.format(getattr(stats, attribute))
+                    lines.append(f'skillmate_{name}{{view="{_label(view)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+registry = Registry()
+
+
+def _wrap_connections(stack, sample):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(sample))
+
+
+class QueryMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        sample = RequestSample()
+        token = _sample.set(sample)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                _wrap_connections(stack, sample)
+                response = self.get_response(request)
+        finally:
+            _sample.reset(token)
+        self._observe(request, response, time.perf_counter() - started, sample)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        sample = RequestSample()
+        token = _sample.set(sample)
+        started = time.perf_counter()
+        try:
+            # Connections are per thread, so wrap the ones of the thread that
+            # runs this request's ORM calls rather than the event loop's
+            stack = ExitStack()
+            await sync_to_async(_wrap_connections)(stack, sample)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            _sample.reset(token)
+        self._observe(request, response, time.perf_counter() - started, sample)
+        return response
+
+    def _observe(self, request, response, seconds, sample):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        registry.observe(view, seconds, sample)
+        self._log(request, response, view, seconds, sample)
+
+    def _log(self, request, response, view, seconds, sample):
+        suspects = sample.n_plus_one_suspects()
+        record = {
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'seconds': round(seconds, 6),
+            'queries': sample.queries,
+            'db_seconds': round(sample.db_seconds, 6),
+            'template_seconds': round(sample.template_seconds, 6),
+            'duplicate_queries': sample.duplicate_queries,
+            'n_plus_one': [
+                {'fingerprint': fingerprint(shape), 'count': count, 'sql': sample.examples[shape][:300]}
+                for shape, count in suspects
+            ],
+        }
+        logger.log(logging.WARNING if suspects else logging.INFO, json.dumps(record))
+
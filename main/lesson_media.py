@@ -0,0 +1,149 @@
+"""Lesson video metadata: YouTube ids, durations and course totals.
+
+``Lesson.save`` stores the parsed video id and duration so templates never
+run the URL regex, and ``Lesson.objects.refresh_totals`` keeps the lesson
+count and total length on Chapter and Course. Video metadata from an
+external service is optional and only fetched by the
+``backfill_lesson_media`` command, through the provider named in
+``settings.VIDEO_METADATA_PROVIDER``:
+
+* ``NullProvider`` (the default) never fetches anything.
+* ``YouTubeProvider`` asks the YouTube Data API for video durations; it
+  needs ``settings.YOUTUBE_API_KEY``.
+* ``FakeProvider`` answers with a fixed duration and works offline.
+"""
+import json
+import re
+import urllib.parse
+import urllib.request
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+YOUTUBE_ID_RE = re.compile(
+    r'(?:youtube\.com\/(?:[^\/]+\/.+\/|(?:v|embed|shorts)\/|.*[?&]v=)|youtu\.be\/)([a-zA-Z0-9_-]{11})'
+)
+# "15:30", "1:02:03", "90" (seconds) or "1h 2m 3s"
+CLOCK_RE = re.compile(r'^(?:(\d+):)?(\d+):(\d{1,2})$')
+UNITS_RE = re.compile(r'^(?:(\d+)\s*h)?\s*(?:(\d+)\s*m(?:in)?)?\s*(?:(\d+)\s*s)?$', re.IGNORECASE)
+ISO_DURATION_RE = re.compile(r'^PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?$')
+
+
+def parse_youtube_id(url):
+    match = YOUTUBE_ID_RE.search(url or '')
+    return match.group(1) if match else ''
+
+
+def parse_duration(text):
+    """Seconds in a free-text lesson duration, or 0 if it cannot be read"""
+    text = (text or '').strip()
+    if not text:
+        return 0
+    if text.isdigit():
+        return int(text)
+    match = CLOCK_RE.match(text)
+    if match:
+        hours, minutes, seconds = match.groups()
+        return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+    match = UNITS_RE.match(text)
+    if match and any(match.groups()):
+        hours, minutes, seconds = (int(value or 0) for value in match.groups())
+        return hours * 3600 + minutes * 60 + seconds
+    return 0
+
+
+def format_clock(seconds):
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f'{hours}:{minutes:02d}:{seconds:02d}'
+    return f'{minutes}:{seconds:02d}'
+
+
+def format_duration(seconds):
+    hours, remainder = divmod(seconds or 0, 3600)
+    minutes = remainder // 60
+    if hours:
+        return f'{hours}h {minutes}m'
+    return f'{minutes}m'
+
+
+class NullProvider:
+    def fetch(self, video_ids):
+        return {}
+
+
+class FakeProvider:
+    """Offline stand-in that reports every video as ten minutes long"""
+    duration_seconds = 600
+
+    def fetch(self, video_ids):
+        return {video_id: {'duration_seconds': self.duration_seconds} for video_id in video_ids}
+
+
+class YouTubeProvider:
+    endpoint = 'https://www.googleapis.com/youtube/v3/videos'
+    # The API accepts up to 50 ids per call
+    batch_size = 50
+
+    def fetch(self, video_ids):
+        video_ids = list(video_ids)
+        metadata = {}
+        for start in range(0, len(video_ids), self.batch_size):
+            query = urllib.parse.urlencode({
+                'part': 'contentDetails',
+                'id': ','.join(video_ids[start:start + self.batch_size]),
+                'key': settings.YOUTUBE_API_KEY,
+            })
+            with urllib.request.urlopen(f'{self.endpoint}?{query}', timeout=10) as response:
+                items = json.load(response).get('items', [])
+            for item in items:
+                match = ISO_DURATION_RE.match(item['contentDetails'].get('duration', ''))
+                if match:
+                    hours, minutes, seconds = (int(value or 0) for value in match.groups())
+                    metadata[item['id']] = {'duration_seconds': hours * 3600 + minutes * 60 + seconds}
+        return metadata
+
+
+def get_provider():
+    return import_string(settings.VIDEO_METADATA_PROVIDER)()
+
+
+def backfill(batch_size=500, provider=None):
+    """Re-parse every lesson, fill blank durations from the provider and
+    recompute every course's totals; returns the number of lessons changed"""
+    from .models import Course, Lesson
+
+    provider = provider or get_provider()
+    updated = 0
+    lessons = Lesson.objects.only('id', 'youtube_url', 'duration', 'video_id', 'duration_seconds').order_by('id')
+
+    def flush(batch):
+        missing = {lesson.video_id for lesson in batch if lesson.video_id and not lesson.duration.strip()}
+        metadata = provider.fetch(missing) if missing else {}
+        changed = []
+        for lesson, stored in batch.items():
+            seconds = metadata.get(lesson.video_id, {}).get('duration_seconds')
+            if seconds and not lesson.duration.strip():
+                # Keep the text field the source of truth so a later save agrees
+                lesson.duration = format_clock(seconds)
+            lesson.duration_seconds = parse_duration(lesson.duration)
+            if (lesson.video_id, lesson.duration, lesson.duration_seconds) != stored:
+                changed.append(lesson)
+        Lesson.objects.bulk_update(changed, ['video_id', 'duration', 'duration_seconds'], batch_size=batch_size)
+        return len(changed)
+
+    batch = {}
+    for lesson in lessons.iterator(chunk_size=batch_size):
+        batch[lesson] = (lesson.video_id, lesson.duration, lesson.duration_seconds)
+        lesson.video_id = parse_youtube_id(lesson.youtube_url)
+        if len(batch) >= batch_size:
+            updated += flush(batch)
+            batch = {}
+    if batch:
+        updated += flush(batch)
+
+    # Refresh every course, not just the changed ones, to repair any drift
+    for course_id in Course.objects.values_list('id', flat=True).iterator():
+        Lesson.objects.refresh_totals(course_id)
+    return updated
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from main import lesson_media
+
+
+class Command(BaseCommand):
+    help = 'Store parsed video ids and durations on every lesson and recompute course totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--provider', help='Dotted path of a metadata provider, overriding VIDEO_METADATA_PROVIDER')
+
+    def handle(self, *args, **options):
+        provider = import_string(options['provider'])() if options['provider'] else None
+        updated = lesson_media.backfill(batch_size=options['batch_size'], provider=provider)
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} lessons'))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Request every URL in main.urls, report p50/p95 latency and query counts, and fail over budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Measured requests per URL')
+        parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per URL first')
+        parser.add_argument('--anonymous', action='store_true', help='Request every URL signed out')
+        parser.add_argument('--only', nargs='+', metavar='NAME', help='Only these URL names')
+        parser.add_argument('--budgets', help='Budget file, overriding BENCHMARK_BUDGETS')
+        parser.add_argument('--write-budgets', action='store_true', help='Store this run as the new budgets')
+        parser.add_argument('--headroom', type=float, default=3.0, help='Latency multiplier used by --write-budgets')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        try:
+            results = benchmark.run(
+                anonymous=options['anonymous'],
+                only=options['only'],
+                repeat=options['repeat'],
+                warmup=options['warmup'],
+            )
+        except benchmark.BenchmarkError as e:
+            raise CommandError(str(e))
+
+        budgets = benchmark.load_budgets(options['budgets'])
+        failures = []
+        self.stdout.write(f'{"view":<26} {"method":<6} {"status":>6} {"p50 ms":>9} {"p95 ms":>9} {"queries":>8}')
+        for result in results:
+            problems = benchmark.over_budget(result, budgets, anonymous=options['anonymous'])
+            line = (
+                f'{result.name:<26} {result.method:<6} {result.status:>6} '
+                f'{result.p50_ms:>9.1f} {result.p95_ms:>9.1f} {result.queries:>8}'
+            )
+            if problems and not options['write_budgets']:
+                failures.append(f'{result.name}: {", ".join(problems)}')
+                line = self.style.ERROR(f'{line}  over budget')
+            self.stdout.write(line)
+
+        if options['write_budgets']:
+            benchmark.write_budgets(
+                results, budgets, options['budgets'], anonymous=options['anonymous'], headroom=options['headroom'],
+            )
+            self.stdout.write(self.style.SUCCESS(f'Stored budgets for {len(results)} views'))
+            return
+        if failures:
+            raise CommandError('Over budget:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS(f'All {len(results)} views within budget'))
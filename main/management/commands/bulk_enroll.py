@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.enrollments import bulk_enroll
+from main.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Enroll a list of users (one username or email per line) in a course'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', help='Course slug')
+        parser.add_argument('file', nargs='?', help='File with one username or email per line; stdin if omitted')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        course = Course.objects.filter(slug=options['course']).first()
+        if course is None:
+            raise CommandError(f'Unknown course "{options["course"]}"')
+        if options['file']:
+            with open(options['file']) as source:
+                identifiers = source.read().splitlines()
+        else:
+            identifiers = sys.stdin.read().splitlines()
+
+        result = bulk_enroll(course, identifiers, batch_size=options['batch_size'])
+        for value in result['unknown']:
+            self.stderr.write(f'Unknown user: {value}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Enrolled {result["enrolled"]} users, {result["already_enrolled"]} were already enrolled'
+        ))
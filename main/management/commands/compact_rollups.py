@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main import analytics
+
+
+class Command(BaseCommand):
+    help = 'Rebuild recent activity rollups from the raw tables and drop old hourly buckets and learner rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2, help='How many days back to recompute')
+        parser.add_argument('--hourly-retention-days', type=int, default=14)
+        parser.add_argument(
+            '--learner-retention-days', type=int, default=None,
+            help='How long daily per-learner activity rows are kept; defaults to the hourly retention',
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        written = analytics.rebuild(since)
+        pruned = analytics.prune(options['hourly_retention_days'], options['learner_retention_days'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} buckets, pruned {pruned} hourly buckets'))
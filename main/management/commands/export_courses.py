@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import transfer
+from main.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Export course trees, optionally with enrollments and progress, as streamed NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Destination path; '-' for stdout, .gz to compress")
+        parser.add_argument('--course', action='append', default=[], help='Only export the course with this slug; repeatable')
+        parser.add_argument('--with-activity', action='store_true', help='Include enrollments, progress and certificates')
+        parser.add_argument('--batch-size', type=int, default=transfer.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        courses = None
+        if options['course']:
+            courses = Course.objects.filter(slug__in=options['course'])
+            unknown = set(options['course']) - set(courses.values_list('slug', flat=True))
+            if unknown:
+                raise CommandError(f'Unknown courses: {", ".join(sorted(unknown))}')
+
+        stream = transfer.open_stream(options['file'], 'w')
+        try:
+            counts = transfer.export(stream, courses, activity=options['with_activity'], batch_size=options['batch_size'])
+        finally:
+            if options['file'] != '-':
+                stream.close()
+        # Keep stdout clean for the export itself
+        report = self.stderr if options['file'] == '-' else self.stdout
+        for name, count in counts.items():
+            if name != 'header':
+                report.write(f'{count:>10} {name}')
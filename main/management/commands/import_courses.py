@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main import transfer
+
+
+class Command(BaseCommand):
+    help = 'Import an NDJSON course export; run it again on the same file to resume after a failure'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Export to import; '-' for stdin, .gz if compressed")
+        parser.add_argument('--batch-size', type=int, default=transfer.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        stream = transfer.open_stream(options['file'], 'r')
+        try:
+            header, counts = transfer.import_stream(stream, source=options['file'], batch_size=options['batch_size'])
+        except transfer.TransferError as e:
+            raise CommandError(e)
+        finally:
+            if options['file'] != '-':
+                stream.close()
+        for name, count in counts.items():
+            self.stdout.write(f'{count:>10} {name}')
+        self.stdout.write(self.style.SUCCESS(f'Imported export {header["export_id"]}'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import avatars
+
+
+class Command(BaseCommand):
+    help = 'Copy new or changed social account pictures into AVATAR_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Mirror everything pending and exit')
+        parser.add_argument('--backfill', action='store_true', help='First create avatars for users without one')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds to wait when nothing is pending')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.stdout.write(f'Created {avatars.backfill()} avatars')
+        while True:
+            mirrored = avatars.mirror_pending(options['batch_size'])
+            if mirrored:
+                self.stdout.write(f'Mirrored {mirrored} avatars')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
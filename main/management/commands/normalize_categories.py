@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils.text import slugify
+
+from main import catalog
+from main.models import Category, Course
+
+
+class Command(BaseCommand):
+    help = 'Backfill Course.category_slug and rebuild Category rows and course counts'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        # Fill the slug column without going through Course.save/signals
+        changed = []
+        for course in Course.objects.only('id', 'category', 'category_slug').iterator():
+            slug = slugify(course.category) or 'uncategorized'
+            if course.category_slug != slug:
+                course.category_slug = slug
+                changed.append(course)
+        Course.objects.bulk_update(changed, ['category_slug'], batch_size=500)
+
+        # The first spelling seen for a slug becomes the display name
+        names = {}
+        for slug, name in Course.objects.order_by('id').values_list('category_slug', 'category').iterator():
+            names.setdefault(slug, name)
+
+        # Only READY courses are listed, so only they are counted
+        counts = dict(
+            Course.objects.filter(status=Course.STATUS_READY)
+            .values_list('category_slug').annotate(total=Count('id')).order_by()
+        )
+        for slug in names.keys() - counts.keys():
+            counts[slug] = 0
+        for slug, total in counts.items():
+            Category.objects.update_or_create(
+                slug=slug, defaults={'name': names.get(slug, slug), 'course_count': total}
+            )
+        Category.objects.exclude(slug__in=counts).update(course_count=0)
+        catalog.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {len(changed)} courses across {len(counts)} categories'
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from main.models import Course, CourseProgress, LessonProgress
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized CourseProgress rows from LessonProgress'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', help='Only rebuild rows for the course with this slug')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.all()
+        if options['course']:
+            courses = courses.filter(slug=options['course'])
+
+        rebuilt = 0
+        for course in courses.iterator():
+            user_ids = (
+                LessonProgress.objects.filter(lesson__chapter__course=course)
+                .values_list('user_id', flat=True)
+                .distinct()
+            )
+            for user_id in user_ids:
+                CourseProgress.objects.rebuild(user_id, course.id)
+                rebuilt += 1
+            CourseProgress.objects.refresh_totals(course.id)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} course progress rows'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from main.models import Course, Lesson
+
+
+class Command(BaseCommand):
+    help = 'Recompute the course-wide Lesson.position index used for navigation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', help='Only resequence the course with this slug')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.all()
+        if options['course']:
+            courses = courses.filter(slug=options['course'])
+
+        total = 0
+        for course_id in courses.values_list('id', flat=True).iterator():
+            total += Lesson.objects.resequence(course_id)
+
+        self.stdout.write(self.style.SUCCESS(f'Resequenced {total} lessons'))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import certificates
+
+
+class Command(BaseCommand):
+    help = 'Render HTML and PDF artifacts for newly issued certificates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Render everything pending and exit')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds to wait when nothing is pending')
+
+    def handle(self, *args, **options):
+        while True:
+            rendered = certificates.render_pending(options['batch_size'])
+            if rendered:
+                self.stdout.write(f'Rendered {rendered} certificates')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import media, uploads
+
+
+class Command(BaseCommand):
+    help = 'Process queued course media uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent uploads per batch')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--stale-minutes', type=int, default=30)
+        parser.add_argument('--expire-every', type=float, default=3600, help='Seconds between sweeps of abandoned chunked uploads')
+
+    def handle(self, *args, **options):
+        next_expiry = 0
+        while True:
+            if time.monotonic() >= next_expiry:
+                expired = uploads.expire_uploads()
+                if expired:
+                    self.stdout.write(f'Removed {expired} abandoned uploads')
+                next_expiry = time.monotonic() + options['expire_every']
+            media.requeue_stale(options['stale_minutes'])
+            processed = media.run_once(batch_size=options['batch_size'], max_workers=options['workers'])
+            if processed:
+                self.stdout.write(f'Processed {processed} media jobs')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
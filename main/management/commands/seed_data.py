@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main import analytics, catalog, search, seeding
+
+
+class Command(BaseCommand):
+    help = 'Seed a synthetic dataset of instructors, courses, learners and their activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='seed', help='Username prefix shared by every seeded user')
+        parser.add_argument('--instructors', type=int, default=20)
+        parser.add_argument('--courses', type=int, default=200)
+        parser.add_argument('--chapters', type=int, default=5, help='Mean chapters per course')
+        parser.add_argument('--lessons', type=int, default=6, help='Mean lessons per chapter')
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--enrollments', type=float, default=3, help='Mean enrollments per student')
+        parser.add_argument('--completion-rate', type=float, default=0.1, help='Share of enrollments that finish')
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for instructor, category and course popularity')
+        parser.add_argument('--days', type=int, default=180, help='Spread activity over this many days')
+        parser.add_argument('--seed', type=int, help='Random seed for a reproducible dataset')
+        parser.add_argument('--flush', action='store_true', help='Delete an existing dataset with the same prefix first')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if min(options['instructors'], options['courses'], options['chapters'], options['lessons'], options['students']) < 1:
+            raise CommandError('Every count must be at least 1')
+        if options['enrollments'] < 1:
+            raise CommandError('--enrollments must be at least 1')
+
+        if options['flush']:
+            removed = seeding.flush(prefix)
+            self.stdout.write(f'Removed {removed} seeded users')
+        elif User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f'A dataset with prefix "{prefix}" exists; use --flush or another --prefix')
+
+        counts = seeding.generate(
+            prefix=prefix,
+            instructors=options['instructors'],
+            courses=options['courses'],
+            chapters=options['chapters'],
+            lessons=options['lessons'],
+            students=options['students'],
+            enrollments=options['enrollments'],
+            completion_rate=options['completion_rate'],
+            skew=options['skew'],
+            days=options['days'],
+            seed=options['seed'],
+        )
+        for name, count in counts.items():
+            self.stdout.write(f'{count:>10} {name}')
+
+        # Bulk inserts skip the signals that keep these up to date
+        call_command('normalize_categories', stdout=self.stdout)
+        self.stdout.write(f'Indexed {search.rebuild()} search documents')
+        written = analytics.rebuild(timezone.now() - timedelta(days=options['days'] + 1))
+        self.stdout.write(f'Rebuilt {written} activity buckets')
+        catalog.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded "{prefix}"; every seeded user signs in with the password "{seeding.SEED_PASSWORD}"'
+        ))
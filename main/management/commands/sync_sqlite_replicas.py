@@ -0,0 +1,28 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database onto every configured replica file (local replica stand-in)'
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if 'sqlite3' not in primary['ENGINE']:
+            raise CommandError('Only SQLite databases can be copied this way')
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('No replicas configured; set DATABASE_REPLICAS')
+
+        source = sqlite3.connect(str(primary['NAME']))
+        try:
+            for alias in settings.REPLICA_DATABASES:
+                target = sqlite3.connect(str(settings.DATABASES[alias]['NAME']))
+                try:
+                    # The backup API takes a consistent snapshot even while the primary is in use
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f'Copied primary to {alias}'))
+        finally:
+            source.close()
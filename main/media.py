@@ -0,0 +1,178 @@
+"""Background upload of course media.
+
+``views.upload`` takes the files staged by main.uploads, saves the course
+in the ``processing`` state and queues one MediaJob per asset. The
+``run_media_worker`` command claims pending jobs, pushes every asset of a
+batch to the media backend concurrently and fills in the course once all
+of its jobs have finished. A failed upload is retried after RETRY_DELAY,
+up to MEDIA_JOB_MAX_ATTEMPTS times in all; then the job fails for good and
+its staged file is removed.
+
+The backend is chosen by ``settings.MEDIA_UPLOADER``; ``FakeUploader``
+copies files under MEDIA_ROOT so the pipeline runs without Cloudinary.
+"""
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import media_backend
+from .models import Course, MediaJob
+
+RETRY_DELAY = timedelta(minutes=1)
+
+
+class CloudinaryUploader:
+    def upload(self, path, resource_type='image'):
+        import cloudinary.uploader
+
+        media_backend.cloudinary()
+        if resource_type == 'video':
+            # Videos go up in chunks so a large file never has to fit one request
+            return cloudinary.uploader.upload_large(path, resource_type='video')
+        if resource_type == 'image':
+            # Build the responsive thumbnail derivatives in the background now,
+            # so the first visitor does not wait for them
+            from . import images
+
+            return cloudinary.uploader.upload(
+                path, resource_type='image', eager=images.eager_transformations(), eager_async=True,
+            )
+        return cloudinary.uploader.upload(path, resource_type=resource_type)
+
+
+class FakeUploader:
+    """Stand-in for Cloudinary that copies files under MEDIA_ROOT"""
+    folder = 'fake-cloudinary'
+
+    def upload(self, path, resource_type='image'):
+        name = f'{uuid.uuid4().hex}{os.path.splitext(path)[1]}'
+        target_dir = os.path.join(settings.MEDIA_ROOT, self.folder, resource_type)
+        os.makedirs(target_dir, exist_ok=True)
+        shutil.copyfile(path, os.path.join(target_dir, name))
+        return {
+            'public_id': name,
+            'resource_type': resource_type,
+            'secure_url': f'{settings.MEDIA_URL}{self.folder}/{resource_type}/{name}',
+        }
+
+
+def get_uploader():
+    return import_string(settings.MEDIA_UPLOADER)()
+
+
+def queue_upload(course, field, path, resource_type='image'):
+    return MediaJob.objects.create(
+        course=course, field=field, source_path=path, resource_type=resource_type
+    )
+
+
+def claim_jobs(limit):
+    """Move up to ``limit`` pending jobs to running and return them.
+
+    The conditional UPDATE makes claiming safe with several workers, even
+    on databases without SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+    claimed = []
+    # Jobs that already failed once wait RETRY_DELAY before the next try
+    due = Q(attempts=0) | Q(updated_at__lt=timezone.now() - RETRY_DELAY)
+    candidates = MediaJob.objects.filter(due, status=MediaJob.STATUS_PENDING).values_list('id', flat=True)[:limit]
+    for job_id in list(candidates):
+        if MediaJob.objects.filter(id=job_id, status=MediaJob.STATUS_PENDING).update(
+            status=MediaJob.STATUS_RUNNING, updated_at=timezone.now()
+        ):
+            claimed.append(job_id)
+    return list(MediaJob.objects.filter(id__in=claimed).select_related('course'))
+
+
+def requeue_stale(minutes=30):
+    """Hand jobs back to the queue if their worker died mid-upload"""
+    cutoff = timezone.now() - timedelta(minutes=minutes)
+    return MediaJob.objects.filter(status=MediaJob.STATUS_RUNNING, updated_at__lt=cutoff).update(
+        status=MediaJob.STATUS_PENDING
+    )
+
+
+def _upload(uploader, job):
+    try:
+        return uploader.upload(job.source_path, resource_type=job.resource_type), None
+    except Exception as e:
+        return None, e
+
+
+def process_jobs(jobs, uploader=None, max_workers=4):
+    """Upload a batch of jobs concurrently and record the results"""
+    if not jobs:
+        return 0
+    uploader = uploader or get_uploader()
+
+    # Network transfers run in threads; database writes stay on this thread
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(lambda job: _upload(uploader, job), jobs))
+
+    for job, (result, error) in zip(jobs, results):
+        job.attempts += 1
+        if error is None:
+            job.status = MediaJob.STATUS_DONE
+            job.result_url = result['secure_url']
+            job.error = ''
+            course = job.course
+            setattr(course, job.field, result['secure_url'])
+            course.save(update_fields=[job.field])
+            if os.path.exists(job.source_path):
+                os.remove(job.source_path)
+        elif job.attempts < settings.MEDIA_JOB_MAX_ATTEMPTS:
+            job.status = MediaJob.STATUS_PENDING
+            job.error = str(error)
+        else:
+            job.status = MediaJob.STATUS_FAILED
+            job.error = str(error)
+            if os.path.exists(job.source_path):
+                os.remove(job.source_path)
+        job.save(update_fields=['status', 'result_url', 'error', 'attempts', 'updated_at'])
+
+    for course_id in {job.course_id for job in jobs}:
+        finish_course(course_id)
+    return len(jobs)
+
+
+def finish_course(course_id):
+    """Mark a course ready or failed once none of its jobs are outstanding"""
+    with transaction.atomic():
+        statuses = set(MediaJob.objects.filter(course_id=course_id).values_list('status', flat=True))
+        if statuses & {MediaJob.STATUS_PENDING, MediaJob.STATUS_RUNNING}:
+            return
+        course = Course.objects.filter(id=course_id).first()
+        if course is None:
+            return
+        status = Course.STATUS_FAILED if MediaJob.STATUS_FAILED in statuses else Course.STATUS_READY
+        if course.status != status:
+            course.status = status
+            course.save(update_fields=['status'])
+
+
+def run_once(batch_size=10, uploader=None, max_workers=4):
+    return process_jobs(claim_jobs(batch_size), uploader=uploader, max_workers=max_workers)
+
+
+def job_status(course):
+    return {
+        'course': course.slug,
+        'status': course.status,
+        'jobs': [
+            {
+                'field': job.field,
+                'status': job.status,
+                'url': job.result_url,
+                'error': job.error,
+            }
+            for job in course.media_jobs.all()
+        ],
+    }
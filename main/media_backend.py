@@ -0,0 +1,135 @@
+"""Lazily loaded media backend.
+
+The cloudinary SDK pulls in urllib3, certifi and friends, which costs more
+than a tenth of a second at import. Nothing but URL building and uploads
+needs it, so it is only imported, and configured from
+``settings.CLOUDINARY``, the first time ``cloudinary()`` is called.
+Workers and management commands that never touch media never pay for it.
+
+``MediaField`` stores the same strings as ``cloudinary.models.CloudinaryField``
+(``image/upload/v123/public_id.jpg``, or a full delivery URL written by
+the media worker), but loads them as a plain ``MediaResource``.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import models
+
+STORED_VALUE_RE = re.compile(
+    r'(?:(?P<resource_type>image|raw|video)/(?P<type>upload|private|authenticated)/)?'
+    r'(?:v(?P<version>\d+)/)?'
+    r'(?P<public_id>.*?)'
+    r'(\.(?P<format>[^.]+))?$'
+)
+
+
+@lru_cache(maxsize=None)
+def cloudinary():
+    """The cloudinary package, imported and configured on first use"""
+    import cloudinary
+
+    cloudinary.config(**settings.CLOUDINARY)
+    return cloudinary
+
+
+class MediaResource:
+    """A stored media reference; builds its delivery URL on demand"""
+
+    def __init__(self, name, public_id, version=None, format=None, type='upload', resource_type='image'):
+        self.name = name
+        self.public_id = public_id
+        self.version = version
+        self.format = format
+        self.type = type
+        self.resource_type = resource_type
+
+    @classmethod
+    def parse(cls, name, type='upload', resource_type='image'):
+        match = STORED_VALUE_RE.match(name)
+        return cls(
+            name,
+            match.group('public_id'),
+            version=match.group('version'),
+            format=match.group('format'),
+            type=match.group('type') or type,
+            resource_type=match.group('resource_type') or resource_type,
+        )
+
+    def __str__(self):
+        return self.name
+
+    def __bool__(self):
+        return bool(self.public_id)
+
+    def __len__(self):
+        return len(self.name)
+
+    def __eq__(self, other):
+        if isinstance(other, MediaResource):
+            return self.name == other.name
+        return self.name == other
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return f'<MediaResource: {self.name}>'
+
+    @property
+    def is_external(self):
+        """True for full URLs and local paths, which are served as they are"""
+        return self.public_id.startswith(('http://', 'https://', '/'))
+
+    def build_url(self, **options):
+        if self.is_external:
+            return f'{self.public_id}.{self.format}' if self.format else self.public_id
+        options = {
+            'format': self.format, 'version': self.version, 'type': self.type,
+            'resource_type': self.resource_type, **options,
+        }
+        return cloudinary().utils.cloudinary_url(self.public_id, **options)[0]
+
+    @property
+    def url(self):
+        return self.build_url()
+
+
+class MediaField(models.CharField):
+    """Drop-in for CloudinaryField that does not import cloudinary"""
+    description = 'A media resource stored in Cloudinary'
+
+    def __init__(self, *args, type='upload', resource_type='image', **kwargs):
+        self.type = type
+        self.resource_type = resource_type
+        kwargs['max_length'] = 255
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs['max_length']
+        if self.type != 'upload':
+            kwargs['type'] = self.type
+        if self.resource_type != 'image':
+            kwargs['resource_type'] = self.resource_type
+        return name, path, args, kwargs
+
+    def _resource(self, value):
+        return MediaResource.parse(value, type=self.type, resource_type=self.resource_type)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return self._resource(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, MediaResource):
+            return value
+        return self._resource(super().to_python(value))
+
+    def get_prep_value(self, value):
+        # CharField's version would turn the string back into a resource
+        if isinstance(value, MediaResource):
+            return value.name
+        value = models.Field.get_prep_value(self, value)
+        return value if value is None else str(value)
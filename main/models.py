@@ -1,16 +1,44 @@
-from django.db import models
-from cloudinary.models import CloudinaryField
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce, Greatest
 from django.utils.text import slugify
 from django.contrib.auth.models import User
 from django.urls import reverse
-import re
+import uuid
+
+from .lesson_media import format_clock, format_duration, parse_duration, parse_youtube_id
+from .media_backend import MediaField
 
 # Create your models here.
 
 class library(models.Model):
     title = models.CharField(max_length=100)
     description = models.CharField(max_length=255)
-    image = CloudinaryField('image')
+    image = MediaField('image')
+
+class CategoryManager(models.Manager):
+    def adjust(self, slug, delta, name=''):
+        """Shift the stored course count of a category, creating it on first use"""
+        category, created = self.get_or_create(slug=slug, defaults={'name': name or slug})
+        # Clamped, so a count that drifted to 0 never fails the course save
+        self.filter(pk=category.pk).update(course_count=Greatest(models.F('course_count') + delta, 0))
+
+class Category(models.Model):
+    """Normalized course category; Course.category_slug points here by slug.
+
+    course_count only counts READY courses, like the catalog lists them.
+    """
+    name = models.CharField(max_length=255)
+    slug = models.SlugField(max_length=255, unique=True)
+    course_count = models.PositiveIntegerField(default=0)
+    
+    objects = CategoryManager()
+    
+    class Meta:
+        ordering = ['name']
+        verbose_name_plural = 'categories'
+    
+    def __str__(self):
+        return self.name
 
 class Course(models.Model):
     LEVEL_CHOICES = [
@@ -19,31 +47,63 @@ class Course(models.Model):
         ('Advanced', 'Advanced')
     ]
 
+    STATUS_PROCESSING = 'processing'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_READY, 'Ready'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
     id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=255)
     slug = models.SlugField(unique=True)
     description = models.TextField()
-    thumbnail = CloudinaryField('thumbnail')
-    featured_video = CloudinaryField('featured_video')
+    thumbnail = MediaField('thumbnail')
+    featured_video = MediaField('featured_video')
     instructor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='courses', default=None)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     level = models.CharField(max_length=20, choices=LEVEL_CHOICES, default='Beginner')
     duration = models.CharField(max_length=10, default='0')
     category = models.CharField(max_length=255, default="uncategorized")
+    category_slug = models.SlugField(max_length=255, default='uncategorized', editable=False, db_index=True)
     price = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
     discount = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_READY, help_text='Media upload state, see main.media')
+    # Derived from the lessons, see LessonManager.refresh_totals
+    lesson_count = models.PositiveIntegerField(default=0, editable=False)
+    total_duration_seconds = models.PositiveIntegerField(default=0, editable=False)
 
     requirements = models.TextField(help_text='Enter the requirements for the course, separated by a comma.', default='')
     content = models.TextField(help_text='Enter the course content, separated by a comma.', default='')
 
-    students = models.ManyToManyField(User, related_name='enrolled_courses', blank=True)
+    # Stored in Enrollment, the single source of truth for who is enrolled
+    students = models.ManyToManyField(User, through='Enrollment', related_name='enrolled_courses', blank=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order used by main.catalog
+            models.Index(fields=['-created_at', '-id'], name='course_catalog_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Remember the stored category and status so signals can move the
+        # course counts, which only include READY courses
+        self._loaded_category_slug = self.__dict__.get('category_slug') if self.pk else None
+        self._loaded_status = self.__dict__.get('status') if self.pk else None
 
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
-        self.slug = slugify(self.title)
+        # Kept once set, so URLs stay put and de-duplicated slugs (see
+        # main.transfer) survive later edits
+        if not self.slug:
+            self.slug = slugify(self.title)
+        self.category_slug = slugify(self.category) or 'uncategorized'
         super().save(*args, **kwargs)
 
     def get_instructor_username(self):
@@ -56,29 +116,27 @@ class Course(models.Model):
         return [content.strip() for content in self.content.split(',') if content.strip()]
     
     def get_total_lessons(self):
-        return Lesson.objects.filter(chapter__course=self).count()
+        return self.lesson_count
     
-    def get_progress_percentage(self, user):
+    def get_duration_display(self):
+        """Total lesson length if known, otherwise the duration the instructor typed"""
+        if self.total_duration_seconds:
+            return format_duration(self.total_duration_seconds)
+        return f'{self.duration} Hours'
+    
+    def get_user_progress(self, user):
+        """Return the denormalized CourseProgress row for this user, or None"""
         if not user.is_authenticated:
-            return 0
-        total_lessons = self.get_total_lessons()
-        if total_lessons == 0:
-            return 0
-        completed_lessons = LessonProgress.objects.filter(
-            user=user, lesson__chapter__course=self, completed=True
-        ).count()
-        return int((completed_lessons / total_lessons) * 100)
+            return None
+        return CourseProgress.objects.for_user(user, self)
+    
+    def get_progress_percentage(self, user):
+        progress = self.get_user_progress(user)
+        return progress.percentage if progress else 0
     
     def is_completed_by_user(self, user):
-        if not user.is_authenticated:
-            return False
-        total_lessons = self.get_total_lessons()
-        if total_lessons == 0:
-            return False
-        completed_lessons = LessonProgress.objects.filter(
-            user=user, lesson__chapter__course=self, completed=True
-        ).count()
-        return completed_lessons >= total_lessons
+        progress = self.get_user_progress(user)
+        return progress.is_complete if progress else False
     
 class Chapter(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='chapters')
@@ -86,16 +144,104 @@ class Chapter(models.Model):
     description = models.TextField(blank=True)
     order = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
+    lesson_count = models.PositiveIntegerField(default=0, editable=False)
+    total_duration_seconds = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         ordering = ['order']
         unique_together = ['course', 'order']
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Remember the stored order so signals can detect a reorder
+        self._loaded_order = self.__dict__.get('order') if self.pk else None
+    
     def __str__(self):
         return f'{self.course.title} - Chapter {self.order}: {self.title}'
     
     def get_lessons_count(self):
-        return self.lessons.count()
+        return self.lesson_count
+    
+    def get_duration_display(self):
+        return format_duration(self.total_duration_seconds)
+
+class LessonManager(models.Manager):
+    def resequence(self, course_id):
+        """Renumber the course-wide position of every lesson in a course.
+
+        Positions follow chapter order then lesson order, starting at 1, so
+        next/previous navigation becomes a positional lookup.
+        """
+        lessons = list(
+            self.filter(chapter__course_id=course_id)
+            .order_by('chapter__order', 'order', 'id')
+            .only('id', 'position')
+        )
+        changed = []
+        for position, lesson in enumerate(lessons, start=1):
+            if lesson.position != position:
+                lesson.position = position
+                changed.append(lesson)
+        if changed:
+            self.bulk_update(changed, ['position'], batch_size=500)
+        return len(lessons)
+    
+    @transaction.atomic
+    def renumber(self, chapter_ids):
+        """Close the gaps in lesson order within chapters, keeping the current sequence.
+
+        Returns the ids of the courses whose lessons moved; their positions
+        are resequenced here because bulk_update skips the signals.
+        """
+        lessons = list(
+            self.filter(chapter_id__in=chapter_ids)
+            .order_by('chapter_id', 'order', 'id')
+            .only('id', 'chapter_id', 'order', 'chapter__course_id')
+            .select_related('chapter')
+        )
+        # Park the moved lessons past every used number first, so no
+        # intermediate state breaks unique (chapter, order)
+        offset = max((lesson.order for lesson in lessons), default=0) + 1
+        changed = []
+        order = {}
+        for lesson in lessons:
+            order[lesson.chapter_id] = order.get(lesson.chapter_id, 0) + 1
+            if lesson.order != order[lesson.chapter_id]:
+                lesson.order = order[lesson.chapter_id]
+                changed.append(lesson)
+        if not changed:
+            return set()
+        self.filter(id__in=[lesson.id for lesson in changed]).update(order=models.F('order') + offset)
+        self.bulk_update(changed, ['order'], batch_size=500)
+        course_ids = {lesson.chapter.course_id for lesson in changed}
+        for course_id in course_ids:
+            self.resequence(course_id)
+        return course_ids
+    
+    def refresh_totals(self, course_id):
+        """Store lesson counts and summed durations on a course and its chapters"""
+        totals = {
+            row['chapter_id']: row
+            for row in self.filter(chapter__course_id=course_id)
+            .values('chapter_id')
+            .annotate(count=models.Count('id'), seconds=models.Sum('duration_seconds'))
+            .order_by()
+        }
+        chapters = list(Chapter.objects.filter(course_id=course_id).only('id', 'lesson_count', 'total_duration_seconds'))
+        changed = []
+        for chapter in chapters:
+            row = totals.get(chapter.id, {})
+            values = (row.get('count', 0), row.get('seconds') or 0)
+            if values != (chapter.lesson_count, chapter.total_duration_seconds):
+                chapter.lesson_count, chapter.total_duration_seconds = values
+                changed.append(chapter)
+        if changed:
+            Chapter.objects.bulk_update(changed, ['lesson_count', 'total_duration_seconds'])
+        # update() rather than save() so the course signals do not fire again
+        Course.objects.filter(id=course_id).update(
+            lesson_count=sum(row['count'] for row in totals.values()),
+            total_duration_seconds=sum(row['seconds'] or 0 for row in totals.values()),
+        )
 
 class Lesson(models.Model):
     chapter = models.ForeignKey(Chapter, on_delete=models.CASCADE, related_name='lessons')
@@ -103,61 +249,55 @@ class Lesson(models.Model):
     description = models.TextField(blank=True)
     youtube_url = models.URLField(help_text='YouTube video URL')
     order = models.PositiveIntegerField(default=1)
+    position = models.PositiveIntegerField(default=0, editable=False, db_index=True, help_text='Position in the whole course, maintained by main.signals')
     duration = models.CharField(max_length=20, help_text='Duration in format like "15:30"', blank=True)
+    # Parsed from youtube_url and duration on save, see main.lesson_media
+    video_id = models.CharField(max_length=11, blank=True, editable=False)
+    duration_seconds = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = LessonManager()
+    
     class Meta:
         ordering = ['order']
         unique_together = ['chapter', 'order']
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Remember the stored placement so signals can detect a reorder
+        self._loaded_placement = (self.__dict__.get('chapter_id'), self.__dict__.get('order')) if self.pk else None
+        self._loaded_duration_seconds = self.__dict__.get('duration_seconds') if self.pk else None
+    
     def __str__(self):
         return f'{self.chapter.course.title} - {self.chapter.title} - Lesson {self.order}: {self.title}'
     
+    def save(self, *args, **kwargs):
+        self.video_id = parse_youtube_id(self.youtube_url)
+        self.duration_seconds = parse_duration(self.duration)
+        super().save(*args, **kwargs)
+    
     def get_youtube_embed_id(self):
-        """Extract YouTube video ID from URL for embedding"""
-        youtube_regex = r'(?:youtube\.com\/(?:[^\/]+\/.+\/|\/watch\?v=|watch\?feature=player_embedded&v=|embed\/|user\/[^\/]+\/)|youtu\.be\/)([a-zA-Z0-9_-]{11})'
-        match = re.search(youtube_regex, self.youtube_url)
-        return match.group(1) if match else None
+        """YouTube video ID for embedding, stored on save"""
+        return self.video_id or None
+    
+    def get_duration_display(self):
+        return format_clock(self.duration_seconds) if self.duration_seconds else self.duration
+    
+    def get_lesson_at(self, position):
+        """Get the lesson at a 1-based position in this lesson's course"""
+        if position < 1:
+            return None
+        return Lesson.objects.filter(
+            chapter__course_id=self.chapter.course_id, position=position
+        ).first()
     
     def get_next_lesson(self):
         """Get the next lesson in the course sequence"""
-        # Try to get next lesson in the same chapter
-        next_in_chapter = Lesson.objects.filter(
-            chapter=self.chapter, order__gt=self.order
-        ).first()
-        
-        if next_in_chapter:
-            return next_in_chapter
-        
-        # If no next lesson in chapter, get first lesson of next chapter
-        next_chapter = Chapter.objects.filter(
-            course=self.chapter.course, order__gt=self.chapter.order
-        ).first()
-        
-        if next_chapter:
-            return next_chapter.lessons.first()
-        
-        return None
+        return self.get_lesson_at(self.position + 1)
     
     def get_previous_lesson(self):
         """Get the previous lesson in the course sequence"""
-        # Try to get previous lesson in the same chapter
-        prev_in_chapter = Lesson.objects.filter(
-            chapter=self.chapter, order__lt=self.order
-        ).last()
-        
-        if prev_in_chapter:
-            return prev_in_chapter
-        
-        # If no previous lesson in chapter, get last lesson of previous chapter
-        prev_chapter = Chapter.objects.filter(
-            course=self.chapter.course, order__lt=self.chapter.order
-        ).last()
-        
-        if prev_chapter:
-            return prev_chapter.lessons.last()
-        
-        return None
+        return self.get_lesson_at(self.position - 1)
     
     def is_completed_by_user(self, user):
         if not user.is_authenticated:
@@ -176,15 +316,127 @@ class LessonProgress(models.Model):
     class Meta:
         unique_together = ['user', 'lesson']
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Remember the stored state so signals can detect a completed flip
+        self._loaded_completed = self.__dict__.get('completed', False) if self.pk else False
+    
     def __str__(self):
         status = 'Completed' if self.completed else 'In Progress'
         return f'{self.user.username} - {self.lesson.title} ({status})'
 
+class CourseProgressManager(models.Manager):
+    def for_user(self, user, course):
+        """Get the progress row for user and course, building it on first access"""
+        progress = self.filter(user=user, course=course).first()
+        if progress is None:
+            progress, created = self.get_or_create(
+                user=user,
+                course=course,
+                defaults=self.count_for(user.pk, course.pk),
+            )
+        return progress
+    
+    async def afor_user(self, user, course):
+        progress = await self.filter(user=user, course=course).afirst()
+        if progress is None:
+            progress, created = await self.aget_or_create(
+                user=user,
+                course=course,
+                defaults=await self.acount_for(user.pk, course.pk),
+            )
+        return progress
+    
+    def count_for(self, user_id, course_id):
+        """Count completed and total lessons from the raw tables"""
+        return {
+            'completed_lessons': LessonProgress.objects.filter(
+                user_id=user_id, lesson__chapter__course_id=course_id, completed=True
+            ).count(),
+            'total_lessons': Lesson.objects.filter(chapter__course_id=course_id).count(),
+        }
+    
+    def recount(self, course_id, user_ids=None):
+        """Recount completed and total lessons of a course's rows with one UPDATE"""
+        completed = (
+            LessonProgress.objects.filter(
+                user_id=models.OuterRef('user_id'), lesson__chapter__course_id=course_id, completed=True
+            )
+            .order_by().values('user_id').annotate(total=models.Count('id')).values('total')
+        )
+        rows = self.filter(course_id=course_id)
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        rows.update(
+            completed_lessons=Coalesce(models.Subquery(completed), 0),
+            total_lessons=Lesson.objects.filter(chapter__course_id=course_id).count(),
+        )
+    
+    async def acount_for(self, user_id, course_id):
+        return {
+            'completed_lessons': await LessonProgress.objects.filter(
+                user_id=user_id, lesson__chapter__course_id=course_id, completed=True
+            ).acount(),
+            'total_lessons': await Lesson.objects.filter(chapter__course_id=course_id).acount(),
+        }
+    
+    def rebuild(self, user_id, course_id):
+        """Recount a single row from the raw tables"""
+        progress, created = self.update_or_create(
+            user_id=user_id,
+            course_id=course_id,
+            defaults=self.count_for(user_id, course_id),
+        )
+        return progress
+    
+    def add_completed(self, user_id, course_id, delta):
+        """Shift the completed counter of an existing row.
+
+        Missing rows are left alone; for_user builds them on first access.
+        """
+        self.filter(user_id=user_id, course_id=course_id).update(
+            completed_lessons=models.F('completed_lessons') + delta
+        )
+    
+    def refresh_totals(self, course_id):
+        """Store the current lesson count on every progress row of a course"""
+        total = Lesson.objects.filter(chapter__course_id=course_id).count()
+        self.filter(course_id=course_id).update(total_lessons=total)
+
+class CourseProgress(models.Model):
+    """Denormalized per-user course progress, kept in sync by main.signals"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='course_progress')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='user_progress')
+    completed_lessons = models.PositiveIntegerField(default=0)
+    total_lessons = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = CourseProgressManager()
+    
+    class Meta:
+        unique_together = ['user', 'course']
+    
+    def __str__(self):
+        return f'{self.user.username} - {self.course.title} ({self.completed_lessons}/{self.total_lessons})'
+    
+    @property
+    def percentage(self):
+        if self.total_lessons == 0:
+            return 0
+        return min(100, int((self.completed_lessons / self.total_lessons) * 100))
+    
+    @property
+    def is_complete(self):
+        return self.total_lessons > 0 and self.completed_lessons >= self.total_lessons
+
 class Certificate(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='certificates')
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='certificates')
     issued_at = models.DateTimeField(auto_now_add=True)
     certificate_id = models.CharField(max_length=50, unique=True)
+    # Set by main.certificates once the HTML and PDF artifacts are on disk
+    rendered_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    artifact_etag = models.CharField(max_length=64, blank=True)
     
     class Meta:
         unique_together = ['user', 'course']
@@ -198,10 +450,185 @@ class Certificate(models.Model):
             self.certificate_id = f'CERT-{uuid.uuid4().hex[:8].upper()}'
         super().save(*args, **kwargs)
 
+class EnrollmentManager(models.Manager):
+    def enroll(self, course, student):
+        """Enroll a student with a single INSERT; returns False if already enrolled"""
+        try:
+            with transaction.atomic():
+                self.create(course=course, student=student)
+        except IntegrityError:
+            return False
+        return True
+
+    def is_enrolled(self, course, student):
+        return student.is_authenticated and self.filter(course=course, student=student).exists()
+
+    async def ais_enrolled(self, course, student):
+        return student.is_authenticated and await self.filter(course=course, student=student).aexists()
+
+    @transaction.atomic
+    def enroll_many(self, course, student_ids, batch_size=1000):
+        """Enroll many users at once with batched inserts; returns the ids that were new"""
+        from . import analytics
+
+        enrolled = []
+        student_ids = list(dict.fromkeys(student_ids))
+        for start in range(0, len(student_ids), batch_size):
+            batch = student_ids[start:start + batch_size]
+            existing = set(self.filter(course=course, student_id__in=batch).values_list('student_id', flat=True))
+            new_ids = [student_id for student_id in batch if student_id not in existing]
+            self.bulk_create(
+                [self.model(course=course, student_id=student_id) for student_id in new_ids],
+                ignore_conflicts=True,
+            )
+            enrolled.extend(new_ids)
+        # bulk_create skips post_save, so the activity rollups are fed here
+        if enrolled:
+            analytics.record_many(course.id, enrolled, enrollments=len(enrolled))
+        return enrolled
+
 class Enrollment(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='enrollments')
     enrolled_at = models.DateTimeField(auto_now_add=True)
 
+    objects = EnrollmentManager()
+
+    class Meta:
+        unique_together = ['course', 'student']
+        indexes = [
+            models.Index(fields=['course', 'enrolled_at'], name='enrollment_course_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.student.username} enrolled in {self.course.title}'
+
+class MediaJob(models.Model):
+    """A staged course asset waiting to be pushed to the media backend"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='media_jobs')
+    field = models.CharField(max_length=50, help_text='Course field that receives the uploaded URL')
+    resource_type = models.CharField(max_length=20, default='image')
+    source_path = models.CharField(max_length=500)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    result_url = models.URLField(max_length=500, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f'{self.course.title} - {self.field} ({self.status})'
+
+class ChunkedUpload(models.Model):
+    """A file uploaded in parts to local staging, see main.uploads"""
+    STATUS_UPLOADING = 'uploading'
+    STATUS_COMPLETE = 'complete'
+    STATUS_CONSUMED = 'consumed'
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, 'Uploading'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_CONSUMED, 'Consumed'),
+    ]
+
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chunked_uploads')
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, help_text='Expected hex digest, checked on completion')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_UPLOADING)
+    path = models.CharField(max_length=500)
+    leased_until = models.DateTimeField(null=True, blank=True, help_text='Set while a request writes the next chunk')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.total_size})'
+
+class ActivityRollup(models.Model):
+    """Per-course activity counters for one hour or one day, see main.analytics"""
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITY_CHOICES = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    ]
+
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='activity_rollups')
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    enrollments = models.PositiveIntegerField(default=0)
+    lesson_completions = models.PositiveIntegerField(default=0)
+    course_completions = models.PositiveIntegerField(default=0)
+    active_learners = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['course', 'granularity', 'bucket_start']
+
+    def __str__(self):
+        return f'{self.course.title} - {self.granularity} {self.bucket_start:%Y-%m-%d %H:%M}'
+
+class LearnerActivity(models.Model):
+    """Marks a learner as already counted in an ActivityRollup bucket"""
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    granularity = models.CharField(max_length=4, choices=ActivityRollup.GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['course', 'granularity', 'bucket_start', 'user']
+
+
+class Avatar(models.Model):
+    """Resolved avatar of a user, see main.avatars"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='avatar')
+    url = models.CharField(max_length=255)
+    # Social account picture to mirror into AVATAR_ROOT, blank for a generated avatar
+    source_url = models.URLField(max_length=500, blank=True)
+    mirrored_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['mirrored_at', 'updated_at'])]
+
+    def __str__(self):
+        return f'Avatar of {self.user_id}'
+
+
+class CourseImport(models.Model):
+    """Progress of an NDJSON course import, so a failed run can resume; see main.transfer"""
+    export_id = models.CharField(max_length=32, unique=True)
+    source = models.CharField(max_length=255, blank=True)
+    # Last line of the file whose batch has been committed
+    lines_done = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
-        return f'{self.student.username} enrolled in {self.course.title}'
\ No newline at end of file
+        return f'Import {self.export_id} ({self.source})'
+
+
+class ImportedKey(models.Model):
+    """Id of a row in the exporting database mapped to the row an import created"""
+    run = models.ForeignKey(CourseImport, on_delete=models.CASCADE, related_name='keys')
+    kind = models.CharField(max_length=20)
+    source_id = models.PositiveBigIntegerField()
+    target_id = models.PositiveBigIntegerField()
+
+    class Meta:
+        unique_together = ['run', 'kind', 'source_id']
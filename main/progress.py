@@ -0,0 +1,186 @@
+"""Batched lesson-progress ingestion.
+
+Clients that buffer progress (offline sessions, video player heartbeats)
+send many completion events in one request. Events are deduplicated per
+lesson, written with a single upsert, and the course counters, activity
+rollups and certificates are settled once per affected course. Replaying a
+batch changes nothing.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import analytics
+from .models import ActivityRollup, Certificate, Course, CourseProgress, Enrollment, Lesson, LessonProgress
+
+MAX_EVENTS = 500
+
+
+class ProgressError(Exception):
+    pass
+
+
+def parse_events(events):
+    """Return {lesson id: completed_at}, keeping the earliest time per lesson"""
+    if not isinstance(events, list):
+        raise ProgressError('Expected a list of events')
+    if len(events) > MAX_EVENTS:
+        raise ProgressError(f'At most {MAX_EVENTS} events per request')
+    now = timezone.now()
+    completions = {}
+    for event in events:
+        if not isinstance(event, dict):
+            event = {'lesson': event}
+        try:
+            lesson_id = int(event.get('lesson'))
+        except (TypeError, ValueError):
+            raise ProgressError('Every event needs a lesson id')
+        raw = event.get('completed_at')
+        if raw in (None, ''):
+            completed_at = now
+        else:
+            try:
+                completed_at = parse_datetime(str(raw))
+            except ValueError:
+                completed_at = None
+            if completed_at is None:
+                raise ProgressError(f'Invalid completed_at for lesson {lesson_id}')
+        if timezone.is_naive(completed_at):
+            completed_at = timezone.make_aware(completed_at)
+        # Client clocks may run ahead
+        completed_at = min(completed_at, now)
+        if lesson_id not in completions or completed_at < completions[lesson_id]:
+            completions[lesson_id] = completed_at
+    return completions
+
+
+@transaction.atomic
+def ingest(user, events):
+    completions = parse_events(events)
+    lesson_courses = dict(
+        Lesson.objects.filter(id__in=completions).values_list('id', 'chapter__course_id')
+    )
+    enrolled = set(
+        Enrollment.objects.filter(student=user, course_id__in=set(lesson_courses.values()))
+        .values_list('course_id', flat=True)
+    )
+    accepted = {lesson_id: completed_at for lesson_id, completed_at in completions.items()
+                if lesson_courses.get(lesson_id) in enrolled}
+    rejected = sorted(set(completions) - set(accepted))
+
+    already_completed = set(
+        LessonProgress.objects.filter(user=user, lesson_id__in=accepted, completed=True)
+        .values_list('lesson_id', flat=True)
+    )
+    new = {lesson_id: completed_at for lesson_id, completed_at in accepted.items()
+           if lesson_id not in already_completed}
+    LessonProgress.objects.bulk_create(
+        [
+            LessonProgress(user=user, lesson_id=lesson_id, completed=True, completed_at=completed_at)
+            for lesson_id, completed_at in new.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user', 'lesson'],
+        update_fields=['completed', 'completed_at'],
+    )
+
+    # The upsert bypasses post_save, so settle the counters here. A recount
+    # rather than a delta, so overlapping batches cannot count a lesson twice
+    per_course = {lesson_courses[lesson_id] for lesson_id in new}
+    per_bucket = Counter(
+        (lesson_courses[lesson_id], analytics.bucket_start(completed_at, ActivityRollup.HOUR))
+        for lesson_id, completed_at in new.items()
+    )
+    for course_id in per_course:
+        CourseProgress.objects.recount(course_id, [user.id])
+    for (course_id, bucket), count in per_bucket.items():
+        analytics.record(course_id, user.id, bucket, lesson_completions=count)
+
+    affected = {lesson_courses[lesson_id] for lesson_id in accepted}
+    return {
+        'applied': len(new),
+        'duplicates': len(accepted) - len(new),
+        'rejected': rejected,
+        'courses': _settle_courses(user, affected),
+    }
+
+
+def mark_completed(queryset):
+    """Complete the incomplete LessonProgress rows of a queryset, through ingest.
+
+    Rows are grouped by user and applied MAX_EVENTS at a time, so counters,
+    rollups and certificates settle as for client events. Returns
+    (applied, rejected); rows whose user is no longer enrolled are rejected.
+    """
+    lessons = defaultdict(list)
+    users = {}
+    for progress in queryset.filter(completed=False).select_related('user').only('user', 'lesson_id'):
+        users[progress.user_id] = progress.user
+        lessons[progress.user_id].append(progress.lesson_id)
+    applied = rejected = 0
+    for user_id, lesson_ids in lessons.items():
+        for start in range(0, len(lesson_ids), MAX_EVENTS):
+            result = ingest(users[user_id], lesson_ids[start:start + MAX_EVENTS])
+            applied += result['applied']
+            rejected += len(result['rejected'])
+    return applied, rejected
+
+
+def delete(queryset):
+    """Delete LessonProgress rows and recount the CourseProgress rows they counted towards"""
+    users = defaultdict(set)
+    for course_id, user_id in queryset.values_list('lesson__chapter__course_id', 'user_id').distinct():
+        users[course_id].add(user_id)
+    deleted, _ = queryset.delete()
+    for course_id, user_ids in users.items():
+        CourseProgress.objects.recount(course_id, user_ids)
+    return deleted
+
+
+def complete_lesson(user, lesson):
+    """Mark one lesson complete for an enrolled user and issue the
+    certificate if that finished the course; the complete_lesson response"""
+    progress, created = LessonProgress.objects.get_or_create(
+        user=user,
+        lesson=lesson,
+        defaults={'completed': True, 'completed_at': timezone.now()}
+    )
+    if not progress.completed:
+        progress.completed = True
+        progress.completed_at = timezone.now()
+        progress.save()
+
+    course = lesson.chapter.course
+    course_progress = course.get_user_progress(user)
+    if course_progress.is_complete:
+        certificate, cert_created = Certificate.objects.get_or_create(user=user, course=course)
+        return {
+            'course_completed': True,
+            'progress_percentage': course_progress.percentage,
+            'certificate_id': certificate.certificate_id,
+        }
+    return {
+        'course_completed': False,
+        'progress_percentage': course_progress.percentage,
+    }
+
+
+def _settle_courses(user, course_ids):
+    """Progress for each course, issuing certificates for finished ones"""
+    certificates = defaultdict(str, Certificate.objects.filter(user=user, course_id__in=course_ids)
+                               .values_list('course_id', 'certificate_id'))
+    results = []
+    for course in Course.objects.filter(id__in=course_ids).only('id', 'slug').order_by('id'):
+        progress = CourseProgress.objects.for_user(user, course)
+        if progress.is_complete and not certificates[course.id]:
+            certificate, created = Certificate.objects.get_or_create(user=user, course=course)
+            certificates[course.id] = certificate.certificate_id
+        results.append({
+            'course': course.slug,
+            'progress_percentage': progress.percentage,
+            'course_completed': progress.is_complete,
+            'certificate_id': certificates[course.id] if progress.is_complete else None,
+        })
+    return results
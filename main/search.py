@@ -0,0 +1,468 @@
+"""Full-text search over courses and lessons.
+
+Interchangeable backends, updated one document at a time from model
+signals (see main.signals):
+
+* ``FTS5Backend`` stores the index in an SQLite FTS5 virtual table and is
+  used automatically when the default database is SQLite.
+* ``PostgresBackend`` stores it in a table with a GIN-indexed tsvector
+  column and is used automatically on PostgreSQL.
+* ``DatabaseBackend`` keeps no index and scans the course and lesson
+  tables with icontains on every search. It is the fallback for any other
+  database and only suits small catalogs.
+* ``MemoryBackend`` keeps the index in process memory. Each worker only sees
+  its own writes, so it is never picked automatically and is meant for tests
+  and single-process development.
+
+Set ``SEARCH_BACKEND`` to ``'fts5'``, ``'postgres'``, ``'database'`` or
+``'memory'`` in settings to force one.
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from .models import Course, Lesson
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+COURSE, LESSON = 'course', 'lesson'
+
+# Title matches outrank body matches
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+SearchDocument = namedtuple('SearchDocument', 'kind object_id course_id title body')
+SearchHit = namedtuple('SearchHit', 'kind object_id course_id title score')
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+def course_document(course):
+    body = ' '.join([course.description, course.requirements, course.content])
+    return SearchDocument(COURSE, course.id, course.id, course.title, body)
+
+
+def lesson_document(lesson, course_id=None):
+    if course_id is None:
+        course_id = lesson.chapter.course_id
+    return SearchDocument(LESSON, lesson.id, course_id, lesson.title, lesson.description)
+
+
+def iter_documents(batch_size=2000):
+    """Every searchable document in the database, streamed in batches"""
+    for course in Course.objects.only('id', 'title', 'description', 'requirements', 'content').iterator(chunk_size=batch_size):
+        yield course_document(course)
+    lessons = Lesson.objects.select_related('chapter').only('id', 'title', 'description', 'chapter__course_id')
+    for lesson in lessons.iterator(chunk_size=batch_size):
+        yield lesson_document(lesson)
+
+
+class FTS5Backend:
+    table = 'main_search_index'
+    vendor = 'sqlite'
+
+    def __init__(self):
+        self._ready = False
+
+    def _rowid(self, kind, object_id):
+        # Courses and lessons share the table; interleave their ids so a
+        # document can be replaced through the rowid index
+        return object_id * 2 + (1 if kind == LESSON else 0)
+
+    def ensure_table(self, using=None):
+        if self._ready and using is None:
+            return
+        with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5('
+                'kind UNINDEXED, object_id UNINDEXED, course_id UNINDEXED, title, body, '
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        self._ready = True
+
+    def index(self, document):
+        self.index_many([document])
+
+    def index_many(self, documents):
+        self.ensure_table()
+        rows = [
+            (self._rowid(doc.kind, doc.object_id), doc.kind, doc.object_id, doc.course_id, doc.title, doc.body)
+            for doc in documents
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, kind, object_id, course_id, title, body) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove(self, kind, object_id):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [self._rowid(kind, object_id)])
+
+    def clear(self):
+        self.ensure_table()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def search(self, query, kind=None, limit=20):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self.ensure_table()
+        # Every term must match, each as a prefix
+        match = ' '.join(f'"{term}"*' for term in terms)
+        sql = (
+            f'SELECT kind, object_id, course_id, title, '
+            f'bm25({self.table}, 0, 0, 0, {TITLE_WEIGHT}, {BODY_WEIGHT}) AS rank '
+            f'FROM {self.table} WHERE {self.table} MATCH %s'
+        )
+        params = [match]
+        if kind:
+            sql += ' AND kind = %s'
+            params.append(kind)
+        sql += ' ORDER BY rank LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            # bm25() is lower-is-better; flip it so higher scores rank first
+            return [
+                SearchHit(row[0], int(row[1]), int(row[2]), row[3], -row[4])
+                for row in cursor.fetchall()
+            ]
+
+
+class PostgresBackend(FTS5Backend):
+    """The FTS5 layout in a regular table, searched through a GIN index.
+
+    Titles get weight A and bodies weight B; ts_rank weighs them like
+    TITLE_WEIGHT and BODY_WEIGHT.
+    """
+    vendor = 'postgresql'
+    rank_weights = f'{{0, 0, {BODY_WEIGHT / TITLE_WEIGHT}, 1}}'
+
+    def ensure_table(self, using=None):
+        if self._ready and using is None:
+            return
+        with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                'rowid bigint PRIMARY KEY, kind varchar(10) NOT NULL, object_id integer NOT NULL, '
+                'course_id integer NOT NULL, title text NOT NULL, document tsvector NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_document ON {self.table} USING GIN (document)')
+        self._ready = True
+
+    def index_many(self, documents):
+        self.ensure_table()
+        rows = [
+            (self._rowid(doc.kind, doc.object_id), doc.kind, doc.object_id, doc.course_id, doc.title, doc.title, doc.body)
+            for doc in documents
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, kind, object_id, course_id, title, document) '
+                "VALUES (%s, %s, %s, %s, %s, setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'B')) "
+                'ON CONFLICT (rowid) DO UPDATE SET course_id = EXCLUDED.course_id, '
+                'title = EXCLUDED.title, document = EXCLUDED.document',
+                rows,
+            )
+
+    def search(self, query, kind=None, limit=20):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self.ensure_table()
+        # Every term must match, each as a prefix; tokenize leaves only word
+        # characters, so no tsquery operators get through
+        match = ' & '.join(f'{term}:*' for term in terms)
+        sql = (
+            f"SELECT kind, object_id, course_id, title, ts_rank(%s::float4[], document, q) AS rank "
+            f"FROM {self.table}, to_tsquery('simple', %s) q WHERE document @@ q"
+        )
+        params = [self.rank_weights, match]
+        if kind:
+            sql += ' AND kind = %s'
+            params.append(kind)
+        sql += ' ORDER BY rank DESC, object_id LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [SearchHit(row[0], row[1], row[2], row[3], row[4]) for row in cursor.fetchall()]
+
+
+class DatabaseBackend:
+    """icontains matching straight against the course and lesson tables.
+
+    There is no index to keep in sync, so every worker sees the same
+    results; a document ranks higher when all terms appear in its title.
+    """
+    searches = (
+        (COURSE, Course, 'id', ('description', 'requirements', 'content')),
+        (LESSON, Lesson, 'chapter__course_id', ('description',)),
+    )
+
+    def index(self, document):
+        pass
+
+    def index_many(self, documents):
+        pass
+
+    def remove(self, kind, object_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, kind=None, limit=20):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        hits = []
+        for search_kind, model, course_field, body_fields in self.searches:
+            if kind and kind != search_kind:
+                continue
+            in_title = Q()
+            matches = Q()
+            for term in terms:
+                in_title &= Q(title__icontains=term)
+                term_match = Q(title__icontains=term)
+                for field in body_fields:
+                    term_match |= Q(**{f'{field}__icontains': term})
+                # Every term must match
+                matches &= term_match
+            rows = (
+                model.objects.filter(matches)
+                .annotate(
+                    course_key=F(course_field),
+                    in_title=Case(When(in_title, then=Value(1)), default=Value(0), output_field=IntegerField()),
+                )
+                .order_by('-in_title', 'id')
+                .values_list('id', 'course_key', 'title', 'in_title')[:limit]
+            )
+            hits.extend(
+                SearchHit(search_kind, object_id, course_id, title, TITLE_WEIGHT if in_title else BODY_WEIGHT)
+                for object_id, course_id, title, in_title in rows
+            )
+        hits.sort(key=lambda hit: (-hit.score, hit.object_id))
+        return hits[:limit]
+
+
+class MemoryBackend:
+    """In-process inverted index with tf-idf ranking and prefix matching.
+
+    Each worker process builds its own copy from the database on the first
+    query and then follows the save/delete signals it sees itself, so writes
+    made by other workers never show up. Only for tests and development.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._postings = defaultdict(dict)  # term -> {doc key: weighted tf}
+        self._documents = {}  # doc key -> (SearchDocument, terms)
+        self._vocabulary = []  # sorted terms, for prefix lookups
+        self._vocabulary_dirty = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                for document in iter_documents():
+                    self._add(document)
+                self._loaded = True
+
+    def _add(self, document):
+        key = (document.kind, document.object_id)
+        self._discard(key)
+        weights = defaultdict(float)
+        for term in tokenize(document.title):
+            weights[term] += TITLE_WEIGHT
+        for term in tokenize(document.body):
+            weights[term] += BODY_WEIGHT
+        for term, weight in weights.items():
+            if term not in self._postings:
+                self._vocabulary_dirty = True
+            self._postings[term][key] = weight
+        self._documents[key] = (document, tuple(weights))
+
+    def _discard(self, key):
+        entry = self._documents.pop(key, None)
+        if entry is None:
+            return
+        for term in entry[1]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+                    self._vocabulary_dirty = True
+
+    def _expand(self, prefix):
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + '\uffff')
+        return self._vocabulary[start:end]
+
+    def index(self, document):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._add(document)
+
+    def index_many(self, documents):
+        for document in documents:
+            self.index(document)
+
+    def remove(self, kind, object_id):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._discard((kind, object_id))
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._vocabulary = []
+            self._vocabulary_dirty = False
+            self._loaded = False
+
+    def search(self, query, kind=None, limit=20):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self._load()
+        with self._lock:
+            total = len(self._documents) or 1
+            scores = None
+            for term in terms:
+                term_scores = defaultdict(float)
+                for word in self._expand(term):
+                    postings = self._postings[word]
+                    idf = math.log(1 + total / len(postings))
+                    for key, weight in postings.items():
+                        term_scores[key] += weight * idf
+                if scores is None:
+                    scores = term_scores
+                else:
+                    # Every term must match
+                    scores = {key: score + term_scores[key] for key, score in scores.items() if key in term_scores}
+                if not scores:
+                    return []
+
+            candidates = scores.items()
+            if kind:
+                candidates = [(key, score) for key, score in candidates if key[0] == kind]
+            best = heapq.nlargest(limit, candidates, key=lambda item: (item[1], -item[0][1]))
+            hits = []
+            for key, score in best:
+                document = self._documents[key][0]
+                hits.append(SearchHit(document.kind, document.object_id, document.course_id, document.title, score))
+        return hits
+
+
+BACKENDS = {
+    'fts5': FTS5Backend,
+    'postgres': PostgresBackend,
+    'database': DatabaseBackend,
+    'memory': MemoryBackend,
+}
+
+# Backends picked when SEARCH_BACKEND is not set, by database vendor
+NATIVE_BACKENDS = {
+    'sqlite': 'fts5',
+    'postgresql': 'postgres',
+}
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'SEARCH_BACKEND', None)
+        if name is None:
+            name = NATIVE_BACKENDS.get(connection.vendor, 'database')
+        _backend = BACKENDS[name]()
+    return _backend
+
+
+def create_index_table(using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate hook: create the index table outside any request transaction"""
+    backend = get_backend()
+    if isinstance(backend, FTS5Backend) and connections[using].vendor == backend.vendor:
+        backend.ensure_table(using=using)
+
+
+def search(query, kind=None, limit=20):
+    return get_backend().search(query, kind=kind, limit=limit)
+
+
+def published_hits(hits):
+    """The hits whose course is READY, like the catalog lists them"""
+    ready = set(
+        Course.objects.filter(id__in={hit.course_id for hit in hits}, status=Course.STATUS_READY)
+        .values_list('id', flat=True)
+    )
+    return [hit for hit in hits if hit.course_id in ready]
+
+
+def search_published(query, limit=20, keep=published_hits):
+    """search() without hits on courses that are not READY.
+
+    The index covers drafts too, so ``keep`` drops them from each result;
+    callers that load the matching rows anyway can pass a function that
+    filters while it loads. The search is widened and repeated only while
+    dropped hits leave fewer than ``limit`` and the index has more.
+    """
+    fetch = limit
+    while True:
+        hits = search(query, limit=fetch)
+        kept = keep(hits)
+        if len(kept) == len(hits) or len(kept) >= limit or len(hits) < fetch:
+            return kept[:limit]
+        fetch *= 4
+
+
+def index_course(course):
+    get_backend().index(course_document(course))
+
+
+def index_lesson(lesson):
+    get_backend().index(lesson_document(lesson))
+
+
+def remove(kind, object_id):
+    get_backend().remove(kind, object_id)
+
+
+def rebuild(batch_size=2000):
+    """Drop and refill the whole index; returns the number of documents"""
+    backend = get_backend()
+    backend.clear()
+    count = 0
+    batch = []
+    for document in iter_documents(batch_size):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            backend.index_many(batch)
+            count += len(batch)
+            batch = []
+    backend.index_many(batch)
+    return count + len(batch)
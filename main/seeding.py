@@ -0,0 +1,219 @@
+"""Synthetic datasets for load tests and the view benchmarks.
+
+``generate`` writes instructors, courses, chapters, lessons, students,
+enrollments, lesson progress and certificates with bulk inserts. Sizes and
+activity are skewed the way real catalogs are: a few instructors own most
+courses, a few courses get most enrollments, most learners take one or two
+courses and most of them drop off early. Every derived table (positions,
+lesson totals, CourseProgress) is written directly, so nothing has to be
+recomputed row by row afterwards. Only the category counts, the search
+index and the activity rollups are left to their usual rebuild functions,
+see the ``seed_data`` command.
+
+All seeded users share one username prefix so a dataset can be removed
+again with ``flush``; deleting the users cascades to everything else.
+That runs the usual delete signals, so it is much slower than seeding.
+"""
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .lesson_media import format_clock
+from .models import Certificate, Chapter, Course, CourseProgress, Enrollment, Lesson, LessonProgress
+
+SEED_PASSWORD = 'seed-password'
+SUBJECTS = [
+    'Python', 'Django', 'JavaScript', 'React', 'SQL', 'Data Science', 'Machine Learning',
+    'Statistics', 'Linux', 'Docker', 'Go', 'Rust', 'Design', 'Marketing', 'Photography',
+    'Guitar', 'Writing', 'Excel',
+]
+TAGLINES = ['Basics', 'in Practice', 'Deep Dive', 'Crash Course', 'Bootcamp', 'Masterclass', 'Projects']
+CATEGORIES = [
+    'Programming', 'Web Development', 'Data Science', 'DevOps', 'Design', 'Business',
+    'Music', 'Photography', 'Writing', 'Productivity',
+]
+VIDEO_ID_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-'
+
+
+def zipf_weights(count, skew):
+    """Weights for ranks 1..count, falling off like 1 / rank ** skew"""
+    return [1 / rank ** skew for rank in range(1, count + 1)]
+
+
+def _around(rng, mean, low=1):
+    """A whole number spread evenly around mean, never below low"""
+    return max(low, round(rng.uniform(low, 2 * mean - low)))
+
+
+def _before(rng, latest, earliest):
+    span = (latest - earliest).total_seconds()
+    return earliest + timedelta(seconds=rng.uniform(0, max(span, 0)))
+
+
+def _backdate(model, rows, field):
+    """Store (object, when) pairs; auto_now_add overwrites them on insert"""
+    for obj, when in rows:
+        setattr(obj, field, when)
+    model.objects.bulk_update([obj for obj, when in rows], [field], batch_size=1000)
+
+
+def _users(prefix, role, count, password):
+    users = [
+        User(
+            username=f'{prefix}-{role}-{number}',
+            email=f'{prefix}-{role}-{number}@example.com',
+            first_name=role.title(),
+            last_name=str(number),
+            password=password,
+        )
+        for number in range(1, count + 1)
+    ]
+    return User.objects.bulk_create(users, batch_size=1000)
+
+
+@transaction.atomic
+def generate(prefix='seed', instructors=20, courses=200, chapters=5, lessons=6, students=2000,
+             enrollments=3, completion_rate=0.1, skew=1.1, days=180, seed=None):
+    """Write one dataset and return the number of rows created per model.
+
+    ``chapters``, ``lessons`` and ``enrollments`` are means: chapters per
+    course, lessons per chapter and enrollments per student. A share of
+    ``completion_rate`` of all enrollments finish their course and get a
+    certificate. Activity is spread over the last ``days`` days.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    start = now - timedelta(days=days)
+    # Hashing is deliberately slow, so every seeded user shares one hash
+    password = make_password(SEED_PASSWORD)
+
+    teachers = _users(prefix, 'instructor', instructors, password)
+    learners = _users(prefix, 'student', students, password)
+
+    # A few instructors and categories hold most of the catalog
+    owners = rng.choices(teachers, weights=zipf_weights(len(teachers), skew), k=courses)
+    categories = rng.choices(CATEGORIES, weights=zipf_weights(len(CATEGORIES), skew), k=courses)
+    course_rows = []
+    for number in range(1, courses + 1):
+        title = f'{rng.choice(SUBJECTS)} {rng.choice(TAGLINES)} {prefix} {number}'
+        category = categories[number - 1]
+        course_rows.append(Course(
+            title=title,
+            slug=slugify(title),
+            description=f'A synthetic {category.lower()} course for load testing.',
+            thumbnail='sample',
+            featured_video='sample',
+            instructor=owners[number - 1],
+            level=rng.choice(Course.LEVEL_CHOICES)[0],
+            category=category,
+            category_slug=slugify(category),
+            price=rng.choice([0, 0, 19, 49, 99]),
+            requirements='A computer, Curiosity',
+            content='Fundamentals, Exercises, A final project',
+        ))
+    course_rows = Course.objects.bulk_create(course_rows, batch_size=500)
+    created = {course: _before(rng, now, start) for course in course_rows}
+    _backdate(Course, created.items(), 'created_at')
+
+    chapter_rows = []
+    for course in course_rows:
+        for order in range(1, _around(rng, chapters) + 1):
+            chapter_rows.append(Chapter(course=course, title=f'Chapter {order}', order=order))
+    chapter_rows = Chapter.objects.bulk_create(chapter_rows, batch_size=1000)
+
+    # Positions and totals are known up front, so no resequencing is needed
+    lesson_rows = []
+    course_lessons = {course.id: [] for course in course_rows}
+    for chapter in chapter_rows:
+        for order in range(1, _around(rng, lessons) + 1):
+            seconds = rng.randint(3 * 60, 25 * 60)
+            video_id = ''.join(rng.choices(VIDEO_ID_CHARS, k=11))
+            lesson = Lesson(
+                chapter=chapter,
+                title=f'Lesson {order}',
+                youtube_url=f'https://www.youtube.com/watch?v={video_id}',
+                order=order,
+                position=len(course_lessons[chapter.course_id]) + 1,
+                duration=format_clock(seconds),
+                video_id=video_id,
+                duration_seconds=seconds,
+            )
+            course_lessons[chapter.course_id].append(lesson)
+            lesson_rows.append(lesson)
+            chapter.lesson_count += 1
+            chapter.total_duration_seconds += seconds
+    Lesson.objects.bulk_create(lesson_rows, batch_size=1000)
+    Chapter.objects.bulk_update(chapter_rows, ['lesson_count', 'total_duration_seconds'], batch_size=1000)
+    for course in course_rows:
+        course.lesson_count = len(course_lessons[course.id])
+        course.total_duration_seconds = sum(lesson.duration_seconds for lesson in course_lessons[course.id])
+    Course.objects.bulk_update(course_rows, ['lesson_count', 'total_duration_seconds'], batch_size=500)
+
+    # Popular courses draw most of the enrollments
+    popularity = zipf_weights(len(course_rows), skew)
+    enrollment_rows = []
+    progress_rows = []
+    lesson_progress_rows = []
+    certificate_rows = []
+    for learner in learners:
+        # Geometric: most learners take one course, a few take many
+        wanted = 1
+        while wanted < len(course_rows) and rng.random() > 1 / enrollments:
+            wanted += 1
+        taken = dict.fromkeys(rng.choices(course_rows, weights=popularity, k=wanted))
+        for course in taken:
+            enrolled_at = _before(rng, now, created[course])
+            enrollment_rows.append((Enrollment(course=course, student=learner), enrolled_at))
+
+            course_lesson_rows = course_lessons[course.id]
+            if rng.random() < completion_rate:
+                done = len(course_lesson_rows)
+            else:
+                # Most learners stop early
+                done = int(len(course_lesson_rows) * rng.betavariate(0.6, 2.5))
+            when = enrolled_at
+            for lesson in course_lesson_rows[:done]:
+                # Somewhere between watching straight through and coming back days later
+                when = min(now, when + timedelta(seconds=rng.randint(lesson.duration_seconds, 3 * 86400)))
+                lesson_progress_rows.append(
+                    LessonProgress(user=learner, lesson=lesson, completed=True, completed_at=when)
+                )
+            progress_rows.append(CourseProgress(
+                user=learner, course=course, completed_lessons=done, total_lessons=len(course_lesson_rows),
+            ))
+            if done and done == len(course_lesson_rows):
+                # Longer than Certificate.save's ids, which collide across large datasets
+                certificate_id = f'CERT-{uuid.uuid4().hex[:16].upper()}'
+                certificate_rows.append((Certificate(user=learner, course=course, certificate_id=certificate_id), when))
+
+    Enrollment.objects.bulk_create([row for row, when in enrollment_rows], batch_size=1000)
+    _backdate(Enrollment, enrollment_rows, 'enrolled_at')
+    LessonProgress.objects.bulk_create(lesson_progress_rows, batch_size=1000)
+    CourseProgress.objects.bulk_create(progress_rows, batch_size=1000)
+    Certificate.objects.bulk_create([row for row, when in certificate_rows], batch_size=1000)
+    _backdate(Certificate, certificate_rows, 'issued_at')
+
+    return {
+        'instructors': len(teachers),
+        'students': len(learners),
+        'courses': len(course_rows),
+        'chapters': len(chapter_rows),
+        'lessons': len(lesson_rows),
+        'enrollments': len(enrollment_rows),
+        'lesson progress': len(lesson_progress_rows),
+        'certificates': len(certificate_rows),
+    }
+
+
+def flush(prefix='seed'):
+    """Delete a seeded dataset; returns the number of users removed"""
+    users = User.objects.filter(username__startswith=f'{prefix}-')
+    count = users.count()
+    users.delete()
+    return count
@@ -0,0 +1,235 @@
+from allauth.socialaccount.models import SocialAccount
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.core.cache import cache
+from django.dispatch import receiver
+
+from . import analytics, avatars, catalog, certificates, course_pages, search, users
+from .models import Avatar, Category, Certificate, Course, Chapter, Enrollment, Lesson, LessonProgress, CourseProgress
+
+
+def _course_id_for_lesson(lesson_id):
+    return Lesson.objects.filter(id=lesson_id).values_list('chapter__course_id', flat=True).first()
+
+
+def _course_id_for_chapter(chapter_id):
+    return Chapter.objects.filter(id=chapter_id).values_list('course_id', flat=True).first()
+
+
+@receiver(post_save, sender=LessonProgress)
+def lesson_progress_saved(sender, instance, **kwargs):
+    # Only a flip of the completed flag changes the course counters
+    if instance.completed != instance._loaded_completed:
+        delta = 1 if instance.completed else -1
+        course_id = _course_id_for_lesson(instance.lesson_id)
+        CourseProgress.objects.add_completed(instance.user_id, course_id, delta)
+        if instance.completed and course_id is not None:
+            analytics.record(course_id, instance.user_id, instance.completed_at, lesson_completions=1)
+    instance._loaded_completed = instance.completed
+
+
+def _cascaded(origin, model):
+    """True when a delete signal comes from deleting a row of another model"""
+    if isinstance(origin, QuerySet):
+        return origin.model is not model
+    return origin is not None and not isinstance(origin, model)
+
+
+def _first_for_course(origin, course_id):
+    """True once per course for one delete.
+
+    Every row of a delete is gone before the first post_delete is sent, so
+    the course only needs settling once, not once per deleted row.
+    """
+    if origin is None:
+        return True
+    settled = origin.__dict__.setdefault('_settled_course_ids', set())
+    if course_id in settled:
+        return False
+    settled.add(course_id)
+    return True
+
+
+def _settle_course(course_id):
+    """Bring positions, totals, progress counters and caches up to date after lessons went away"""
+    Lesson.objects.resequence(course_id)
+    Lesson.objects.refresh_totals(course_id)
+    CourseProgress.objects.recount(course_id)
+    catalog.invalidate()
+    course_pages.invalidate(course_id)
+
+
+# LessonProgress has no delete receiver on purpose: without one, the
+# cascade from a lesson, course or user deletes its rows with a single
+# query. Their counters are settled per course below, or vanish along
+# with CourseProgress.
+
+
+@receiver(post_save, sender=Lesson)
+def lesson_saved(sender, instance, created, **kwargs):
+    placement = (instance.chapter_id, instance.order)
+    moved = created or placement != instance._loaded_placement
+    if moved:
+        course_id = _course_id_for_chapter(instance.chapter_id)
+        Lesson.objects.resequence(course_id)
+        old_course_id = None
+        if instance._loaded_placement is not None:
+            old_course_id = _course_id_for_chapter(instance._loaded_placement[0])
+
+        if old_course_id not in (None, course_id):
+            # A lesson moved to a chapter of another course leaves a gap
+            # behind, and its completions now count towards the new course
+            Lesson.objects.resequence(old_course_id)
+            Lesson.objects.refresh_totals(old_course_id)
+            CourseProgress.objects.recount(old_course_id)
+            CourseProgress.objects.recount(course_id)
+        else:
+            CourseProgress.objects.refresh_totals(course_id)
+
+        instance.position = Lesson.objects.filter(id=instance.id).values_list('position', flat=True).first()
+    if moved or instance.duration_seconds != instance._loaded_duration_seconds:
+        Lesson.objects.refresh_totals(instance.chapter.course_id)
+        # Course cards show the totals
+        catalog.invalidate()
+    instance._loaded_placement = placement
+    instance._loaded_duration_seconds = instance.duration_seconds
+    search.index_lesson(instance)
+    course_pages.invalidate(instance.chapter.course_id)
+
+
+@receiver(post_delete, sender=Lesson)
+def lesson_deleted(sender, instance, origin=None, **kwargs):
+    search.remove(search.LESSON, instance.id)
+    # A chapter delete settles the course in chapter_deleted; a course or
+    # user delete takes everything with it
+    if _cascaded(origin, Lesson):
+        return
+    course_id = _course_id_for_chapter(instance.chapter_id)
+    if course_id is not None and _first_for_course(origin, course_id):
+        _settle_course(course_id)
+
+
+@receiver(post_save, sender=Chapter)
+def chapter_saved(sender, instance, created, **kwargs):
+    if not created and instance.order != instance._loaded_order:
+        Lesson.objects.resequence(instance.course_id)
+    instance._loaded_order = instance.order
+    course_pages.invalidate(instance.course_id)
+
+
+@receiver(post_delete, sender=Chapter)
+def chapter_deleted(sender, instance, origin=None, **kwargs):
+    if not _cascaded(origin, Chapter) and _first_for_course(origin, instance.course_id):
+        _settle_course(instance.course_id)
+
+
+LISTING_FIELDS = {'category_slug', 'status'}
+
+
+def _load_listing(instance):
+    # Instances loaded with .only()/.defer() do not know their stored category or status
+    if instance.pk and (instance._loaded_category_slug is None or instance._loaded_status is None):
+        stored = Course.objects.filter(pk=instance.pk).values_list('category_slug', 'status').first()
+        if stored is not None:
+            instance._loaded_category_slug, instance._loaded_status = stored
+
+
+def _counted_slug(slug, status):
+    """The category a course counts towards, None when it is not listed"""
+    return slug if status == Course.STATUS_READY else None
+
+
+@receiver(pre_save, sender=Course)
+def course_saving(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or LISTING_FIELDS & set(update_fields):
+        _load_listing(instance)
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        old, new = None, _counted_slug(instance.category_slug, instance.status)
+    elif update_fields is not None and not LISTING_FIELDS & set(update_fields):
+        old = new = None
+    elif instance._loaded_category_slug is None or instance._loaded_status is None:
+        # The stored listing is unknown, so leave the counts alone
+        old = new = None
+    else:
+        saved = LISTING_FIELDS if update_fields is None else set(update_fields)
+        old = _counted_slug(instance._loaded_category_slug, instance._loaded_status)
+        new = _counted_slug(
+            instance.category_slug if 'category_slug' in saved else instance._loaded_category_slug,
+            instance.status if 'status' in saved else instance._loaded_status,
+        )
+    if old != new:
+        if old:
+            Category.objects.adjust(old, -1)
+        if new:
+            Category.objects.adjust(new, 1, name=instance.category if new == instance.category_slug else '')
+    if update_fields is None or 'category_slug' in update_fields:
+        instance._loaded_category_slug = instance.category_slug
+    if update_fields is None or 'status' in update_fields:
+        instance._loaded_status = instance.status
+    catalog.invalidate()
+    course_pages.invalidate(instance.id)
+    search.index_course(instance)
+
+
+@receiver(pre_delete, sender=Course)
+def course_deleting(sender, instance, **kwargs):
+    _load_listing(instance)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    counted = _counted_slug(instance._loaded_category_slug, instance._loaded_status)
+    if counted:
+        Category.objects.adjust(counted, -1)
+    catalog.invalidate()
+    search.remove(search.COURSE, instance.id)
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, created, **kwargs):
+    if created:
+        analytics.record(instance.course_id, instance.student_id, instance.enrolled_at, enrollments=1)
+
+
+@receiver(post_save, sender=Certificate)
+def certificate_saved(sender, instance, created, **kwargs):
+    if created:
+        analytics.record(instance.course_id, instance.user_id, instance.issued_at, course_completions=1)
+        # Drop a cached "not found" from a verification hit that came too early
+        cache.delete(certificates.verify_key(instance.certificate_id))
+
+
+@receiver(post_delete, sender=Certificate)
+def certificate_deleted(sender, instance, **kwargs):
+    certificates.forget(instance.certificate_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    users.invalidate(instance.pk)
+    if created and not raw:
+        avatars.track(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    users.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=SocialAccount)
+def social_account_saved(sender, instance, raw=False, **kwargs):
+    # Signing in refreshes the account, so a new profile picture is picked up
+    if not raw:
+        avatars.track(instance.user, avatars.social_avatar_url(instance.user))
+
+
+@receiver(post_save, sender=Avatar)
+def avatar_saved(sender, instance, **kwargs):
+    # Course cards and cached course pages show the instructor's avatar
+    if Course.objects.filter(instructor_id=instance.user_id).exists():
+        catalog.invalidate()
@@ -0,0 +1,115 @@
+"""Measure how long a fresh process takes to get ready to serve.
+
+Every gunicorn worker and every management command starts in a new
+interpreter. It imports the settings, runs ``django.setup()``, and, for a
+worker, loads the URLconf before it can answer its first request. ``run``
+repeats that in a child process started with ``python -X importtime``, so
+the numbers are those of a cold start and nothing this process has
+imported already skews them. It returns:
+
+* the wall time of each phase (settings, app registry, URLconf);
+* the time spent in each ``AppConfig.ready()``;
+* the import time of every module.
+
+``profile_startup`` prints the report, and fails above a time budget so
+boot regressions show up in CI.
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict, namedtuple
+
+Import = namedtuple('Import', 'module self_ms cumulative_ms')
+Report = namedtuple('Report', 'phases ready imports')
+
+# Runs in the child; prints one JSON line with the phase and ready() timings
+PROBE = '''
+import json, time
+started = time.perf_counter()
+phases, ready = {}, {}
+
+from django.apps import AppConfig
+create = AppConfig.create.__func__
+
+
+def timed_create(cls, entry):
+    config = create(cls, entry)
+    original = config.ready
+
+    def timed_ready():
+        begun = time.perf_counter()
+        original()
+        ready[config.name] = (time.perf_counter() - begun) * 1000
+
+    config.ready = timed_ready
+    return config
+
+
+AppConfig.create = classmethod(timed_create)
+
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+phases['settings'] = (time.perf_counter() - started) * 1000
+mark = time.perf_counter()
+django.setup()
+phases['apps'] = (time.perf_counter() - mark) * 1000
+mark = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+phases['urls'] = (time.perf_counter() - mark) * 1000
+phases['total'] = (time.perf_counter() - started) * 1000
+print('STARTUP ' + json.dumps({'phases': phases, 'ready': ready}))
+'''
+
+
+class StartupError(Exception):
+    pass
+
+
+def parse_importtime(text):
+    """Imports listed by ``-X importtime``, in the order they finished"""
+    imports = []
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append(Import(name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return imports
+
+
+def run():
+    """Start a child interpreter with this process's settings and time it"""
+    child = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        capture_output=True, text=True, env=dict(os.environ), cwd=os.getcwd(),
+    )
+    result = next((line for line in child.stdout.splitlines() if line.startswith('STARTUP ')), None)
+    if child.returncode or result is None:
+        errors = [line for line in child.stderr.splitlines() if not line.startswith('import time:')]
+        raise StartupError('\n'.join(errors[-20:]) or f'Exited with status {child.returncode}')
+    timings = json.loads(result[len('STARTUP '):])
+    return Report(timings['phases'], timings['ready'], parse_importtime(child.stderr))
+
+
+def by_package(imports):
+    """{top-level package: ms} of the time spent in each package's own modules"""
+    totals = defaultdict(float)
+    for entry in imports:
+        totals[entry.module.split('.')[0]] += entry.self_ms
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def slowest(imports, limit=20, prefix=None):
+    """The imports with the highest cumulative time, without repeating their children"""
+    selected = []
+    for entry in sorted(imports, key=lambda entry: -entry.cumulative_ms):
+        if prefix and not entry.module.startswith(prefix):
+            continue
+        if any(entry.module.startswith(f'{parent.module}.') for parent in selected):
+            continue
+        selected.append(entry)
+        if len(selected) >= limit:
+            break
+    return selected
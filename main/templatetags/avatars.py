@@ -0,0 +1,16 @@
+from django import template
+
+from main import avatars
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar_url(user):
+    """Local avatar URL of a user; select ``avatar`` with the user to avoid a query"""
+    return avatars.url_for(user)
+
+
+@register.simple_tag
+def generated_avatar_url(seed):
+    return avatars.generated_url(seed)
@@ -0,0 +1,19 @@
+from django import template
+
+from main import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def course_thumbnail(course, preset='card', **attrs):
+    """Course thumbnail as a <picture> of Cloudinary derivatives"""
+    return images.thumbnail_picture(course, preset, **attrs)
+
+
+@register.simple_tag
+def static_picture(name, preset='half', **attrs):
+    """Static image as a <picture> of its collectstatic derivatives"""
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    return images.static_picture(name, preset, tuple(sorted(attrs.items())))
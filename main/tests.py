@@ -1,3 +1,213 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from . import db, media, progress
+from .models import Certificate, Chapter, Course, CourseProgress, Enrollment, Lesson, LessonProgress, MediaJob
+
+
+def make_course(instructor, title, lessons=3, **fields):
+    course = Course.objects.create(
+        title=title, description='d', thumbnail='t', featured_video='v', instructor=instructor, **fields
+    )
+    chapter = Chapter.objects.create(course=course, title='Chapter', order=1)
+    for order in range(1, lessons + 1):
+        Lesson.objects.create(chapter=chapter, title=f'{title} {order}', order=order)
+    return course
+
+
+class ProgressCounterTests(TestCase):
+    def setUp(self):
+        self.instructor = User.objects.create_user('instructor')
+        self.learner = User.objects.create_user('learner')
+        self.course = make_course(self.instructor, 'Python')
+        self.lessons = list(Lesson.objects.filter(chapter__course=self.course).order_by('order'))
+        Enrollment.objects.create(course=self.course, student=self.learner)
+        CourseProgress.objects.for_user(self.learner, self.course)
+
+    def counters(self, course=None):
+        row = CourseProgress.objects.get(user=self.learner, course=course or self.course)
+        return row.completed_lessons, row.total_lessons
+
+    def test_ingest_counts_each_lesson_once(self):
+        result = progress.ingest(self.learner, [self.lessons[0].id, self.lessons[1].id, self.lessons[0].id])
+        self.assertEqual((result['applied'], result['duplicates']), (2, 0))
+        self.assertEqual(self.counters(), (2, 3))
+
+        # Replaying a batch, or overlapping a single completion, changes nothing
+        progress.ingest(self.learner, [self.lessons[0].id, self.lessons[1].id])
+        progress.complete_lesson(self.learner, self.lessons[1])
+        self.assertEqual(self.counters(), (2, 3))
+        self.assertFalse(Certificate.objects.filter(user=self.learner).exists())
+
+    def test_ingest_issues_certificate_when_finished(self):
+        result = progress.ingest(self.learner, [lesson.id for lesson in self.lessons])
+        self.assertEqual(self.counters(), (3, 3))
+        certificate = Certificate.objects.get(user=self.learner, course=self.course)
+        self.assertEqual(result['courses'][0]['certificate_id'], certificate.certificate_id)
+
+    def test_ingest_rejects_lessons_of_other_courses(self):
+        other = make_course(self.instructor, 'Other', lessons=1)
+        result = progress.ingest(self.learner, [Lesson.objects.get(chapter__course=other).id])
+        self.assertEqual((result['applied'], len(result['rejected'])), (0, 1))
+
+    def test_invalid_completed_at(self):
+        for value in ('garbage', '2024-13-45T00:00:00'):
+            with self.assertRaises(progress.ProgressError):
+                progress.ingest(self.learner, [{'lesson': self.lessons[0].id, 'completed_at': value}])
+        self.assertEqual(self.counters(), (0, 3))
+
+    def test_lesson_delete_recounts(self):
+        progress.ingest(self.learner, [self.lessons[0].id, self.lessons[1].id])
+        self.lessons[0].delete()
+        self.assertEqual(self.counters(), (1, 2))
+        self.assertEqual(Course.objects.get(pk=self.course.pk).lesson_count, 2)
+
+    def test_chapter_delete_recounts(self):
+        progress.ingest(self.learner, [self.lessons[0].id])
+        Chapter.objects.get(course=self.course).delete()
+        self.assertEqual(self.counters(), (0, 0))
+
+    def test_lesson_moved_to_another_course(self):
+        other = make_course(self.instructor, 'Other', lessons=1)
+        Enrollment.objects.create(course=other, student=self.learner)
+        CourseProgress.objects.for_user(self.learner, other)
+        progress.ingest(self.learner, [lesson.id for lesson in self.lessons[:2]])
+
+        moved = self.lessons[0]
+        moved.chapter = Chapter.objects.get(course=other)
+        moved.order = 2
+        moved.save()
+        self.assertEqual(self.counters(), (1, 2))
+        self.assertEqual(self.counters(other), (1, 2))
+
+    def test_progress_delete_recounts(self):
+        progress.ingest(self.learner, [lesson.id for lesson in self.lessons[:2]])
+        progress.delete(LessonProgress.objects.filter(lesson=self.lessons[0]))
+        self.assertEqual(self.counters(), (1, 3))
+
+
+class FailingUploader:
+    def upload(self, path, resource_type='image'):
+        raise ConnectionError('media backend unreachable')
+
+
+class MediaJobTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        overrides = override_settings(
+            MEDIA_ROOT=self.root, MEDIA_UPLOADER='main.media.FakeUploader', MEDIA_JOB_MAX_ATTEMPTS=2
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        instructor = User.objects.create_user('instructor')
+        self.course = make_course(instructor, 'Media', lessons=0, status=Course.STATUS_PROCESSING)
+
+    def stage(self, name):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as staged:
+            staged.write(b'image')
+        return path
+
+    def test_jobs_are_claimed_once(self):
+        media.queue_upload(self.course, 'thumbnail', self.stage('a.png'))
+        self.assertEqual(len(media.claim_jobs(10)), 1)
+        self.assertEqual(media.claim_jobs(10), [])
+
+    def test_upload_finishes_course(self):
+        path = self.stage('a.png')
+        media.queue_upload(self.course, 'thumbnail', path)
+        self.assertEqual(media.run_once(), 1)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.status, Course.STATUS_READY)
+        self.assertIn(media.FakeUploader.folder, str(self.course.thumbnail))
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_upload_is_retried_then_given_up(self):
+        path = self.stage('a.png')
+        job = media.queue_upload(self.course, 'thumbnail', path)
+        media.run_once(uploader=FailingUploader())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (MediaJob.STATUS_PENDING, 1))
+        # Not due again before RETRY_DELAY
+        self.assertEqual(media.run_once(uploader=FailingUploader()), 0)
+
+        MediaJob.objects.filter(pk=job.pk).update(updated_at=job.updated_at - media.RETRY_DELAY)
+        media.run_once(uploader=FailingUploader())
+        job.refresh_from_db()
+        self.course.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (MediaJob.STATUS_FAILED, 2))
+        self.assertEqual(self.course.status, Course.STATUS_FAILED)
+        self.assertFalse(os.path.exists(path))
+
+
+@override_settings(REPLICA_DATABASES=['replica1'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(TestCase):
+    """Routing decisions only; the replica alias is never queried"""
+
+    def setUp(self):
+        patcher = mock.patch.object(db, 'choose_replica', return_value='replica1')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = db.PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        self.routes = []
+
+    def request(self, request, write=False):
+        @db.replica_reads
+        def view(request):
+            self.routes.append(self.router.db_for_read(Course))
+            if write:
+                self.router.db_for_write(Course)
+                self.routes.append(self.router.db_for_read(Course))
+            return HttpResponse()
+
+        def handler(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = db.ReplicaRoutingMiddleware(handler)
+        return middleware(request)
+
+    def test_reads_go_to_replica(self):
+        response = self.request(self.factory.get('/'))
+        self.assertEqual(self.routes, ['replica1'])
+        self.assertNotIn(db.STICKY_COOKIE, response.cookies)
+
+    def test_write_pins_request_and_client_to_primary(self):
+        response = self.request(self.factory.get('/'), write=True)
+        self.assertEqual(self.routes, ['replica1', 'default'])
+        cookie = response.cookies[db.STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+
+        request = self.factory.get('/')
+        request.COOKIES[db.STICKY_COOKIE] = cookie.value
+        self.request(request)
+        self.assertEqual(self.routes[-1], 'default')
+
+    def test_expired_pin_reads_replica_again(self):
+        request = self.factory.get('/')
+        request.COOKIES[db.STICKY_COOKIE] = '0'
+        self.request(request)
+        self.assertEqual(self.routes, ['replica1'])
+
+    def test_unsafe_methods_and_sessions_use_primary(self):
+        self.request(self.factory.post('/'))
+        self.assertEqual(self.routes, ['default'])
+
+        state = db._RequestState(replica='replica1')
+        token = db._state.set(state)
+        try:
+            self.assertEqual(self.router.db_for_read(Session), 'default')
+        finally:
+            db._state.reset(token)
+
+    def test_outside_a_request_reads_primary(self):
+        self.assertEqual(self.router.db_for_read(Course), 'default')
@@ -0,0 +1,186 @@
+"""Chunked, resumable uploads of large course media.
+
+A client starts an upload with the file name, size and optional SHA-256,
+then sends the file in parts, each with the byte offset it starts at. Parts
+are streamed straight to a staging file, so memory per request is bounded
+by CHUNK_SIZE. After a dropped connection the client asks for the current
+offset and continues from there. Completing the upload verifies the size
+and checksum; the upload id can then be passed to views.upload or
+course_edit in place of a raw file. Uploads left unfinished or unused for
+CHUNKED_UPLOAD_EXPIRY_HOURS are removed by ``expire_uploads``, which the
+media worker runs.
+"""
+import hashlib
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ChunkedUpload, MediaJob
+
+CHUNK_SIZE = 5 * 1024 * 1024
+READ_SIZE = 64 * 1024
+# How long a request may take to stream one chunk before its claim lapses
+WRITE_LEASE = timedelta(minutes=10)
+
+
+class UploadError(Exception):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    def __init__(self, expected, message=None):
+        super().__init__(message or f'Expected chunk at offset {expected}')
+        self.expected = expected
+
+
+def start_upload(user, filename, total_size, sha256=''):
+    if total_size <= 0:
+        raise UploadError('File size must be positive')
+    if total_size > settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError('File is too large')
+    directory = os.path.join(settings.MEDIA_STAGING_DIR, 'chunked')
+    os.makedirs(directory, exist_ok=True)
+    upload = ChunkedUpload(
+        user=user, filename=os.path.basename(filename), total_size=total_size, sha256=sha256.lower()
+    )
+    upload.path = os.path.join(directory, f'{upload.upload_id.hex}{os.path.splitext(upload.filename)[1]}')
+    open(upload.path, 'wb').close()
+    upload.save()
+    return upload
+
+
+def append_chunk(upload, stream, offset, length):
+    """Append ``length`` bytes read from ``stream`` at ``offset``.
+
+    Resending a part that was already stored is answered with the current
+    offset instead of being written twice. Before writing, the request
+    claims the offset with a conditional UPDATE that sets a WRITE_LEASE on
+    the row, so a second request for the same offset is turned away
+    instead of writing to the staging file at the same time. The file is
+    written outside any transaction.
+    """
+    if length <= 0 or length > CHUNK_SIZE:
+        raise UploadError(f'Chunks must be between 1 and {CHUNK_SIZE} bytes')
+    if offset + length > upload.total_size:
+        raise UploadError('Chunk runs past the end of the file')
+
+    now = timezone.now()
+    lease = now + WRITE_LEASE
+    claimed = ChunkedUpload.objects.filter(
+        Q(leased_until__isnull=True) | Q(leased_until__lt=now),
+        pk=upload.pk, offset=offset, status=ChunkedUpload.STATUS_UPLOADING,
+    ).update(leased_until=lease)
+    if not claimed:
+        upload.refresh_from_db(fields=['offset', 'status', 'leased_until'])
+        if upload.status != ChunkedUpload.STATUS_UPLOADING:
+            raise UploadError('Upload is already complete')
+        if offset != upload.offset:
+            raise OffsetMismatch(upload.offset)
+        raise OffsetMismatch(upload.offset, 'Another request is writing this chunk')
+
+    ours = ChunkedUpload.objects.filter(pk=upload.pk, leased_until=lease)
+    written = 0
+    try:
+        with open(upload.path, 'r+b') as destination:
+            # Drop anything a previous, interrupted request left behind
+            destination.truncate(offset)
+            destination.seek(offset)
+            while written < length:
+                data = stream.read(min(READ_SIZE, length - written))
+                if not data:
+                    break
+                destination.write(data)
+                written += len(data)
+    finally:
+        if written != length:
+            ours.update(leased_until=None)
+    if written != length:
+        raise UploadError('Connection closed before the chunk was complete')
+
+    if not ours.update(offset=offset + written, leased_until=None, updated_at=timezone.now()):
+        raise UploadError('The chunk took too long to arrive, send it again')
+    upload.offset = offset + written
+    upload.leased_until = None
+    return upload.offset
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete_upload(upload):
+    if upload.status != ChunkedUpload.STATUS_UPLOADING:
+        return upload
+    if upload.offset != upload.total_size or os.path.getsize(upload.path) != upload.total_size:
+        raise UploadError('Upload is incomplete')
+    if upload.sha256 and file_sha256(upload.path) != upload.sha256:
+        raise UploadError('Checksum mismatch')
+    upload.status = ChunkedUpload.STATUS_COMPLETE
+    upload.save(update_fields=['status', 'updated_at'])
+    return upload
+
+
+def consume_upload(user, upload_id):
+    """Hand a completed upload's staged file over to the media pipeline"""
+    rows = ChunkedUpload.objects.filter(upload_id=upload_id, user=user)
+    # Conditional, so two requests cannot both hand over the same file
+    consumed = rows.filter(status=ChunkedUpload.STATUS_COMPLETE).update(
+        status=ChunkedUpload.STATUS_CONSUMED, updated_at=timezone.now()
+    )
+    if not consumed:
+        raise UploadError('Unknown or unfinished upload')
+    return rows.values_list('path', flat=True).get()
+
+
+def upload_status(upload):
+    return {
+        'upload_id': str(upload.upload_id),
+        'filename': upload.filename,
+        'offset': upload.offset,
+        'total_size': upload.total_size,
+        'status': upload.status,
+        'chunk_size': CHUNK_SIZE,
+    }
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def expire_uploads(hours=None):
+    """Delete uploads untouched for ``hours`` and their staged files.
+
+    Consumed uploads lose only their row, the media job owns the file by
+    then. Staged files that neither an upload nor an unfinished media job
+    points at (e.g. from a failed start_upload) are removed once they are
+    as old. Returns the number of rows deleted.
+    """
+    if hours is None:
+        hours = settings.CHUNKED_UPLOAD_EXPIRY_HOURS
+    cutoff = timezone.now() - timedelta(hours=hours)
+    expired = ChunkedUpload.objects.filter(updated_at__lt=cutoff)
+    for path in expired.exclude(status=ChunkedUpload.STATUS_CONSUMED).values_list('path', flat=True).iterator():
+        _remove(path)
+    deleted, _ = expired.delete()
+
+    directory = os.path.join(settings.MEDIA_STAGING_DIR, 'chunked')
+    if os.path.isdir(directory):
+        known = set(ChunkedUpload.objects.values_list('path', flat=True))
+        known.update(MediaJob.objects.exclude(status=MediaJob.STATUS_DONE).values_list('source_path', flat=True))
+        oldest = time.time() - hours * 3600
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.path not in known and entry.stat().st_mtime < oldest:
+                    _remove(entry.path)
+    return deleted
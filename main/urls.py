@@ -4,20 +4,36 @@ from main import views
 urlpatterns = [
     path('', views.index, name='home'),
     path('about/', views.about, name='about'),
+    path('metrics', views.metrics, name='metrics'),
     path('contact/', views.contact, name='contact'),
     path('courses/', views.courses, name='courses'),
+    path('api/courses/', views.catalog_json, name='catalog-json'),
+    path('search/', views.search_view, name='search'),
+    path('api/progress/', views.progress_batch, name='progress-batch'),
+    path('api/search/', views.search_json, name='search-json'),
     path('dashboard/home/', views.dashboard_home, name='dashboard-home'),
+    path('dashboard/analytics/', views.dashboard_analytics, name='dashboard-analytics'),
     path('dashboard/profile/', views.profile, name='profile'),
     path('dashboard/courses-enrolled/', views.courses_enrolled, name='courses-enrolled'),
     path('dashboard/courses-uploaded/', views.courses_uploaded, name='courses-uploaded'),
     path('dashboard/upload/', views.upload, name='upload'),
+    path('dashboard/uploads/', views.chunked_upload_start, name='chunked-upload-start'),
+    path('dashboard/uploads/<uuid:upload_id>/', views.chunked_upload, name='chunked-upload'),
+    path('dashboard/uploads/<uuid:upload_id>/complete/', views.chunked_upload_complete, name='chunked-upload-complete'),
     path('dashboard/<slug:slug>/course-edit/', views.course_edit, name='course-edit'),
     path('dashboard/<slug:slug>/delete/', views.delete_course, name='delete-course'),
+    path('dashboard/<slug:slug>/enrollments/', views.course_bulk_enroll, name='course-bulk-enroll'),
+    path('dashboard/<slug:slug>/upload-status/', views.upload_status, name='upload-status'),
     path('<str:instructor>/course/<slug:slug>/', views.course_details, name='course_details'),
+    path('<str:instructor>/course/<slug:slug>/overlay/', views.course_overlay, name='course_overlay'),
     path('<str:instructor>/course/<slug:slug>/curriculum/', views.course_curriculum, name='course_curriculum'),
     path('lesson/<int:lesson_id>/complete/', views.complete_lesson, name='complete_lesson'),
     path('course/<slug:course_slug>/lesson/<int:lesson_id>/', views.lesson_detail, name='lesson_detail'),
+    path('certificate/verify/<slug:certificate_id>/', views.certificate_verify, name='certificate_verify'),
     path('certificate/<str:certificate_id>/', views.certificate_view, name='certificate_view'),
+    path('certificate/<str:certificate_id>/pdf/', views.certificate_pdf, name='certificate_pdf'),
+    path('avatars/<int:version>/<str:seed>.svg', views.generated_avatar, name='generated_avatar'),
+    path('avatars/<str:name>', views.mirrored_avatar, name='mirrored_avatar'),
     path('<slug:slug>/lesson', views.lesson_details, name='lesson_detail_old'),  # Keep for backward compatibility
     path('courses/<str:category>/', views.category, name='category'),
 ]
@@ -0,0 +1,81 @@
+"""Signed-in users loaded from the cache instead of the database.
+
+``CachedAuthenticationMiddleware`` replaces Django's
+``AuthenticationMiddleware``. It resolves ``request.user`` like
+``django.contrib.auth.get_user`` does, including the session hash check
+that logs a user out after a password change. The only difference is that
+the user row is read through ``cached_user``. Together with the
+``cached_db`` session engine, an authenticated request needs no query
+before the view runs.
+
+A cached user is dropped whenever the user is saved or deleted (see
+``main.signals``). Since ``last_login`` is written on every sign-in, a fresh
+login always starts from the database. Bulk writes that skip the signals,
+such as ``User.objects.filter(...).update(is_active=False)``, must call
+``invalidate`` with the affected ids; otherwise a deactivated user stays
+signed in until USER_CACHE_TIMEOUT runs out.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+def _user_key(backend_path, user_id):
+    return f'user:{backend_path}:{user_id}'
+
+
+def _cache():
+    return caches[settings.USER_CACHE_ALIAS]
+
+
+def cached_user(backend_path, user_id):
+    """backend.get_user(user_id) from the cache; None if there is no such active user"""
+    key = _user_key(backend_path, user_id)
+    user = _cache().get(key)
+    if user is None:
+        user = auth.load_backend(backend_path).get_user(user_id)
+        if user is not None:
+            _cache().set(key, user, settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+def invalidate(*user_ids):
+    """Drop every cached copy of the given users"""
+    _cache().delete_many([
+        _user_key(backend_path, user_id)
+        for user_id in user_ids
+        for backend_path in settings.AUTHENTICATION_BACKENDS
+    ])
+
+
+def get_user(request):
+    """django.contrib.auth.get_user, with the user row read through the cache"""
+    try:
+        user_id = auth._get_user_session_key(request)
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    user = cached_user(backend_path, user_id)
+    if hasattr(user, 'get_session_auth_hash'):
+        session_hash = request.session.get(auth.HASH_SESSION_KEY)
+        if not (session_hash and constant_time_compare(session_hash, user.get_session_auth_hash())):
+            request.session.flush()
+            user = None
+    return user or AnonymousUser()
+
+
+def _request_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = get_user(request)
+    return request._cached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: _request_user(request))
@@ -1,29 +1,57 @@
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
+from asgiref.sync import sync_to_async
 
 from django.shortcuts import render, redirect
 
 from django.utils.text import slugify
-from .models import Course, Enrollment, Chapter, Lesson, LessonProgress, Certificate
+from .models import ActivityRollup, Category, Course, Enrollment, Chapter, Lesson, LessonProgress, Certificate, ChunkedUpload
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from .forms import CourseEditForm, ChapterForm, LessonForm
+from .curriculum import load_curriculum
+from .async_support import aget_object_or_404, aget_user, async_login_required
+from .db import replica_reads
+from .enrollments import bulk_enroll
+from .progress import ProgressError, complete_lesson as complete_lesson_progress, ingest as ingest_progress
+from .catalog import CatalogPage, CATALOG_CACHE_TIMEOUT
+from . import analytics, avatars, caching, certificates, course_pages, instrumentation, media, search, uploads
 from django.contrib import messages
-from django.http import JsonResponse
-from django.utils import timezone
-import pytz
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotModified, JsonResponse
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count
+from django.conf import settings
 import json
+import re
 
 # Create your views here.
 
+SEARCH_LIMIT = 50
+ENROLLMENTS_PER_PAGE = 25
+ANALYTICS_MAX_DAYS = 365
+BULK_ENROLL_LIMIT = 10000
+MIRRORED_AVATAR_RE = re.compile(r'^([0-9a-f]{32})\.(jpg|png|gif|webp)$')
+MIRRORED_AVATAR_TYPES = {extension: content_type for content_type, extension in avatars.IMAGE_TYPES.items()}
 
+
+@replica_reads
 def index(request):
-    courses = Course.objects.all()[:6]
+    courses = Course.objects.filter(status=Course.STATUS_READY).select_related('instructor__avatar')[:6]
     return render(request, 'index.html', {'courses': courses})
 
 
+
+def metrics(request):
+    """Prometheus scrape target; needs METRICS_TOKEN, an internal IP or a staff user"""
+    if settings.METRICS_TOKEN:
+        allowed = request.headers.get('Authorization') == f'Bearer {settings.METRICS_TOKEN}'
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS or request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    body = instrumentation.registry.exposition() + caching.exposition()
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def about(request):
     return render(request, 'about.html')
 
@@ -32,9 +60,22 @@ def contact(request):
     return render(request, 'contact.html')
 
 
+@replica_reads
 def courses(request):
-    courses = Course.objects.all()
-    return render(request, 'courses.html', {'courses': courses})
+    page = CatalogPage(cursor=request.GET.get('after'))
+    return render(request, 'courses.html', {'page': page})
+
+
+@replica_reads
+async def catalog_json(request):
+    page = CatalogPage(category=request.GET.get('category'), cursor=request.GET.get('after'))
+    key = f'catalog:json:{page.cache_key}'
+    data = await cache.aget(key)
+    if data is None:
+        await page.aload()
+        data = page.as_json()
+        await cache.aset(key, data, CATALOG_CACHE_TIMEOUT)
+    return JsonResponse(data)
 
 # def profile(request):
 #     user = request.user
@@ -57,38 +98,59 @@ def courses(request):
 #         return redirect('account_login')
 
 
+@login_required
 def dashboard_home(request):
     user = request.user
-    courses_uploaded = Course.objects.filter(instructor=user)
-    num_courses_uploaded = courses_uploaded.count()
-    courses_enrolled = Course.objects.filter(students=user)
-    num_courses_enrolled = courses_enrolled.count()
-    num_students = Enrollment.objects.filter(course__in=courses_uploaded).values('student').distinct().count()
+    num_courses_uploaded = Course.objects.filter(instructor=user).count()
+    num_courses_enrolled = Course.objects.filter(students=user).count()
     
-    instructor = request.user
-    courses = Course.objects.filter(instructor=instructor)
-
-    enrollments = []
-    ist_tz = pytz.timezone('Asia/Kolkata')
-
-    for course in courses:
-        course_enrollments = Enrollment.objects.filter(course=course)
-        for enrollment in course_enrollments:
-            student = enrollment.student
-            enrollment_date_ist = enrollment.enrolled_at.astimezone(ist_tz)
-            enrollment_date = enrollment_date_ist.strftime('%d %B %Y %H:%M:%S')
-            enrollments.append({'course_title': course.title, 'student_name': student.username, 'enrollment_date': enrollment_date})
+    instructor_enrollments = Enrollment.objects.filter(course__instructor=user)
+    num_students = instructor_enrollments.values('student').distinct().count()
+    
+    # Enrollment totals per course in one grouped query
+    course_enrollments = (
+        instructor_enrollments.values('course_id', 'course__title')
+        .annotate(total=Count('id'))
+        .order_by('-total', 'course__title')
+    )
+    
+    # Recent enrollments feed, joined with course and student
+    recent_enrollments = (
+        instructor_enrollments.select_related('course', 'student')
+        .only('enrolled_at', 'course__title', 'student__username')
+        .order_by('-enrolled_at', '-id')
+    )
+    enrollments = Paginator(recent_enrollments, ENROLLMENTS_PER_PAGE).get_page(request.GET.get('page'))
 
     context = {
-        'courses_uploaded': courses_uploaded,
         'num_courses_uploaded': num_courses_uploaded,
         'num_courses_enrolled': num_courses_enrolled,
         'num_students': num_students,
+        'course_enrollments': course_enrollments,
         'enrollments': enrollments,
+        'dashboard_time_zone': settings.DASHBOARD_TIME_ZONE,
     }
     return render(request, 'dashboard/home.html', context)
 
 
+@login_required
+def dashboard_analytics(request):
+    """Enrollment and completion chart series for the instructor's courses"""
+    granularity = request.GET.get('granularity', ActivityRollup.DAY)
+    if granularity not in (ActivityRollup.HOUR, ActivityRollup.DAY):
+        return JsonResponse({'success': False, 'error': 'Invalid granularity'}, status=400)
+    try:
+        days = min(max(int(request.GET.get('days', 30)), 1), ANALYTICS_MAX_DAYS)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid number of days'}, status=400)
+
+    course = None
+    if request.GET.get('course'):
+        course = get_object_or_404(Course, slug=request.GET['course'], instructor=request.user)
+    return JsonResponse(analytics.series(request.user, granularity=granularity, days=days, course=course))
+
+
+@login_required
 def profile(request):
     user = request.user
     email = user.email
@@ -97,17 +159,19 @@ def profile(request):
     return render(request, 'dashboard/profile.html', {'email': email, 'full_name': full_name, 'username': username})
 
 
+@login_required
 def courses_enrolled(request):
     user = request.user
-    courses = Course.objects.filter(students=user)
+    courses = Course.objects.filter(students=user).select_related('instructor__avatar')
     context = {
         'courses': courses
     }
     return render(request, 'dashboard/courses-enrolled.html', context)
 
 
+@login_required
 def courses_uploaded(request):
-    courses = Course.objects.filter(instructor=request.user)
+    courses = Course.objects.filter(instructor=request.user).select_related('instructor__avatar')
     return render(request, 'dashboard/courses-uploaded.html', {'courses': courses})
 
 @login_required
@@ -117,27 +181,22 @@ def upload(request):
             # Get form data
             title = request.POST.get('title')
             description = request.POST.get('description')
-            thumbnail = request.FILES.get('thumbnail')
-            featured_video = request.FILES.get('featured_video')
+            thumbnail_upload_id = request.POST.get('thumbnail_upload_id')
+            featured_video_upload_id = request.POST.get('featured_video_upload_id')
             
             # Validate required files
-            if not all([thumbnail, featured_video]):
+            if not all([thumbnail_upload_id, featured_video_upload_id]):
                 messages.error(request, "Thumbnail and featured video are required")
                 return redirect('upload')
             
-            # Upload files to Cloudinary
-            thumbnail_upload = cloudinary.uploader.upload(thumbnail)
-            featured_video_upload = cloudinary.uploader.upload(
-                featured_video, 
-                resource_type="video"
-            )
+            # Take over the staged chunked uploads; the media worker pushes them to Cloudinary
+            thumbnail_path = uploads.consume_upload(request.user, thumbnail_upload_id)
+            featured_video_path = uploads.consume_upload(request.user, featured_video_upload_id)
             
             # Create course
             course = Course(
                 title=title,
                 description=description,
-                thumbnail=thumbnail_upload['secure_url'],
-                featured_video=featured_video_upload['secure_url'],
                 instructor=request.user,
                 category=request.POST.get('category', 'uncategorized'),
                 level=request.POST.get('level', 'Beginner'),
@@ -145,19 +204,90 @@ def upload(request):
                 content=request.POST.get('content', ''),
                 price=request.POST.get('price', 0),
                 discount=request.POST.get('discount', 0),
+                status=Course.STATUS_PROCESSING,
             )
             course.save()
+            media.queue_upload(course, 'thumbnail', thumbnail_path, resource_type='image')
+            media.queue_upload(course, 'featured_video', featured_video_path, resource_type='video')
             
-            messages.success(request, "Course uploaded successfully!")
-            return redirect('dashboard')  # Redirect to success page
+            messages.success(request, "Course created! Your media is being processed.")
+            return redirect('courses-uploaded')
             
-        except cloudinary.exceptions.Error as e:
-            messages.error(request, f"Cloudinary upload failed: {e}")
         except Exception as e:
             messages.error(request, f"An error occurred: {e}")
         
     return render(request, 'dashboard/upload.html')
 
+
+@login_required
+def upload_status(request, slug):
+    course = get_object_or_404(Course, slug=slug, instructor=request.user)
+    return JsonResponse(media.job_status(course))
+
+@login_required
+def course_bulk_enroll(request, slug):
+    """Enroll a cohort, given as {"users": [username or email, ...]}, in one transaction"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+    course = get_object_or_404(Course, slug=slug, instructor=request.user)
+    try:
+        users = json.loads(request.body or '{}').get('users')
+    except (ValueError, AttributeError):
+        users = None
+    if not isinstance(users, list) or not all(isinstance(value, str) for value in users):
+        return JsonResponse({'success': False, 'error': 'Expected a list of usernames or emails'}, status=400)
+    if len(users) > BULK_ENROLL_LIMIT:
+        return JsonResponse({'success': False, 'error': f'At most {BULK_ENROLL_LIMIT} users per request'}, status=400)
+    return JsonResponse({'success': True, **bulk_enroll(course, users)})
+
+@login_required
+def chunked_upload_start(request):
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+    try:
+        data = json.loads(request.body or '{}')
+        upload = uploads.start_upload(
+            request.user,
+            filename=str(data.get('filename', '')),
+            total_size=int(data.get('size', 0)),
+            sha256=str(data.get('sha256', '')),
+        )
+    except (ValueError, uploads.UploadError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, **uploads.upload_status(upload)}, status=201)
+
+
+@login_required
+def chunked_upload(request, upload_id):
+    upload = get_object_or_404(ChunkedUpload, upload_id=upload_id, user=request.user)
+    if request.method == 'GET':
+        return JsonResponse({'success': True, **uploads.upload_status(upload)})
+    if request.method != 'PUT':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+
+    try:
+        offset = int(request.headers.get('X-Upload-Offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        # Read the raw body as a stream; request.body would buffer the chunk
+        uploads.append_chunk(upload, request, offset, length)
+    except uploads.OffsetMismatch as e:
+        return JsonResponse({'success': False, 'error': str(e), 'offset': e.expected}, status=409)
+    except (ValueError, uploads.UploadError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, **uploads.upload_status(upload)})
+
+
+@login_required
+def chunked_upload_complete(request, upload_id):
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+    upload = get_object_or_404(ChunkedUpload, upload_id=upload_id, user=request.user)
+    try:
+        uploads.complete_upload(upload)
+    except uploads.UploadError as e:
+        return JsonResponse({'success': False, 'error': str(e), **uploads.upload_status(upload)}, status=400)
+    return JsonResponse({'success': True, **uploads.upload_status(upload)})
+
 # def course_details(request, instructor, slug):
 #     instructor_obj = get_object_or_404(User, username=instructor)
 #     course = get_object_or_404(Course, slug=slug, instructor=instructor_obj)
@@ -166,51 +296,61 @@ def upload(request):
 #     }
 #     return render(request, 'course.html', context)
 
+@replica_reads
 def course_details(request, instructor, slug):
-    instructor_obj = get_object_or_404(User, username=instructor)
-    course = get_object_or_404(Course, slug=slug, instructor=instructor_obj)
-    category_courses = Course.objects.filter(category__iexact=course.category).exclude(id=course.id)[:3]
-    
-    # Get course chapters and lessons for preview
-    chapters = Chapter.objects.filter(course=course).prefetch_related('lessons')[:3]  # Show first 3 chapters as preview
-    total_lessons = course.get_total_lessons()
+    # Anonymous visitors all see the same page; serve it straight from the cache
+    cacheable = request.method == 'GET' and not request.user.is_authenticated and not messages.get_messages(request)
+    if cacheable:
+        html = course_pages.get_page(instructor, slug)
+        if html is not None:
+            return HttpResponse(html)
+
+    course = get_object_or_404(
+        Course.objects.select_related('instructor__avatar'),
+        slug=slug, instructor__username=instructor,
+    )
 
-    enrolled = False
-    progress_percentage = 0
-    has_certificate = False
-    
-    if request.user.is_authenticated:
-        enrolled = course.students.filter(id=request.user.id).exists()
-        if enrolled:
-            progress_percentage = course.get_progress_percentage(request.user)
-            has_certificate = Certificate.objects.filter(user=request.user, course=course).exists()
-
-    if request.method == 'POST' and not enrolled and request.user.is_authenticated:
-        user = request.user
-        course.students.add(user)
-        enrollment = Enrollment(student=user, course=course)
-        enrollment.save()
-        messages.success(request, 'You have enrolled in this course!')
+    if request.method == 'POST' and request.user.is_authenticated:
+        if Enrollment.objects.enroll(course, request.user):
+            messages.success(request, 'You have enrolled in this course!')
         return redirect('course_details', instructor=instructor, slug=slug)
 
-    context = {
-        'course': course,
-        'enrolled': enrolled,
-        'category_courses': category_courses,
-        'chapters': chapters,
-        'total_lessons': total_lessons,
-        'progress_percentage': progress_percentage,
-        'has_certificate': has_certificate,
-    }
-    return render(request, 'course.html', context)
+    response = render(request, 'course.html', course_pages.public_context(course))
+    if cacheable:
+        course_pages.store_page(instructor, slug, course.id, response.content.decode())
+    return response
+
+
+@replica_reads
+async def course_overlay(request, instructor, slug):
+    """Enrollment, progress and certificate state layered over the cached page"""
+    course = await aget_object_or_404(Course.objects.only('id'), slug=slug, instructor__username=instructor)
+    user = await aget_user(request)
+    response = JsonResponse(await course_pages.overlay(user, course))
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 @login_required
 def course_edit(request, slug):
     course = get_object_or_404(Course, slug=slug, instructor=request.user)
     if request.method == 'POST':
-        form = CourseEditForm(request.POST, request.FILES, instance=course)
+        form = CourseEditForm(request.POST, instance=course)
         if form.is_valid():
-            form.save()
+            try:
+                staged = [
+                    (field, resource_type, uploads.consume_upload(request.user, form.cleaned_data[f'{field}_upload_id']))
+                    for field, resource_type in (('thumbnail', 'image'), ('featured_video', 'video'))
+                    if form.cleaned_data[f'{field}_upload_id']
+                ]
+            except uploads.UploadError as e:
+                form.add_error(None, str(e))
+            else:
+                course = form.save(commit=False)
+                if staged:
+                    course.status = Course.STATUS_PROCESSING
+                course.save()
+                for field, resource_type, path in staged:
+                    media.queue_upload(course, field, path, resource_type=resource_type)
     else:
         form = CourseEditForm(instance=course)
     return render(request, 'dashboard/course-edit.html', {'form': form, 'course': course})
@@ -226,22 +366,77 @@ def delete_course(request, slug):
     }
     return render(request, 'dashboard/course-edit.html', context)
 
+def _search_results(query, limit=SEARCH_LIMIT):
+    """Run a search and load the matching READY courses and lessons in two queries"""
+    courses, lessons = {}, {}
+
+    def load(hits):
+        # The status check rides on the queries that load the rows
+        courses.update(Course.objects.filter(status=Course.STATUS_READY).select_related('instructor').in_bulk(
+            [hit.object_id for hit in hits if hit.kind == search.COURSE]
+        ))
+        lessons.update(Lesson.objects.filter(chapter__course__status=Course.STATUS_READY).select_related(
+            'chapter__course__instructor'
+        ).in_bulk([hit.object_id for hit in hits if hit.kind == search.LESSON]))
+        return [hit for hit in hits if hit.object_id in (courses if hit.kind == search.COURSE else lessons)]
+
+    hits = search.search_published(query, limit=limit, keep=load)
+    return (
+        [courses[hit.object_id] for hit in hits if hit.kind == search.COURSE],
+        [lessons[hit.object_id] for hit in hits if hit.kind == search.LESSON],
+    )
+
+
+@replica_reads
+def search_view(request):
+    query = request.GET.get('q', '').strip()
+    courses, lessons = _search_results(query) if query else ([], [])
+    context = {
+        'query': query,
+        'courses': courses,
+        'lessons': lessons,
+    }
+    return render(request, 'search.html', context)
+
+
+@replica_reads
+def search_json(request):
+    query = request.GET.get('q', '').strip()
+    hits = search.search_published(query, limit=SEARCH_LIMIT) if query else []
+    return JsonResponse({
+        'query': query,
+        'results': [
+            {
+                'type': hit.kind,
+                'id': hit.object_id,
+                'course_id': hit.course_id,
+                'title': hit.title,
+                'score': round(hit.score, 4),
+            }
+            for hit in hits
+        ],
+    })
+
+
+@replica_reads
 def category(request, category):
-    courses = Course.objects.filter(category__iexact=category)
+    page = CatalogPage(category=category, cursor=request.GET.get('after'))
+    category_obj = Category.objects.filter(slug=slugify(category)).first()
     context = {
-        'category': category,
-        'courses': courses
+        'category': category_obj.name if category_obj else category,
+        'course_count': category_obj.course_count if category_obj else 0,
+        'page': page,
     }
     return render(request, 'category.html', context)
 
 
 @login_required
 def lesson_detail(request, course_slug, lesson_id):
-    course = get_object_or_404(Course, slug=course_slug)
-    lesson = get_object_or_404(Lesson, id=lesson_id, chapter__course=course)
+    course = get_object_or_404(Course.objects.select_related('instructor'), slug=course_slug)
+    lesson = get_object_or_404(Lesson.objects.select_related('chapter'), id=lesson_id, chapter__course=course)
     
     # Check if user is enrolled in the course
-    if not course.students.filter(id=request.user.id).exists():
+    if not Enrollment.objects.is_enrolled(course, request.user):
         messages.error(request, 'You must be enrolled in this course to view lessons.')
         return redirect('course_details', instructor=course.instructor.username, slug=course.slug)
     
@@ -253,96 +448,152 @@ def lesson_detail(request, course_slug, lesson_id):
     )
     
     # Get all lessons in the course for navigation
-    chapters = Chapter.objects.filter(course=course).prefetch_related('lessons')
+    curriculum = load_curriculum(course, request.user)
     
     context = {
         'course': course,
         'lesson': lesson,
         'progress': progress,
-        'chapters': chapters,
-        'next_lesson': lesson.get_next_lesson(),
-        'previous_lesson': lesson.get_previous_lesson(),
+        'chapters': curriculum.chapters,
+        'progress_percentage': course.get_progress_percentage(request.user),
+        'next_lesson': curriculum.next_lesson(lesson),
+        'previous_lesson': curriculum.previous_lesson(lesson),
+        'lesson_number': curriculum.position_of(lesson),
+        'total_lessons': curriculum.total_lessons,
     }
     return render(request, 'lesson_detail.html', context)
 
-@login_required
-def complete_lesson(request, lesson_id):
+@async_login_required
+async def complete_lesson(request, lesson_id):
     if request.method == 'POST':
-        lesson = get_object_or_404(Lesson, id=lesson_id)
+        lesson = await aget_object_or_404(Lesson.objects.select_related('chapter'), id=lesson_id)
         
         # Check if user is enrolled in the course
-        if not lesson.chapter.course.students.filter(id=request.user.id).exists():
+        if not await Enrollment.objects.ais_enrolled(lesson.chapter.course_id, request.user):
             return JsonResponse({'success': False, 'error': 'Not enrolled in course'})
         
-        # Mark lesson as completed
-        progress, created = LessonProgress.objects.get_or_create(
-            user=request.user,
-            lesson=lesson,
-            defaults={'completed': True, 'completed_at': timezone.now()}
-        )
-        
-        if not progress.completed:
-            progress.completed = True
-            progress.completed_at = timezone.now()
-            progress.save()
-        
-        # Check if course is completed
-        course = lesson.chapter.course
-        if course.is_completed_by_user(request.user):
-            # Generate certificate if not already exists
-            certificate, cert_created = Certificate.objects.get_or_create(
-                user=request.user,
-                course=course
-            )
-            return JsonResponse({
-                'success': True, 
-                'course_completed': True,
-                'certificate_id': certificate.certificate_id
-            })
-        
-        return JsonResponse({'success': True, 'course_completed': False})
+        # Saves through the model signals, which are sync only
+        result = await sync_to_async(complete_lesson_progress)(request.user, lesson)
+        return JsonResponse({'success': True, **result})
     
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
+@async_login_required
+async def progress_batch(request):
+    """Apply many buffered lesson completions in one request"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+    try:
+        events = json.loads(request.body or '{}').get('events')
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON body'}, status=400)
+    try:
+        # One transaction, which Django only offers to sync code
+        result = await sync_to_async(ingest_progress)(request.user, events)
+    except ProgressError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, **result})
+
+@replica_reads
 @login_required
 def course_curriculum(request, instructor, slug):
-    instructor_obj = get_object_or_404(User, username=instructor)
-    course = get_object_or_404(Course, slug=slug, instructor=instructor_obj)
+    course = get_object_or_404(
+        Course.objects.select_related('instructor'), slug=slug, instructor__username=instructor
+    )
     
     # Check if user is enrolled
-    if not course.students.filter(id=request.user.id).exists():
+    if not Enrollment.objects.is_enrolled(course, request.user):
         messages.error(request, 'You must be enrolled in this course to view the curriculum.')
         return redirect('course_details', instructor=instructor, slug=slug)
     
-    chapters = Chapter.objects.filter(course=course).prefetch_related('lessons')
-    
-    # Get user's progress
-    user_progress = {}
-    for chapter in chapters:
-        for lesson in chapter.lessons.all():
-            progress = LessonProgress.objects.filter(
-                user=request.user, lesson=lesson
-            ).first()
-            user_progress[lesson.id] = progress.completed if progress else False
+    curriculum = load_curriculum(course, request.user)
     
     context = {
         'course': course,
-        'chapters': chapters,
-        'user_progress': user_progress,
+        'chapters': curriculum.chapters,
+        'first_lesson': curriculum.first_lesson,
+        'resume_lesson': curriculum.resume_lesson,
+        'user_progress': json.dumps(curriculum.progress_map()),
         'progress_percentage': course.get_progress_percentage(request.user),
     }
     return render(request, 'course_curriculum.html', context)
 
+def _artifact_response(request, certificate, kind):
+    """Serve a pre-rendered certificate file.
+
+    The URL stays the same when a certificate is reissued, so browsers
+    revalidate every time; an unchanged file costs a 304 and no disk read.
+    """
+    etag = f'"{certificate.artifact_etag}-{kind}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        path = certificates.artifact_path(certificate.certificate_id, kind)
+        response = FileResponse(open(path, 'rb'), content_type=certificates.ARTIFACT_TYPES[kind])
+        if kind == 'pdf':
+            response['Content-Disposition'] = f'inline; filename="{certificate.certificate_id}.pdf"'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@replica_reads
 @login_required
 def certificate_view(request, certificate_id):
-    certificate = get_object_or_404(Certificate, certificate_id=certificate_id, user=request.user)
-    
-    context = {
-        'certificate': certificate,
-        'course': certificate.course,
-        'user': request.user,
-    }
-    return render(request, 'certificate.html', context)
+    certificate = get_object_or_404(
+        Certificate.objects.select_related('user', 'course__instructor'),
+        certificate_id=certificate_id, user=request.user,
+    )
+    return _artifact_response(request, certificates.ensure_rendered(certificate), 'html')
+
+
+@replica_reads
+@login_required
+def certificate_pdf(request, certificate_id):
+    certificate = get_object_or_404(
+        Certificate.objects.select_related('user', 'course__instructor'),
+        certificate_id=certificate_id, user=request.user,
+    )
+    return _artifact_response(request, certificates.ensure_rendered(certificate), 'pdf')
+
+
+@replica_reads
+def certificate_verify(request, certificate_id):
+    """Public check that a certificate id is genuine, answered from the cache"""
+    result = certificates.verification(certificate_id)
+    if result is None:
+        return JsonResponse({'valid': False, 'certificate_id': certificate_id}, status=404)
+    response = JsonResponse(result)
+    response['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+
+def generated_avatar(request, version, seed):
+    """Deterministic SVG avatar; the URL names the style, so it never changes"""
+    if version != avatars.STYLE_VERSION:
+        return redirect('generated_avatar', version=avatars.STYLE_VERSION, seed=seed)
+    response = HttpResponse(avatars.generated_svg(seed), content_type='image/svg+xml')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+def mirrored_avatar(request, name):
+    """A mirrored social picture; the file name is a hash of its content"""
+    match = MIRRORED_AVATAR_RE.match(name)
+    if match is None:
+        raise Http404('Unknown avatar')
+    etag = f'"{match.group(1)}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        try:
+            source = open(avatars.mirrored_path(name), 'rb')
+        except FileNotFoundError:
+            raise Http404('Unknown avatar')
+        response = FileResponse(source, content_type=MIRRORED_AVATAR_TYPES[match.group(2)])
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 def lesson_details(request, slug):
     # Redirect to course curriculum instead
@@ -13,9 +13,6 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
 
 # Load environment variables
 load_dotenv()
@@ -64,19 +61,20 @@ INSTALLED_APPS = [
     'allauth.account',
     'allauth.socialaccount',
     'allauth.socialaccount.providers.google',
-    'cloudinary',
     
     # Local apps
     'main',
 ]
 
 MIDDLEWARE = [
+    'main.instrumentation.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'main.async_support.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.users.CachedAuthenticationMiddleware',
+    'main.db.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,7 +83,8 @@ ROOT_URLCONF = 'skillmate.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render timing for main.instrumentation
+        'BACKEND': 'main.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -101,6 +100,27 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'skillmate.wsgi.application'
 
+# Request metrics, see main.instrumentation; /metrics is open to
+# INTERNAL_IPS and staff, or to anyone sending METRICS_TOKEN as a bearer token
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 1.0 if DEBUG else 0.05))
+N_PLUS_ONE_THRESHOLD = 5
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+INTERNAL_IPS = ['127.0.0.1']
+
+# Query and latency budgets checked by the benchmark_views command
+BENCHMARK_BUDGETS = BASE_DIR / 'main' / 'benchmark_budgets.json'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'main.metrics': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
@@ -109,9 +129,73 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open between requests and ping them before reuse.
+        # That only pays off under WSGI. Under ASGI every request runs its
+        # sync code in a new thread with its own connection, so a kept
+        # connection is never reused and stays open until it expires. The
+        # Procfile's uvicorn workers therefore set DB_CONN_MAX_AGE=0; put a
+        # pooler such as PgBouncer in front to reuse connections there
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        # Seconds a writer waits on a locked SQLite file before giving up
+        'OPTIONS': {'timeout': 20},
     }
 }
 
+# Read replicas, as comma-separated SQLite paths standing in for real
+# replicas locally; see main.db for the routing rules
+for index, path in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(','))):
+    DATABASES[f'replica{index + 1}'] = {
+        **DATABASES['default'],
+        'NAME': path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['main.db.PrimaryReplicaRouter']
+# How long a client reads from the primary after writing
+REPLICA_STICKY_SECONDS = 5
+REPLICA_HEALTH_INTERVAL = 30
+
+
+# Full-text search, see main.search. Unset, SQLite uses an FTS5 table and
+# PostgreSQL a GIN-indexed tsvector table; any other database falls back to
+# 'database', which scans the course and lesson tables with icontains on
+# every search
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or None
+
+
+# Cache
+# An in-process LRU in front of a cache shared by all workers, see
+# main.caching. The shared tier defaults to files under BASE_DIR/cache;
+# set SHARED_CACHE_BACKEND and SHARED_CACHE_LOCATION for Redis or Memcached
+
+SHARED_CACHE_BACKEND = os.environ.get('SHARED_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache')
+CACHES = {
+    'default': {
+        'BACKEND': 'main.caching.TieredCache',
+        'LOCATION': 'default',
+        'OPTIONS': {'SHARED': 'shared', 'LOCAL_TIMEOUT': 5, 'LOCAL_MAX_ENTRIES': 2000},
+    },
+    'shared': {
+        'BACKEND': SHARED_CACHE_BACKEND,
+        'LOCATION': os.environ.get('SHARED_CACHE_LOCATION', str(BASE_DIR / 'cache')),
+    },
+}
+if SHARED_CACHE_BACKEND.endswith('FileBasedCache'):
+    CACHES['shared']['OPTIONS'] = {'MAX_ENTRIES': 20000}
+
+# Sessions are read from the shared cache and written through to the
+# database; they skip the local tier so a logout is seen by every worker
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'shared'
+# Signed-in users, see main.users. Saves and deletes drop the cached copy,
+# but bulk QuerySet.update() calls on users skip the signals and must call
+# main.users.invalidate themselves; the timeout bounds how long a missed
+# invalidation (e.g. a deactivated account) keeps working
+USER_CACHE_ALIAS = 'default'
+USER_CACHE_TIMEOUT = 5 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -139,6 +223,9 @@ LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
 
+# Time zone the instructor dashboard renders timestamps in
+DASHBOARD_TIME_ZONE = 'Asia/Kolkata'
+
 USE_I18N = True
 
 USE_TZ = True
@@ -153,8 +240,31 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
-# Whitenoise configuration for static files
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Uploaded media: files are staged here before the media worker pushes them
+# to MEDIA_UPLOADER (see main.media)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_STAGING_DIR = MEDIA_ROOT / 'staging'
+MEDIA_UPLOADER = os.environ.get('MEDIA_UPLOADER', 'main.media.CloudinaryUploader')
+# Tries per media job before it fails for good and its staged file is removed
+MEDIA_JOB_MAX_ATTEMPTS = 3
+CHUNKED_UPLOAD_MAX_SIZE = 5 * 1024 ** 3
+# Unfinished or unused chunked uploads are swept by run_media_worker after this
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24
+
+# Optional lesson video metadata lookups, see main.lesson_media
+VIDEO_METADATA_PROVIDER = os.environ.get('VIDEO_METADATA_PROVIDER', 'main.lesson_media.NullProvider')
+YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY', '')
+
+# Pre-rendered certificate HTML/PDF, written by the render_certificates worker
+CERTIFICATE_ROOT = MEDIA_ROOT / 'certificates'
+
+# Social account pictures mirrored by the mirror_avatars worker
+AVATAR_ROOT = MEDIA_ROOT / 'avatars'
+
+# Whitenoise configuration for static files, plus responsive copies of
+# large images, see main.images
+STATICFILES_STORAGE = 'main.images.StaticDerivativesStorage'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -180,13 +290,13 @@ ACCOUNT_USERNAME_REQUIRED = False
 # Email settings (for development)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
-# Cloudinary settings
-cloudinary.config(
-    cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME', 'demo'),
-    api_key=os.environ.get('CLOUDINARY_API_KEY', 'demo'),
-    api_secret=os.environ.get('CLOUDINARY_API_SECRET', 'demo'),
-    secure=True
-)
+# Cloudinary settings, applied when main.media_backend first loads the SDK
+CLOUDINARY = {
+    'cloud_name': os.environ.get('CLOUDINARY_CLOUD_NAME', 'demo'),
+    'api_key': os.environ.get('CLOUDINARY_API_KEY', 'demo'),
+    'api_secret': os.environ.get('CLOUDINARY_API_SECRET', 'demo'),
+    'secure': True,
+}
 
 # Security settings for development
 X_FRAME_OPTIONS = 'ALLOWALL'
@@ -0,0 +1,110 @@
+
+// ------------------ Chunked media uploads ------------------
+// Sends every file input marked with data-upload-field to the chunked upload
+// endpoints in parts, then submits the form with the finished upload ids in
+// the matching <field>_upload_id inputs instead of the raw files.
+
+const CHUNK_RETRIES = 5;
+const CHECKSUM_MAX_SIZE = 256 * 1024 * 1024;
+
+function csrfToken(form) {
+    return form.querySelector('[name=csrfmiddlewaretoken]').value;
+}
+
+async function sha256Hex(file) {
+    // SubtleCrypto cannot hash a stream, so very large files skip the checksum
+    if (!window.crypto || !crypto.subtle || file.size > CHECKSUM_MAX_SIZE) {
+        return '';
+    }
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function jsonRequest(url, options) {
+    const response = await fetch(url, options);
+    const data = await response.json();
+    return { response, data };
+}
+
+async function uploadFile(form, file, onProgress) {
+    const baseUrl = form.dataset.chunkedUpload;
+    const token = csrfToken(form);
+    const start = await jsonRequest(baseUrl, {
+        method: 'POST',
+        headers: { 'X-CSRFToken': token, 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size, sha256: await sha256Hex(file) }),
+    });
+    if (!start.data.success) {
+        throw new Error(start.data.error);
+    }
+
+    const uploadUrl = `${baseUrl}${start.data.upload_id}/`;
+    const chunkSize = start.data.chunk_size;
+    let offset = 0;
+    let failures = 0;
+
+    while (offset < file.size) {
+        try {
+            const chunk = file.slice(offset, offset + chunkSize);
+            const result = await jsonRequest(uploadUrl, {
+                method: 'PUT',
+                headers: { 'X-CSRFToken': token, 'X-Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream' },
+                body: chunk,
+            });
+            if (result.response.status === 409 || result.data.success) {
+                // On a mismatch the server tells us where to resume from
+                offset = result.data.offset;
+                failures = 0;
+                onProgress(offset / file.size);
+            } else {
+                throw new Error(result.data.error);
+            }
+        } catch (error) {
+            failures += 1;
+            if (failures > CHUNK_RETRIES) {
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+            const status = await jsonRequest(uploadUrl, { method: 'GET' });
+            offset = status.data.offset;
+        }
+    }
+
+    const done = await jsonRequest(`${uploadUrl}complete/`, {
+        method: 'POST',
+        headers: { 'X-CSRFToken': token },
+    });
+    if (!done.data.success) {
+        throw new Error(done.data.error);
+    }
+    return start.data.upload_id;
+}
+
+document.querySelectorAll('form[data-chunked-upload]').forEach(form => {
+    form.addEventListener('submit', async event => {
+        event.preventDefault();
+        const button = form.querySelector('[type=submit]');
+        const label = button.textContent;
+        button.disabled = true;
+
+        try {
+            for (const input of form.querySelectorAll('input[type=file][data-upload-field]')) {
+                if (!input.files.length) {
+                    continue;
+                }
+                const field = input.dataset.uploadField;
+                const uploadId = await uploadFile(form, input.files[0], fraction => {
+                    button.textContent = `Uploading ${field.replace('_', ' ')}: ${Math.round(fraction * 100)}%`;
+                });
+                form.querySelector(`[name=${field}_upload_id]`).value = uploadId;
+            }
+            // Raw files must not be posted again with the form
+            form.querySelectorAll('input[type=file]').forEach(input => input.removeAttribute('name'));
+            form.submit();
+        } catch (error) {
+            alert('Upload failed: ' + error.message);
+            button.disabled = false;
+            button.textContent = label;
+        }
+    });
+});